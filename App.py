@@ -1,16 +1,18 @@
-# discriminare tra streamdeck e qualsiasi USB-SERIAL CH340 (trovare un modo) -> per esempio dopo il segnale di start si può inviare un pacchetto che descrive il device
+# (SOLVED) discriminare tra streamdeck e qualsiasi USB-SERIAL CH340 (trovare un modo) -> per esempio dopo il segnale di start si può inviare un pacchetto che descrive il device
 # (SOLVED) gestire le perdite improvvise di connessione seriale o obsws
 
-import serial.tools.list_ports
 import threading
 import time
 import PotentiometerWidget
+import RenderBridge
 import logging
 from logging.handlers import RotatingFileHandler
 import tkinter as tk
 import customtkinter
 import json
 import StreamDeckController
+import AsyncStreamDeckController
+import discovery
 
 
 class Logger:
@@ -71,11 +73,54 @@ class DataClass:
                 },
                 'serial_data': {
                     'com_port': None,
-                    'baud_rate': None
+                    'baud_rate': None,
+                    'protocol': 'binary'
                 }
             },
             'online': {
 
+            },
+            'controller': {
+                'engine': 'thread',
+                'queue_size': 256,
+                'queue_put_timeout': 1.0,
+                'volume_max_rate': 20,
+                'catalog_ttl': 5.0,
+                'script_workers': 2,
+                'script_repress': {'default': 'restart'},
+                'script_max_queued': 8,
+                'typing_interval': 0.0,
+                'latency_log_interval': 0,
+                'ack_timeout': 1.0,
+                'ack_retries': 2,
+                'fader_curve': 'log',
+                'fader_profiles': {},
+                'pot_filter': {'default': {'type': 'one_euro', 'band': 3, 'settle_time': 0.3, 'settle_band': 24}},
+                'trace_file': None,
+                'ready_timeout': 3.0,
+                'fair_dispatch': True,
+                'obs_window': 8,
+                'priority': {'classes': ['transport', 'scene', 'script', 'volume'],
+                             'commands': {'StartRecord': 'transport', 'StopRecord': 'transport', 'StartStream': 'transport',
+                                          'StopStream': 'transport', 'ChangeScene': 'scene', 'ExecuteScript': 'script',
+                                          'SetInputVolume': 'volume'},
+                             'max_wait': {'script': 0.2, 'volume': 0.1}},
+                'reconnect': {'enabled': True, 'initial_delay': 0.5, 'max_delay': 10.0, 'policy': 'buffer',
+                              'buffer_size': 64}
+            },
+            'gui': {
+                'fps': 30,
+                'refresh_interval': 1.0
+            },
+            'decks': {
+
+            },
+            'discovery': {
+                'scan_interval': 1.0,
+                'probe': True,
+                'probe_timeout': 3.0,
+                'usb_ids': ['1a86:7523'],
+                'extra_ports': []
             },
             'script': {
 
@@ -107,6 +152,11 @@ class DataClass:
                 settings = json.load(file)
                 self.settings = settings
                 self.app.logger.debug("settings.json load ok")
+            serial_data = self.settings.get('connection', {}).get('serial_data', {})
+            if str(serial_data.get('baud_rate')) == "9600":
+                # settings from the 9600 baud firmware: the deck now always talks at 115200
+                serial_data['baud_rate'] = "115200"
+                self.app.logger.debug("settings.json baud_rate 9600 -> 115200")
         except FileNotFoundError:
             self.save_settings()
             self.app.logger.debug("settings.json creation ok")
@@ -246,7 +296,7 @@ class ConnectionPage(BasePage):
         print(event)
         device = self.comboboxes["streamdeck"].get()
         device_port = device.split("(")[1][:-1]
-        device_baud_rate = "9600"
+        device_baud_rate = "115200"
         self.entries["com_port"].configure(state="normal")
         self.entries["baud_rate"].configure(state="normal")
         self.entries["com_port"].delete(0, tk.END)
@@ -355,7 +405,7 @@ class OnlinePage(BasePage):
         threading.Thread(target=self.sd_state_button_task, daemon=True).start()
 
     def sd_state_button_task(self):
-        state = self.buttons["sd_state"].cget("text")
+        state = self.parent.render.get(self.buttons["sd_state"], "text")
         if state == "Connect":
             self.parent.sdc_init_routine()
             self.parent.init_online_page_widgets()
@@ -513,10 +563,16 @@ class Application(customtkinter.CTk):
         self.list = {"scene": [],
                      "script": [],
                      "volume": []}
+        self.catalog_version = None
+        self.discovery_version = None
+        self.links_up = {}
         # class objects
         self.logger = None
         self.settings = None
         self.sdc = None
+        self.render = None
+        # task_app_mainloop sleeps until a page change, an OBS event, a link change or a user input sets it
+        self.mainloop_wake = threading.Event()
         # init application
         self.init()
 
@@ -524,7 +580,9 @@ class Application(customtkinter.CTk):
         self.init_logger()
         self.init_graphic()
         self.init_data()
+        self.init_render_bridge()
         self.init_sdc()
+        self.init_discovery()
         self.init_app_mainloop()
 
     def init_graphic(self):
@@ -538,8 +596,39 @@ class Application(customtkinter.CTk):
         self.settings.load_settings()
         self.show_page(self.pages['online'])
 
+    def init_render_bridge(self):
+        # widgets are only touched by the Tk main thread: task_app_mainloop posts changes to the bridge
+        self.render = RenderBridge.RenderBridge(self, fps=int(self.settings.settings.get('gui', {}).get('fps', 30)),
+                                                notify=self.wake_mainloop)
+        # and what the user types or selects is read by the Tk main thread too
+        for entry in self.pages['connection'].entries.values():
+            self.render.watch(entry, "text", entry.get)
+        for combobox in self.pages['mapping'].comboboxes.values():
+            self.render.watch(combobox, "value", combobox.get)
+        self.render.start()
+
     def init_sdc(self):
-        self.sdc = StreamDeckController.StreamDeckController(self)
+        if self.settings.settings.get('controller', {}).get('engine', 'thread') == "asyncio":
+            self.sdc = AsyncStreamDeckController.AsyncStreamDeckController(self)
+        else:
+            self.sdc = StreamDeckController.StreamDeckController(self)
+        self.sdc.on_change = self.wake_mainloop
+
+    def init_discovery(self):
+        # ports are enumerated and identified in the background, the connection page reads the cached list
+        self.discovery = discovery.DeviceDiscovery(self.settings.settings.get('discovery', {}), busy_ports=self.controller_ports,
+                                                   notify=self.wake_mainloop)
+        self.discovery.start()
+
+    def controller_ports(self):
+        # never probed: the controller may open them at any moment (auto-connect, reconnects, extra decks),
+        # two processes on one port either fail to open it or read each other's lines
+        ports = [self.settings.settings['connection']['serial_data']['com_port']]
+        ports += [config.get('com_port') for config in self.settings.settings.get('decks', {}).values()]
+        ser = self.sdc.ser if self.sdc is not None else None
+        if ser is not None:
+            ports.append(ser.port)
+        return [port for port in ports if port]
 
     def init_logger(self):
         self.logger = Logger(levels=['debug', 'error'], filename='logs.log', console=True)
@@ -548,6 +637,9 @@ class Application(customtkinter.CTk):
     def init_app_mainloop(self):
         threading.Thread(target=self.task_app_mainloop, daemon=True).start()
 
+    def wake_mainloop(self):
+        self.mainloop_wake.set()
+
     def add_pages(self):
         self.pages['connection'] = ConnectionPage(self)
         self.pages['online'] = OnlinePage(self)
@@ -559,45 +651,49 @@ class Application(customtkinter.CTk):
             self.current_page.hide()
         self.current_page = page
         self.current_page.show()
+        self.wake_mainloop()
 
     def reset_connection_page_widgets(self):
         current_page = self.pages['connection']
         
         for entry in current_page.entries.keys():
-            current_page.entries[entry].delete(0, tk.END)
+            self.render.set_text(current_page.entries[entry], "")
 
     def init_connection_page_widgets(self):
         current_page = self.pages['connection']
-        current_page.entries['host'].insert(0, self.settings.settings['connection']['obs_data']['host'] or "")
-        current_page.entries['port'].insert(0, self.settings.settings['connection']['obs_data']['port'] or "")
-        current_page.entries['password'].insert(0, self.settings.settings['connection']['obs_data']['password'] or "")
+        self.render.set_text(current_page.entries['host'], self.settings.settings['connection']['obs_data']['host'] or "")
+        self.render.set_text(current_page.entries['port'], self.settings.settings['connection']['obs_data']['port'] or "")
+        self.render.set_text(current_page.entries['password'], self.settings.settings['connection']['obs_data']['password'] or "")
         # current_page.entries['com_port'].insert(0, self.settings.settings['connection']['serial_data']['com_port'] or "")
         # current_page.entries['baud_rate'].insert(0, self.settings.settings['connection']['serial_data']['baud_rate'] or "")
 
     def update_connection_page_widgets(self):
         current_page = self.pages['connection']
-        streamdeck_ports = []
+        if self.discovery.version == self.discovery_version:
+            return
+        self.discovery_version = self.discovery.version
         current_streamdecks = []
 
-        ports = serial.tools.list_ports.comports()
-        for port, desc, hwid in sorted(ports):
-            if "USB-SERIAL CH340" in desc:
-                streamdeck_ports.append(port)
-
-        for streamdeck_port in streamdeck_ports:
-            current_streamdecks.append(f"Streamdeck v1.0 ({streamdeck_port})")
+        for device in self.discovery.get_devices():
+            current_streamdecks.append(f"Streamdeck {device['identity'] or 'v1.0'} ({device['port']})")
 
         if current_streamdecks != self.streamdecks:
             self.streamdecks = current_streamdecks
-            current_page.comboboxes["streamdeck"].configure(values=self.streamdecks)
+            self.render.configure(current_page.comboboxes["streamdeck"], values=self.streamdecks)
 
     def update_connection_page_settings(self):
         current_page = self.pages['connection']
-        self.settings.settings['connection']['obs_data']['host'] = current_page.entries['host'].get()
-        self.settings.settings['connection']['obs_data']['port'] = current_page.entries['port'].get()
-        self.settings.settings['connection']['obs_data']['password'] = current_page.entries['password'].get()
-        self.settings.settings['connection']['serial_data']['com_port'] = current_page.entries['com_port'].get()
-        self.settings.settings['connection']['serial_data']['baud_rate'] = current_page.entries['baud_rate'].get()
+        if any(self.render.is_pending(entry, "text") for entry in current_page.entries.values()):
+            # the entries still show the old text: reading them now would overwrite the settings
+            return
+        values = {name: self.render.value(entry, "text") for name, entry in current_page.entries.items()}
+        if None in values.values():
+            return
+        self.settings.settings['connection']['obs_data']['host'] = values['host']
+        self.settings.settings['connection']['obs_data']['port'] = values['port']
+        self.settings.settings['connection']['obs_data']['password'] = values['password']
+        self.settings.settings['connection']['serial_data']['com_port'] = values['com_port']
+        self.settings.settings['connection']['serial_data']['baud_rate'] = values['baud_rate']
 
     def connection_page_handler(self):
         if self.new_page:
@@ -610,25 +706,25 @@ class Application(customtkinter.CTk):
 
     def reset_online_page_widgets(self):
         current_page = self.pages['online']
-        current_page.buttons['sd_state'].configure(text="Connect", state="normal")
-        current_page.buttons["mapping_page"].configure(state="disabled")
-        current_page.buttons["script_page"].configure(state="disabled")
+        self.render.configure(current_page.buttons['sd_state'], text="Connect", state="normal")
+        self.render.configure(current_page.buttons["mapping_page"], state="disabled")
+        self.render.configure(current_page.buttons["script_page"], state="disabled")
         for name_label in current_page.labels.keys():
             widget_type = name_label.split("_")[0]
             if widget_type not in ["scene", "script", "volume"]:
                 continue
-            current_page.labels[name_label].configure(text="")
+            self.render.configure(current_page.labels[name_label], text="")
             if "volume" not in name_label:
-                current_page.canvas[name_label].config(bg="gray")
+                self.render.configure(current_page.canvas[name_label], bg="gray")
 
     def init_online_page_widgets(self):
         current_page = self.pages['online']
         if not self.sdc.run:
-            current_page.buttons['sd_state'].configure(text="Connect", state="normal")
+            self.render.configure(current_page.buttons['sd_state'], text="Connect", state="normal")
             return
-        current_page.buttons['sd_state'].configure(text="Disconnect", state="normal")
-        current_page.buttons["mapping_page"].configure(state="normal")
-        current_page.buttons["script_page"].configure(state="normal")
+        self.render.configure(current_page.buttons['sd_state'], text="Disconnect", state="normal")
+        self.render.configure(current_page.buttons["mapping_page"], state="normal")
+        self.render.configure(current_page.buttons["script_page"], state="normal")
         for name_label in current_page.labels.keys():
             i = name_label.split("_")[1]
             if "scene" in name_label:
@@ -640,95 +736,107 @@ class Application(customtkinter.CTk):
             else:
                 continue
             if self.settings.settings["mapping"][key] is not None:
-                current_page.labels[name_label].configure(text=self.settings.settings["mapping"][key])
+                self.render.configure(current_page.labels[name_label], text=self.settings.settings["mapping"][key])
                 if "volume" not in name_label:
-                    current_page.canvas[name_label].config(bg="red")
+                    self.render.configure(current_page.canvas[name_label], bg="red")
             else:
                 if "volume" not in name_label:
-                    current_page.canvas[name_label].config(bg="gray")
+                    self.render.configure(current_page.canvas[name_label], bg="gray")
 
     def update_online_page_widgets(self):
         current_page = self.pages["online"]
 
-        record_state = self.sdc.get_record_state()
-        stream_state = self.sdc.get_stream_state()
-        current_scene = self.sdc.get_current_scene()
-        current_script = self.sdc.script_executing
-        volume_names = self.sdc.get_volumes_names()
+        obs_state = self.sdc.get_obs_state()
+        record_state = obs_state["record"]
+        stream_state = obs_state["stream"]
+        current_scene = obs_state["scene"]
+        current_scripts = self.sdc.script_executing
+        volumes = obs_state["volumes"]
 
         # update record / streaming state
         if record_state != self.states["record"]:
             self.states["record"] = record_state
             if record_state:
-                current_page.canvas["record_state"].config(bg="yellow")
-                self.sdc.ser.write("RecordOnLed\n".encode())
+                self.render.configure(current_page.canvas["record_state"], bg="yellow")
+                self.sdc.post_ser("RecordOnLed")
             else:
-                current_page.canvas["record_state"].config(bg="red")
-                self.sdc.ser.write("RecordOffLed\n".encode())
+                self.render.configure(current_page.canvas["record_state"], bg="red")
+                self.sdc.post_ser("RecordOffLed")
 
         if stream_state != self.states["stream"]:
             self.states["stream"] = stream_state
             if stream_state:
-                current_page.canvas["stream_state"].config(bg="yellow")
-                self.sdc.ser.write("StreamOnLed\n".encode())
+                self.render.configure(current_page.canvas["stream_state"], bg="yellow")
+                self.sdc.post_ser("StreamOnLed")
             else:
-                current_page.canvas["stream_state"].config(bg="red")
-                self.sdc.ser.write("StreamOffLed\n".encode())
+                self.render.configure(current_page.canvas["stream_state"], bg="red")
+                self.sdc.post_ser("StreamOffLed")
 
         for name_canvas in current_page.canvas.keys():
             widget_type_index = name_canvas.split("_")[1]
             widget_type = name_canvas.split("_")[0]
             widget = current_page.canvas[name_canvas]
-            if widget.cget("bg") != "gray":
+            if self.render.get(widget, "bg") != "gray":
                 if "scene" == widget_type:
                     key = f"B{widget_type_index}"
                     if current_scene == self.settings.settings["mapping"][key]:
                         bg_color = "yellow"
                     else:
                         bg_color = "red"
-                    widget.config(bg=bg_color)
+                    self.render.configure(widget, bg=bg_color)
                 elif "script" in name_canvas:
                     key = f"G{widget_type_index}"
-                    if current_script == key:
+                    if key in current_scripts:
                         bg_color = "yellow"
                     else:
                         bg_color = "red"
-                    widget.config(bg=bg_color)
+                    self.render.configure(widget, bg=bg_color)
                 elif "volume" in name_canvas:
                     key = f"P{widget_type_index}"
-                    volume_name = current_page.labels[name_canvas].cget("text")
-                    if volume_name in volume_names:
-                        volume = self.sdc.get_volume(volume_name) * 1000
-                        widget.draw_ray_by_value(volume)
+                    volume_name = self.render.get(current_page.labels[name_canvas], "text")
+                    if volume_name in volumes:
+                        volume = volumes[volume_name] * 1000
+                        self.render.call(widget, "ray", widget.draw_ray_by_value, volume)
                 else:
                     continue
 
     def sdc_init_routine(self):
         current_page = self.pages["online"]
 
-        current_page.buttons['sd_state'].configure(text="Connecting...", state="disabled")
-        time.sleep(1)
+        self.render.configure(current_page.buttons['sd_state'], text="Connecting...", state="disabled")
+        started = self.sdc.connect()
         if self.sdc.ws is None:
-            if not self.sdc.connect_obs_web_socket():
-                self.logger.debug("obsws error")
+            self.logger.debug("obsws error")
         if self.sdc.ser is None:
-            if not self.sdc.open_serial_communication():
-                self.logger.debug("serial error")
+            self.logger.debug("serial error")
+        self.logger.debug(f"connection timings [s] = {self.sdc.connect_timings}")
 
-        if self.sdc.start():
+        if started:
             self.logger.debug("sdc init ok")
-            current_page.buttons['sd_state'].configure(text="Disconnect", state="normal")
+            self.render.configure(current_page.buttons['sd_state'], text="Disconnect", state="normal")
         else:
             self.logger.debug("sdc init error")
-            current_page.buttons['sd_state'].configure(text="Connect", state="normal")
+            self.render.configure(current_page.buttons['sd_state'], text="Connect", state="normal")
 
     def sdc_close_routine(self):
         current_page = self.pages["online"]
-        current_page.buttons['sd_state'].configure(text="Disconnecting...", state="disabled")
+        self.render.configure(current_page.buttons['sd_state'], text="Disconnecting...", state="disabled")
         self.sdc.stop()
         self.logger.debug("sdc close ok")
+        # the port may have been given up for another one: list the ports again
+        self.discovery.rescan()
         self.reset_online_page_widgets()
 
+    def log_link_changes(self):
+        stats = self.sdc.get_link_stats()
+        for link in self.sdc.supervisor.links:
+            if link not in stats:
+                continue
+            up = stats[link]["up"]
+            if self.links_up.get(link, True) != up:
+                self.logger.debug(f"{link} link {'restored' if up else 'lost'}: {stats[link]['last_error']}")
+            self.links_up[link] = up
+
     def online_page_handler(self):
         if self.new_page:
             # reset page
@@ -739,27 +847,28 @@ class Application(customtkinter.CTk):
             self.new_page = False
 
         if self.sdc.run:
+            self.log_link_changes()
             try:
                 self.update_online_page_widgets()
             except Exception as e:
+                # lost links are reconnected by the controller supervisor, the page keeps running
                 self.logger.debug(f"sdc error: {e}")
-                self.sdc.stop()
-                self.reset_online_page_widgets()
         else:
-            if self.current_page.buttons['sd_state'].cget("text") == "Disconnect":
+            if self.render.get(self.current_page.buttons['sd_state'], "text") == "Disconnect":
                 self.reset_online_page_widgets()
 
     def reset_mapping_page_widgets(self):
         current_page = self.pages['mapping']
     
         for combobox in current_page.comboboxes.keys():
-            current_page.comboboxes[combobox].configure(values=[""])
+            self.render.configure(current_page.comboboxes[combobox], values=[""])
 
     def init_mapping_page_widgets(self):
         current_page = self.pages['mapping']
         self.list = {"scene": [],
                      "script": [],
                      "volume": []}
+        self.catalog_version = None
         for i, name_widget in enumerate(self.current_page.comboboxes.keys()):
             j = i % 4
             if "scene" in name_widget:
@@ -771,25 +880,29 @@ class Application(customtkinter.CTk):
             else:
                 continue
             if self.settings.settings["mapping"][key] is not None:
-                current_page.comboboxes[name_widget].set(value=self.settings.settings["mapping"][key])
+                combobox = current_page.comboboxes[name_widget]
+                self.render.call(combobox, "value", combobox.set, self.settings.settings["mapping"][key], force=True)
                 if "volume" not in name_widget:
-                    current_page.canvas[name_widget].configure(bg="gray")
+                    self.render.configure(current_page.canvas[name_widget], bg="gray")
 
     def update_mapping_page_widgets(self):
         current_page = self.pages["mapping"]
 
         try:
-            if self.list["scene"] != self.sdc.get_scene_names() or self.list["script"] != list(self.settings.settings["script"].keys()) or self.list["volume"] != self.sdc.get_volumes_names():
-                self.list["scene"] = self.sdc.get_scene_names()
-                self.list["script"] = list(self.settings.settings["script"].keys())
-                self.list["volume"] = self.sdc.get_volumes_names()
+            catalog = self.sdc.get_catalog()
+            if catalog["version"] != self.catalog_version:
+                self.catalog_version = catalog["version"]
+                self.list["scene"] = catalog["scenes"]
+                self.list["script"] = catalog["scripts"]
+                self.list["volume"] = list(catalog["inputs"].keys())
                 for name_widget in current_page.comboboxes.keys():
                     widget_type = name_widget.split("_")[0]
-                    current_page.comboboxes[name_widget].configure(values=self.list[widget_type])
+                    self.render.configure(current_page.comboboxes[name_widget], values=self.list[widget_type])
         except Exception as e:
             self.logger.debug(e)
-            self.show_page(self.pages['online'])
+            self.render.call(self, "page", self.show_page, self.pages['online'], force=True)
 
+        mapping_changed = False
         for name_canvas in current_page.canvas.keys():
             widget_type_index = name_canvas.split("_")[1]
             widget_type = name_canvas.split("_")[0]
@@ -803,13 +916,20 @@ class Application(customtkinter.CTk):
                 continue
             canvas = current_page.canvas[name_canvas]
             combobox = current_page.comboboxes[name_canvas]
-            if combobox.get() in self.list[widget_type]:
-                self.settings.settings["mapping"][key] = combobox.get()
+            if self.render.is_pending(combobox, "value"):
+                continue
+            value = self.render.value(combobox, "value")
+            if value in self.list[widget_type]:
+                if self.settings.settings["mapping"][key] != value:
+                    self.settings.settings["mapping"][key] = value
+                    mapping_changed = True
                 bg_color = "red"
             else:
                 bg_color = "gray"
             if widget_type != "volume":
-                canvas.config(bg=bg_color)
+                self.render.configure(canvas, bg=bg_color)
+        if mapping_changed:
+            self.sdc.update_mapping()
 
     def mapping_page_handler(self):
         if self.new_page:
@@ -822,8 +942,6 @@ class Application(customtkinter.CTk):
                 self.update_mapping_page_widgets()
             except Exception as e:
                 self.logger.debug(f"sdc error: {e}")
-                self.sdc.stop()
-                self.show_page(self.pages["online"])
 
     def script_page_handler(self):
         pass
@@ -831,11 +949,14 @@ class Application(customtkinter.CTk):
     def task_app_mainloop(self):
         previous_page = "no_page"
         time_diff = -1
+        # the catalog ttl and the widgets still pending in the render bridge have no event of their own
+        refresh_interval = float(self.settings.settings.get('gui', {}).get('refresh_interval', 1.0))
         while True:
             time_start = time.time()
 
             if self.current_page != previous_page:
                 self.logger.debug("---------- CHANGE PAGE ----------")
+                self.logger.debug(f"render stats = {self.render.get_stats()}")
                 self.settings.save_settings()
                 previous_page = self.current_page
                 self.new_page = True
@@ -853,7 +974,8 @@ class Application(customtkinter.CTk):
                 time_diff = time.time() - time_start
                 self.logger.debug(f"thread execution time = {round(time_diff, 3)} seconds")
 
-            time.sleep(0.01)
+            self.mainloop_wake.wait(refresh_interval)
+            self.mainloop_wake.clear()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,632 @@
+# asyncio engine for the controller: one event loop thread serves the serial port, the OBS websocket and the dispatcher,
+# so nothing wakes up unless there is I/O to handle. Selected with settings['controller']['engine'] = "asyncio",
+# the public methods are the same as StreamDeckController
+import json
+import time
+import queue
+import base64
+import asyncio
+import hashlib
+import threading
+from collections import deque
+import websockets
+from obswebsocket import requests, events, exceptions
+from obswebsocket.core import EventManager
+import StreamDeckController
+
+
+class AsyncObsClient:
+    # obs-websocket v5 client on the websockets library, requests are the obswebsocket.requests objects.
+    # Pipelined like ObsClient: submit() returns a future once a window slot is free, a request waits for the
+    # previous one on its target
+    def __init__(self, timeout=2, window=8):
+        self.timeout = timeout
+        self.websocket = None
+        self.id = 0
+        self.pending = {}
+        self.read_task = None
+        self.connected = False
+        # called by read_loop when the connection is gone, like ObsClient.on_close
+        self.on_close = None
+        self.eventmanager = EventManager()
+        self.window = max(1, int(window))
+        self.slots = None
+        self.outstanding = 0
+        # target -> future of the last request submitted on it
+        self.tails = {}
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "chained": 0, "window_waits": 0, "max_in_flight": 0}
+
+    async def connect(self, host, port, password):
+        # websockets checks the handshake (Sec-WebSocket-Accept included) and answers the pings of the server
+        try:
+            self.websocket = await websockets.connect(f"ws://{host}:{port}", open_timeout=self.timeout,
+                                                      compression=None, max_size=2 ** 24)
+        except websockets.exceptions.InvalidHandshake as e:
+            raise exceptions.ConnectionFailure(f"websocket handshake refused: {e}")
+        hello = json.loads(await asyncio.wait_for(self.websocket.recv(), self.timeout))
+        if hello.get('op') != 0:
+            raise exceptions.ConnectionFailure("Invalid Hello message.")
+        auth = ''
+        if hello['d'].get('authentication'):
+            auth = self.build_auth_string(password, hello['d']['authentication']['salt'], hello['d']['authentication']['challenge'])
+        await self.send({"op": 1, "d": {"rpcVersion": 1, "authentication": auth, "eventSubscriptions": 1023}})
+        identified = json.loads(await asyncio.wait_for(self.websocket.recv(), self.timeout))
+        if identified.get('op') != 2:
+            raise exceptions.ConnectionFailure("Invalid Identified message, password may be incorrect.")
+        self.connected = True
+        self.slots = asyncio.Semaphore(self.window)
+        self.read_task = asyncio.ensure_future(self.read_loop())
+
+    def build_auth_string(self, password, salt, challenge):
+        secret = base64.b64encode(hashlib.sha256((password + salt).encode('utf-8')).digest())
+        return base64.b64encode(hashlib.sha256(secret + challenge.encode('utf-8')).digest()).decode('utf-8')
+
+    async def disconnect(self):
+        if self.websocket is None:
+            return
+        self.connected = False
+        if self.read_task is not None:
+            self.read_task.cancel()
+        websocket, self.websocket = self.websocket, None
+        await websocket.close()
+
+    async def send(self, message):
+        await self.websocket.send(json.dumps(message))
+
+    async def read_loop(self):
+        try:
+            async for message in self.websocket:
+                if isinstance(message, bytes):
+                    # binary messages are not part of the obs-websocket json protocol
+                    continue
+                try:
+                    result = json.loads(message)
+                except ValueError as e:
+                    print(f"obs invalid message: {e}")
+                    continue
+                if result['op'] in (7, 9):
+                    future = self.pending.get(result['d']['requestId'])
+                    if future is not None and not future.done():
+                        future.set_result(result['d'])
+                elif result['op'] == 5:
+                    self.trigger_event(result['d'])
+        except (websockets.exceptions.ConnectionClosed, OSError):
+            pass
+        finally:
+            self.connected = False
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(exceptions.ConnectionFailure("Connection lost"))
+            if self.on_close is not None:
+                self.on_close()
+
+    def trigger_event(self, data):
+        try:
+            obj = getattr(events, data["eventType"])()
+            obj.input(data.get("eventData", {}))
+            self.eventmanager.trigger(obj)
+        except Exception as e:
+            print(f"obs event error: {e}")
+
+    async def call(self, request):
+        return await (await self.submit(request))
+
+    async def submit(self, request):
+        # waits only for a window slot, the returned future gives the filled request
+        if not self.connected:
+            raise exceptions.ConnectionFailure("Not connected")
+        if self.slots.locked():
+            self.stats["window_waits"] += 1
+        await self.slots.acquire()
+        self.outstanding += 1
+        target = StreamDeckController.request_target(request)
+        previous = self.tails.get(target)
+        if previous is not None:
+            self.stats["chained"] += 1
+        done = asyncio.get_running_loop().create_future()
+        self.tails[target] = done
+        self.stats["submitted"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.outstanding)
+        return asyncio.ensure_future(self.run_request(request, target, previous, done))
+
+    async def run_request(self, request, target, previous, done):
+        try:
+            if previous is not None:
+                await previous
+            result = await self.request(request)
+            self.stats["completed"] += 1
+            return result
+        except BaseException:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            done.set_result(None)
+            if self.tails.get(target) is done:
+                del self.tails[target]
+            self.outstanding -= 1
+            self.slots.release()
+
+    async def request(self, request):
+        if not self.connected:
+            raise exceptions.ConnectionFailure("Not connected")
+        self.id += 1
+        message_id = str(self.id)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message_id] = future
+        try:
+            await self.send({"op": 6, "d": {"requestId": message_id, "requestType": request.name, "requestData": request.data()}})
+            data = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise exceptions.MessageTimeout(f"No answer for message {message_id}")
+        finally:
+            self.pending.pop(message_id, None)
+        request.input(data.get('responseData', {}), data['requestStatus']['result'])
+        return request
+
+    def in_flight(self):
+        return self.outstanding
+
+    def get_stats(self):
+        return dict(self.stats, in_flight=self.outstanding, window=self.window)
+
+    async def call_batch(self, request_list, execution_type=StreamDeckController.BATCH_SERIAL_REALTIME, halt_on_failure=False):
+        # RequestBatch: one round trip for the whole list, filled like ObsClient.call_batch fills it
+        if not self.connected:
+            raise exceptions.ConnectionFailure("Not connected")
+        self.id += 1
+        message_id = str(self.id)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message_id] = future
+        try:
+            await self.send({"op": 8, "d": {"requestId": message_id, "haltOnFailure": halt_on_failure, "executionType": execution_type,
+                                            "requests": [{"requestType": request.name, "requestId": str(index), "requestData": request.data()}
+                                                         for index, request in enumerate(request_list)]}})
+            data = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise exceptions.MessageTimeout(f"No answer for batch {message_id}")
+        finally:
+            self.pending.pop(message_id, None)
+        StreamDeckController.fill_batch(request_list, data)
+        return request_list
+
+
+class ObsClientFacade:
+    # blocking view of AsyncObsClient with the obsws interface, for the GUI thread and the other synchronous callers
+    def __init__(self, client, loop, loop_thread, timeout):
+        self.client = client
+        self.loop = loop
+        self.loop_thread = loop_thread
+        self.timeout = timeout
+
+    def call(self, request):
+        if threading.current_thread() is self.loop_thread:
+            raise RuntimeError("blocking OBS call from the event loop thread")
+        return asyncio.run_coroutine_threadsafe(self.client.call(request), self.loop).result(self.timeout + 1)
+
+    def call_batch(self, request_list, execution_type=StreamDeckController.BATCH_SERIAL_REALTIME, halt_on_failure=False):
+        if threading.current_thread() is self.loop_thread:
+            raise RuntimeError("blocking OBS call from the event loop thread")
+        coroutine = self.client.call_batch(request_list, execution_type, halt_on_failure)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(self.timeout + 1)
+
+    def in_flight(self):
+        return self.client.in_flight()
+
+    def get_stats(self):
+        return self.client.get_stats()
+
+    def register(self, func, event=None):
+        self.client.eventmanager.register(func, event)
+
+    def unregister(self, func, event=None):
+        self.client.eventmanager.unregister(func, event)
+
+    def disconnect(self):
+        asyncio.run_coroutine_threadsafe(self.client.disconnect(), self.loop).result(self.timeout)
+
+
+class AsyncCommandSender:
+    # CommandSender on the event loop: the commands of the main deck go out in order, each one after the ack (or the
+    # last retry) of the previous one. The task exists only while there is something to send
+    def __init__(self, send, loop):
+        self.send = send
+        self.loop = loop
+        self.queue = deque()
+        self.task = None
+        self.stats = {"posted": 0, "sent": 0, "failed": 0}
+
+    def post(self, message):
+        self.loop.call_soon_threadsafe(self.append, message)
+
+    def append(self, message):
+        self.queue.append(message)
+        self.stats["posted"] += 1
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.send_task())
+
+    async def send_task(self):
+        try:
+            while self.queue:
+                message = self.queue.popleft()
+                try:
+                    sent = await self.send(message)
+                except Exception as e:
+                    print(f"{message}: {e}")
+                    sent = False
+                self.stats["sent" if sent else "failed"] += 1
+        finally:
+            self.task = None
+
+    def get_stats(self):
+        return dict(self.stats, queued=len(self.queue))
+
+
+class AsyncStreamDeckController(StreamDeckController.StreamDeckController):
+    def __init__(self, app):
+        super().__init__(app)
+        self.loop = None
+        self.loop_thread = None
+        self.obs = None
+        self.dispatcher = None
+        self.reading = False
+        self.executor_reading = False
+        self.pending_acks = {}
+        self.paused_events = deque()
+        self.queue_ready = None
+        self.loop_lock = threading.Lock()
+        self.reader_fd = None
+
+    def ensure_loop(self):
+        # connect() opens OBS and the serial port from two threads at once
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+                self.loop_thread.start()
+                self.ser_sender = AsyncCommandSender(self.send_command, self.loop)
+
+    def run_coroutine(self, coroutine, timeout):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def connect_obs_web_socket(self):
+        host = self.app.settings.settings['connection']['obs_data']['host']
+        port = self.app.settings.settings['connection']['obs_data']['port']
+        password = self.app.settings.settings['connection']['obs_data']['password']
+        self.ensure_loop()
+        self.obs = AsyncObsClient(timeout=2, window=int(self.controller_setting('obs_window', 8)))
+        self.obs.on_close = self.on_obs_closed
+        try:
+            self.run_coroutine(self.obs.connect(host, port, password), 5)
+            self.ws = ObsClientFacade(self.obs, self.loop, self.loop_thread, 2)
+            self.ws.call(requests.GetVersion()).getObsVersion()
+            self.subscribe_obs_events()
+            self.sync_obs_state()
+            return True
+        except BaseException as e:
+            print(e)
+            self.ws = None
+            self.obs = None
+            return False
+
+    def start_reader(self):
+        self.ser.timeout = 0
+        self.ensure_loop()
+        self.loop.call_soon_threadsafe(self.start_reading)
+
+    def start_reading(self):
+        if self.reading or self.executor_reading:
+            return
+        try:
+            self.reader_fd = self.ser.fileno()
+            self.loop.add_reader(self.reader_fd, self.on_ser_readable)
+            self.reading = True
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            # no selectable handle (e.g. windows): blocking reads in the default executor instead
+            self.executor_reading = True
+            asyncio.ensure_future(self.executor_read_task())
+
+    def pause_reading(self):
+        if self.reading:
+            self.loop.remove_reader(self.reader_fd)
+            self.reading = False
+
+    def resume_reading(self):
+        if not self.reading and not self.executor_reading and self.ser is not None:
+            self.loop.add_reader(self.reader_fd, self.on_ser_readable)
+            self.reading = True
+
+    def on_ser_readable(self):
+        if self.ser is None:
+            return
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except Exception as e:
+            self.on_ser_error(e)
+            return
+        self.feed_ser(data)
+
+    async def executor_read_task(self):
+        while self.executor_reading and self.ser is not None:
+            if self.paused_events:
+                await asyncio.sleep(0.01)
+                continue
+            try:
+                data = await self.loop.run_in_executor(None, self.read_blocking)
+            except Exception as e:
+                self.on_ser_error(e)
+                return
+            self.feed_ser(data)
+
+    def read_blocking(self):
+        self.ser.timeout = 1
+        data = self.ser.read(1)
+        return data + self.ser.read(self.ser.in_waiting) if data else data
+
+    def on_ser_error(self, e):
+        self.supervisor.link_lost("serial", e)
+
+    def drop_serial(self):
+        if threading.current_thread() is self.loop_thread:
+            self.pause_reading()
+        elif self.loop is not None:
+            self.loop.call_soon_threadsafe(self.pause_reading)
+        self.executor_reading = False
+        super().drop_serial()
+
+    def put_wake_event(self):
+        if self.ser_queue is None:
+            return
+        try:
+            self.ser_queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def on_queue_put(self):
+        # the queue is shared with the SerialDeck reader threads
+        if threading.current_thread() is self.loop_thread:
+            self.queue_ready.set()
+        else:
+            self.loop.call_soon_threadsafe(self.queue_ready.set)
+
+    async def next_event(self, timeout):
+        try:
+            return self.ser_queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.queue_ready.clear()
+        if self.ser_queue.qsize():
+            return self.ser_queue.get_nowait()
+        try:
+            await asyncio.wait_for(self.queue_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        try:
+            return self.ser_queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def handle_ack(self, line):
+        future = self.pending_acks.get(line)
+        if future is not None and not future.done():
+            future.set_result(True)
+        else:
+            print(f"unexpected ack: {line}")
+
+    async def request_ack(self, message, timeout=None, retries=None):
+        if timeout is None:
+            timeout = float(self.controller_setting('ack_timeout', 1.0))
+        if retries is None:
+            retries = int(self.controller_setting('ack_retries', 2))
+        for attempt in range(retries + 1):
+            future = self.loop.create_future()
+            self.pending_acks[f"{message} ok"] = future
+            self.ack_tracker.sent(message)
+            start = time.perf_counter()
+            self.ser.write(f"{message}\n".encode())
+            try:
+                await asyncio.wait_for(future, timeout)
+                self.ack_tracker.record(message, time.perf_counter() - start)
+                return True
+            except asyncio.TimeoutError:
+                self.ack_tracker.timed_out(message, attempt < retries)
+            finally:
+                self.pending_acks.pop(f"{message} ok", None)
+        return False
+
+    async def send_command(self, message):
+        if self.ser is None:
+            return False
+        return await self.request_ack(message)
+
+    def send_ser(self, message):
+        if self.ser is None or self.loop is None:
+            return False
+        timeout = float(self.controller_setting('ack_timeout', 1.0))
+        retries = int(self.controller_setting('ack_retries', 2))
+        try:
+            return self.run_coroutine(self.request_ack(message, timeout, retries), timeout * (retries + 1) + 1)
+        except Exception as e:
+            print(e)
+            return False
+
+    def start(self):
+        if self.run:
+            return True
+        if self.ser is None:
+            return False
+        if self.ws is None:
+            return False
+        if self.controller_setting('trace_file', None):
+            self.start_recording(self.controller_setting('trace_file', None))
+        try:
+            started = self.run_coroutine(self.async_start(), 5)
+        except Exception as e:
+            print(e)
+            started = False
+        if not started:
+            self.stop_recording()
+            return False
+        self.supervisor.start()
+        self.start_decks()
+        if float(self.controller_setting('latency_log_interval', 0)) > 0:
+            threading.Thread(target=self.latency_log_task, daemon=True).start()
+        self.notify_change()
+        return True
+
+    async def async_start(self):
+        handshake_start = time.perf_counter()
+        binary = False
+        if self.binary_protocol_enabled():
+            binary = await self.request_ack("start binary")
+            if not binary:
+                print("binary protocol not supported by the device, falling back to text")
+        if not binary and not await self.request_ack("start"):
+            return False
+        self.connect_timings["start_handshake"] = round(time.perf_counter() - handshake_start, 3)
+        self.queue_ready = asyncio.Event()
+        self.ser_queue = self.new_event_queue(self.on_queue_put)
+        self.paused_events.clear()
+        self.init_pipeline()
+        self.run = True
+        self.dispatcher = asyncio.ensure_future(self.dispatch_task())
+        return True
+
+    def stop(self):
+        if not self.run:
+            return
+        self.run = False
+        self.supervisor.stop()
+        self.script_runner.shutdown()
+        self.stop_decks()
+        try:
+            self.run_coroutine(self.async_stop(), 5)
+        except Exception as e:
+            print(e)
+        self.drop_serial()
+        self.stop_recording()
+        self.stop_obsws()
+        self.notify_change()
+
+    async def async_stop(self):
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+        if self.ser is not None:
+            await self.request_ack("stop")
+        self.pause_reading()
+        self.executor_reading = False
+
+    def get_ser_stats(self):
+        # events parked while the reader is paused are still waiting for the dispatcher
+        stats = super().get_ser_stats()
+        stats["depth"] += len(self.paused_events)
+        return stats
+
+    def wake_main_task(self):
+        # a wake-up event, like the thread engine: the dispatcher is stopped only by async_stop
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.put_wake_event)
+
+    def enqueue_event(self, event):
+        if not self.run:
+            return False
+        self.count_ser("received")
+        try:
+            if self.paused_events:
+                raise queue.Full
+            # the lane can be shared with a SerialDeck reader thread (fair_dispatch off): no full() then put
+            self.ser_queue.put_nowait(event, self.event_lane(event))
+        except queue.Full:
+            # backpressure: stop reading, the OS serial buffer holds the rest until the dispatcher catches up
+            self.paused_events.append(event)
+            if self.reading:
+                self.count_ser("backpressure")
+                self.pause_reading()
+            return True
+        self.count_ser(None, self.ser_queue.qsize())
+        return True
+
+    def refill_queue(self):
+        while self.paused_events:
+            try:
+                self.ser_queue.put_nowait(self.paused_events[0], self.event_lane(self.paused_events[0]))
+            except queue.Full:
+                break
+            self.paused_events.popleft()
+        if not self.paused_events:
+            self.resume_reading()
+
+    async def async_obs_call(self, request, event=None):
+        if not self.supervisor.is_up("obs"):
+            self.supervisor.hold(request, event)
+            return None
+        call_start = time.perf_counter()
+        try:
+            res = await self.obs.call(request)
+        except Exception as e:
+            self.supervisor.link_lost("obs", e)
+            self.supervisor.hold(request, event)
+            return None
+        if event is not None:
+            self.latency.track(event, call_start, time.perf_counter())
+        return res
+
+    async def async_obs_submit(self, request, event=None):
+        # obs_submit on the event loop: waits for a window slot, not for the answer
+        if not self.supervisor.is_up("obs"):
+            self.supervisor.hold(request, event)
+            return
+        call_start = time.perf_counter()
+        try:
+            future = await self.obs.submit(request)
+        except Exception as e:
+            self.supervisor.link_lost("obs", e)
+            self.supervisor.hold(request, event)
+            return
+        future.add_done_callback(lambda future: self.obs_done(future, request, event, call_start))
+
+    async def async_obs_call_batch(self, calls):
+        # same as obs_call_batch, on the event loop
+        if len(calls) < 2:
+            for request, event in calls:
+                await self.async_obs_call(request, event)
+            return
+        if not self.supervisor.is_up("obs"):
+            for request, event in calls:
+                self.supervisor.hold(request, event)
+            return
+        call_start = time.perf_counter()
+        try:
+            await self.obs.call_batch([request for request, event in calls], StreamDeckController.BATCH_SERIAL_REALTIME)
+        except Exception as e:
+            self.supervisor.link_lost("obs", e)
+            for request, event in calls:
+                self.supervisor.hold(request, event)
+            return
+        acked = time.perf_counter()
+        for request, event in calls:
+            if event is not None:
+                self.latency.track(event, call_start, acked)
+
+    async def dispatch_task(self):
+        while self.run:
+            await self.async_obs_call_batch(self.supervisor.take_held())
+            timeout = self.dispatch_timeout()
+            if timeout is None and not self.supervisor.is_up("obs"):
+                # the coalescer keeps the latest volumes until OBS is back
+                timeout = 1.0
+            event = await self.next_event(timeout)
+            self.refill_queue()
+            try:
+                if event is not None:
+                    event.dispatched = time.perf_counter()
+                    self.count_ser("dispatched")
+                    request = self.event_request(event)
+                    if request is not None:
+                        await self.async_obs_submit(request, event)
+                self.settle_pots()
+                if self.supervisor.is_up("obs"):
+                    for request, volume_event in self.due_volume_requests():
+                        await self.async_obs_submit(request, volume_event)
+            except Exception as e:
+                # link losses are handled by the supervisor, a failing handler only loses its own event
+                print(e)
@@ -2,6 +2,8 @@ import customtkinter
 import tkinter as tk
 import math
 
+# one table per knob shape, shared by all the widgets that use it
+angle_tables = {}
 
 class PotentiometerWidget(customtkinter.CTkCanvas):
     def __init__(self, master, radius, color="gray20", pot_func="linear", range_max=1000, **kwargs):
@@ -19,6 +21,10 @@ class PotentiometerWidget(customtkinter.CTkCanvas):
         self.range_max = range_max
         self.range_min = 1 # always equals 1
         self.log_speed_factor = 2
+        self.angle_resolution = 0.5 # degrees, smaller changes are not redrawn
+        self.angle_keys, self.endpoints = self.get_angle_table()
+        self.ray_key = None
+        self.stats = {"draws": 0, "skipped": 0}
         self.bind("<Configure>", self.setup)
         # self.bind("<Button-1>", self.draw_ray_by_click)
         # self.bind("<B1-Motion>", self.draw_ray_by_click)
@@ -34,16 +40,40 @@ class PotentiometerWidget(customtkinter.CTkCanvas):
         y = self.center_y
         self.circle = self.create_oval(x - self.radius, y - self.radius, x + self.radius, y + self.radius,
                                        outline="black", fill="grey", width=4, tags="circle")
+        # the ray is created once per layout and then only moved with coords()
+        self.current_ray = self.create_line(x, y, x, y, width=8, fill="black", tags="ray")
+        self.ray_key = None
         self.after(10, self.draw_initial_ray)
 
     def draw_initial_ray(self):
         self.draw_ray_by_value(self.pot_value)
 
+    def get_angle_table(self):
+        # value -> (quantized angle, unit endpoint), so that an update is a lookup instead of two logarithms
+        shape = (self.pot_func, self.range_max, self.starting_angle_degrees, self.angle_degrees_limit, self.angle_resolution)
+        if shape not in angle_tables:
+            angle_keys = []
+            endpoints = []
+            for value in range(self.range_max + 1):
+                angle_degrees = self.calculate_angle_by_value(value)
+                angle_keys.append(round(angle_degrees / self.angle_resolution))
+                angle_radians = math.radians(angle_degrees)
+                endpoints.append((math.cos(angle_radians), -math.sin(angle_radians)))
+            angle_tables[shape] = (angle_keys, endpoints)
+        return angle_tables[shape]
+
     def draw_ray_by_value(self, value):
-        self.delete("ray")
-        angle_degrees = self.calculate_angle_by_value(value)
-        self.current_ray = self.create_line(self.center_x, self.center_y, * self.calculate_endpoint(angle_degrees),
-                                            width=8, fill="black", tags="ray")
+        self.pot_value = value
+        index = min(max(int(round(value)), 0), self.range_max)
+        angle_key = self.angle_keys[index]
+        if self.current_ray is None or angle_key == self.ray_key:
+            self.stats["skipped"] += 1
+            return
+        self.ray_key = angle_key
+        dx, dy = self.endpoints[index]
+        self.coords(self.current_ray, self.center_x, self.center_y,
+                    self.center_x + self.radius * dx, self.center_y + self.radius * dy)
+        self.stats["draws"] += 1
 
     def calculate_angle_by_value(self, value):
         if self.pot_func == "linear":
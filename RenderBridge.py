@@ -0,0 +1,111 @@
+import threading
+
+
+class RenderBridge:
+    # background threads post widget changes, the Tk main thread applies them with after() at most fps times per second
+    # only the latest value per (widget, option) is kept and values equal to the one already on screen are dropped
+    def __init__(self, root, fps=30, notify=None):
+        self.root = root
+        # called when a watched input changed, background code reading them does not have to poll
+        self.notify = notify
+        self.interval = max(1, int(1000 / fps))
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.applied = {}
+        # user input (entries, comboboxes): read on the Tk main thread at every frame, background code gets the copy
+        self.watched = {}
+        self.inputs = {}
+        self.running = False
+        self.stats = {"posted": 0, "coalesced": 0, "unchanged": 0, "applied": 0, "frames": 0, "errors": 0}
+
+    def start(self):
+        # must be called from the Tk main thread
+        if not self.running:
+            self.running = True
+            self.root.after(self.interval, self.drain)
+
+    def stop(self):
+        self.running = False
+
+    def post(self, key, func, value, force=False):
+        # force: the user can change the widget too (entries, comboboxes), so the last applied value is not trusted
+        with self.lock:
+            self.stats["posted"] += 1
+            if key in self.pending:
+                self.stats["coalesced"] += 1
+            elif not force and key in self.applied and self.applied[key] == value:
+                self.stats["unchanged"] += 1
+                return
+            self.pending[key] = (func, value, force)
+
+    def configure(self, widget, **options):
+        for option, value in options.items():
+            self.post((widget, option), lambda value, widget=widget, option=option: widget.configure(**{option: value}), value)
+
+    def call(self, widget, name, func, value, force=False):
+        self.post((widget, name), func, value, force)
+
+    def set_text(self, entry, text):
+        self.post((entry, "text"), lambda text, entry=entry: (entry.delete(0, "end"), entry.insert(0, text)), text, True)
+
+    def is_pending(self, widget, name):
+        with self.lock:
+            return (widget, name) in self.pending
+
+    def get(self, widget, option, default=None):
+        # latest posted value, so that background code never reads Tk state that is still in flight
+        # (default for options never set through the bridge: Tk is not read from here)
+        with self.lock:
+            if (widget, option) in self.pending:
+                return self.pending[(widget, option)][1]
+            return self.applied.get((widget, option), default)
+
+    def watch(self, widget, name, read):
+        with self.lock:
+            self.watched[(widget, name)] = read
+
+    def value(self, widget, name, default=None):
+        # last value read by watch(), None until the first frame
+        with self.lock:
+            return self.inputs.get((widget, name), default)
+
+    def drain(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        try:
+            for key, (func, value, force) in pending.items():
+                if not force and key in self.applied and self.applied[key] == value:
+                    with self.lock:
+                        self.stats["unchanged"] += 1
+                    continue
+                try:
+                    func(value)
+                except Exception as e:
+                    print(f"render error {key[1]}: {e}")
+                    with self.lock:
+                        self.stats["errors"] += 1
+                    continue
+                with self.lock:
+                    self.applied[key] = value
+                    self.stats["applied"] += 1
+            with self.lock:
+                watched = list(self.watched.items())
+            inputs = {}
+            for key, read in watched:
+                try:
+                    inputs[key] = read()
+                except Exception as e:
+                    print(f"render read error {key[1]}: {e}")
+            with self.lock:
+                changed = any(self.inputs.get(key) != value for key, value in inputs.items())
+                self.inputs.update(inputs)
+                self.stats["frames"] += 1
+            if changed and self.notify is not None:
+                self.notify()
+        finally:
+            if self.running:
+                self.root.after(self.interval, self.drain)
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, pending=len(self.pending))
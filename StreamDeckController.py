@@ -2,20 +2,958 @@
 # - acquisire i volumi in maniera diversa e non con wasapi_output_capture
 # - al posto di utilizzare self.run per gestire l'esecuzione dei thread posso uccidere il thread quando non sono nella online page
 #   e ogni volta che ritorno nella online page chiamo la sdc.start()
-import math
+import json
 import time
+import queue
+import socket
 import threading
+import concurrent.futures
+from collections import deque
 import serial
-from obswebsocket import obsws, requests
+import websocket
+from obswebsocket import obsws, requests, events, exceptions
 import scripting
+import protocol
+import fader
+import potfilter
+import recorder
+import discovery
+
+
+class SerialEvent:
+    __slots__ = ("command", "args", "line", "received", "dispatched", "deck")
+
+    def __init__(self, line, command=None, args=None, deck=None):
+        self.received = time.perf_counter()
+        self.dispatched = None
+        self.deck = deck
+        self.line = line
+        if command is None:
+            tokens = line.split()
+            command = tokens[0]
+            args = tokens[1:]
+        self.command = command
+        self.args = args
+
+    def __repr__(self):
+        if self.line is None:
+            return f"<SerialEvent {self.command} {self.args}>"
+        return f"<SerialEvent {self.line}>"
+
+
+class LatencyTracker:
+    metrics = ["queue", "obs", "total"]
+
+    def __init__(self, window=1024):
+        self.window = window
+        # the dispatcher and the OBS receive thread (or the event loop) record at the same time
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, command, metric, seconds):
+        with self.lock:
+            samples = self.samples.get((command, metric))
+            if samples is None:
+                samples = self.samples[(command, metric)] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def track(self, event, call_start=None, acked=None):
+        # queue: receipt -> dispatch, obs: ws.call round trip, total: receipt -> OBS acknowledgement
+        self.record(event.command, "queue", event.dispatched - event.received)
+        if call_start is not None:
+            self.record(event.command, "obs", acked - call_start)
+            self.record(event.command, "total", acked - event.received)
+
+    def get_stats(self):
+        stats = {}
+        with self.lock:
+            samples_list = [(key, list(samples)) for key, samples in self.samples.items()]
+        for (command, metric), samples in samples_list:
+            values = sorted(samples)
+            if not values:
+                continue
+            stats.setdefault(command, {})[metric] = {
+                "count": len(values),
+                "p50": round(values[int(len(values) * 0.50)] * 1000, 3),
+                "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 3),
+                "p99": round(values[min(len(values) - 1, int(len(values) * 0.99))] * 1000, 3),
+            }
+        return stats
+
+    def summary(self):
+        parts = []
+        for command, metrics in sorted(self.get_stats().items()):
+            total = metrics.get("total", metrics["queue"])
+            parts.append(f"{command} n={total['count']} p50={total['p50']} p95={total['p95']} p99={total['p99']} ms")
+        return " | ".join(parts)
+
+
+class AckTracker:
+    # correlates "<command> ok" lines with the commands waiting for them
+    def __init__(self, window=256):
+        self.window = window
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.stats = {}
+
+    def command_stats(self, command):
+        stats = self.stats.get(command)
+        if stats is None:
+            stats = self.stats[command] = {"sent": 0, "acked": 0, "retries": 0, "timeouts": 0, "rtt": deque(maxlen=self.window)}
+        return stats
+
+    def expect(self, command):
+        waiter = threading.Event()
+        with self.lock:
+            self.pending.setdefault(f"{command} ok", deque()).append(waiter)
+        self.sent(command)
+        return waiter
+
+    def sent(self, command):
+        with self.lock:
+            self.command_stats(command)["sent"] += 1
+
+    def timed_out(self, command, retry):
+        with self.lock:
+            stats = self.command_stats(command)
+            stats["timeouts"] += 1
+            if retry:
+                stats["retries"] += 1
+
+    def forget(self, command, waiter):
+        with self.lock:
+            waiters = self.pending.get(f"{command} ok")
+            if waiters and waiter in waiters:
+                waiters.remove(waiter)
+
+    def resolve(self, line):
+        with self.lock:
+            waiters = self.pending.get(line)
+            if not waiters:
+                return False
+            waiters.popleft().set()
+        return True
+
+    def request(self, write, command, timeout, retries):
+        for attempt in range(retries + 1):
+            waiter = self.expect(command)
+            start = time.perf_counter()
+            write(f"{command}\n".encode())
+            if waiter.wait(timeout):
+                self.record(command, time.perf_counter() - start)
+                return True
+            self.forget(command, waiter)
+            self.timed_out(command, attempt < retries)
+        return False
+
+    def record(self, command, rtt):
+        with self.lock:
+            stats = self.command_stats(command)
+            stats["acked"] += 1
+            stats["rtt"].append(rtt)
+
+    def get_stats(self):
+        stats = {}
+        with self.lock:
+            for command, command_stats in self.stats.items():
+                rtt = sorted(command_stats["rtt"])
+                stats[command] = dict(command_stats, rtt=None)
+                stats[command]["rtt_p50"] = round(rtt[len(rtt) // 2] * 1000, 3) if rtt else None
+                stats[command]["rtt_max"] = round(rtt[-1] * 1000, 3) if rtt else None
+                del stats[command]["rtt"]
+        return stats
+
+
+class CommandSender:
+    # one queue and one thread per deck: the commands go out in the order they were posted, each one after the ack
+    # (or the last retry) of the previous one. The thread exits when it has been idle for idle_timeout
+    def __init__(self, send, idle_timeout=5.0):
+        self.send = send
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = None
+        self.stats = {"posted": 0, "sent": 0, "failed": 0}
+
+    def post(self, message):
+        with self.lock:
+            self.queue.put(message)
+            self.stats["posted"] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.send_task, daemon=True)
+                self.thread.start()
+
+    def send_task(self):
+        while True:
+            try:
+                message = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self.lock:
+                    if self.queue.empty():
+                        self.thread = None
+                        return
+                continue
+            try:
+                sent = self.send(message)
+            except Exception as e:
+                print(f"{message}: {e}")
+                sent = False
+            with self.lock:
+                self.stats["sent" if sent else "failed"] += 1
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, queued=self.queue.qsize())
+
+
+class LinkSupervisor:
+    # reconnects a lost link with exponential backoff while the others keep running. Every deck in settings -> decks
+    # is a link of its own, "deck:<deck id>". The readers report the losses, so while every link is up it sleeps
+    def __init__(self, sdc):
+        self.sdc = sdc
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = False
+        self.config = {}
+        self.held = deque()
+        self.links = ["obs", "serial"]
+        self.state = {link: self.new_link() for link in self.links}
+        self.stats = {"held": 0, "replayed": 0, "dropped": 0}
+
+    def new_link(self):
+        return {"up": True, "delay": 0.0, "next_attempt": 0.0, "losses": 0, "attempts": 0, "reconnects": 0,
+                "down_since": None, "last_error": None}
+
+    def setting(self, name, default):
+        return self.config.get(name, default)
+
+    def start(self):
+        self.config = self.sdc.controller_setting('reconnect', {})
+        self.held = deque(maxlen=int(self.setting('buffer_size', 64)))
+        self.links = ["obs", "serial"] + [f"deck:{deck_id}" for deck_id in self.sdc.decks]
+        self.state = {link: self.new_link() for link in self.links}
+        if not self.setting('enabled', True):
+            return
+        self.running = True
+        threading.Thread(target=self.supervise_task, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+    def is_up(self, link):
+        return self.state[link]["up"]
+
+    def link_state(self, link):
+        with self.lock:
+            state = self.state.get(link)
+            return dict(state) if state is not None else self.new_link()
+
+    def link_lost(self, link, error):
+        with self.lock:
+            state = self.state.get(link)
+            if state is None or not state["up"]:
+                return
+            state["up"] = False
+            state["losses"] += 1
+            state["down_since"] = time.monotonic()
+            state["last_error"] = str(error)
+            state["delay"] = float(self.setting('initial_delay', 0.5))
+            state["next_attempt"] = time.monotonic()
+        print(f"{link} link lost: {error}")
+        self.sdc.notify_change()
+        if link == "serial":
+            self.sdc.drop_serial()
+        elif link.startswith("deck:"):
+            self.sdc.decks[link[len("deck:"):]].drop()
+        if not self.running:
+            if link.startswith("deck:"):
+                # an extra deck going away does not take the others with it
+                return
+            # reconnect disabled (or not started): the old behaviour, everything goes down
+            if self.sdc.run:
+                threading.Thread(target=self.sdc.stop, daemon=True).start()
+            return
+        self.wake.set()
+
+    def hold(self, request, event):
+        # OBS is down: keep the request for the replay or drop it, settings -> controller -> reconnect -> policy
+        with self.lock:
+            if self.setting('policy', 'buffer') == "buffer":
+                if len(self.held) == self.held.maxlen:
+                    self.stats["dropped"] += 1
+                self.held.append((request, event))
+                self.stats["held"] += 1
+            else:
+                self.stats["dropped"] += 1
+
+    def take_held(self):
+        # called by the dispatcher, so that the replay keeps the order of the events
+        if not self.held or not self.state["obs"]["up"]:
+            return []
+        with self.lock:
+            held = list(self.held)
+            self.held.clear()
+            self.stats["replayed"] += len(held)
+        return held
+
+    def supervise_task(self):
+        while self.running and self.sdc.run:
+            for link in self.links:
+                state = self.state[link]
+                if state["up"] or time.monotonic() < state["next_attempt"]:
+                    continue
+                state["attempts"] += 1
+                try:
+                    reconnected = self.reconnect(link)
+                except Exception as e:
+                    print(f"{link} reconnect error: {e}")
+                    reconnected = False
+                if not self.running or not self.sdc.run:
+                    return
+                with self.lock:
+                    if reconnected:
+                        print(f"{link} link restored after {round(time.monotonic() - state['down_since'], 3)} s")
+                        state["up"] = True
+                        state["reconnects"] += 1
+                        state["down_since"] = None
+                    else:
+                        state["next_attempt"] = time.monotonic() + state["delay"]
+                        state["delay"] = min(state["delay"] * 2, float(self.setting('max_delay', 10.0)))
+                if reconnected:
+                    # a deck resyncs its own LEDs in its handshake
+                    if not link.startswith("deck:"):
+                        self.sdc.resync_leds()
+                    self.sdc.nudge_dispatcher()
+                    self.sdc.notify_change()
+            self.wake.wait(self.next_wait())
+            self.wake.clear()
+
+    def next_wait(self):
+        # until the next reconnect attempt, or until a link is lost
+        with self.lock:
+            attempts = [state["next_attempt"] for state in self.state.values() if not state["up"]]
+        if not attempts:
+            return None
+        return max(0.0, min(attempts) - time.monotonic())
+
+    def reconnect(self, link):
+        if link == "obs":
+            return self.sdc.reconnect_obs()
+        if link == "serial":
+            return self.sdc.reconnect_serial()
+        return self.sdc.decks[link[len("deck:"):]].reconnect()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, pending=len(self.held))
+            for link, state in self.state.items():
+                stats[link] = {key: state[key] for key in ("up", "losses", "attempts", "reconnects", "last_error")}
+        return stats
+
+
+# RequestBatch executionType: one request after the other, one per video frame, all at once
+BATCH_SERIAL_REALTIME = 0
+BATCH_SERIAL_FRAME = 1
+BATCH_PARALLEL = 2
+
+
+# every request naming one of these acts on that output (StartRecord, GetRecordStatus, PauseRecord -> "record")
+output_targets = [("ReplayBuffer", "replay_buffer"), ("VirtualCam", "virtual_cam"), ("Record", "record"), ("Stream", "stream")]
+
+
+def request_target(request):
+    # what the request acts on: requests on the same target keep their order, the others may overtake each other
+    # (SetInputVolume / GetInputVolume on "Mic", SetCurrentProgramScene on the program scene, Start / StopRecord on the recording)
+    if "inputName" in request.dataout:
+        return "input", request.dataout["inputName"]
+    for part, output in output_targets:
+        if part in request.name:
+            return "output", output
+    for verb in ("Get", "Set", "Start", "Stop", "Toggle"):
+        if request.name.startswith(verb):
+            return "output", request.name[len(verb):]
+    return "output", request.name
+
+
+class ObsClient(obsws):
+    # obs-websocket v5 client with a pipeline: submit() sends the request right away and returns a Future, the
+    # receive thread resolves it by request id. Up to window requests are outstanding, a request waits for the
+    # previous one on its target to be answered (OBS may run requests in parallel). Also answers RequestBatch
+    # (op 8 -> op 9), which the obsws receive thread drops
+    def __init__(self, *args, window=8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.window = max(1, int(window))
+        self.cond = threading.Condition()
+        # request id -> [future, request or list of requests, target, deadline, payload]
+        self.pending = {}
+        # target -> ids of the requests waiting behind the one in flight
+        self.chains = {}
+        self.connected = False
+        # called by the receive thread when the connection is gone, the supervisor does not have to poll for it
+        self.on_close = None
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "chained": 0, "window_waits": 0, "max_in_flight": 0}
+
+    def connect(self):
+        try:
+            self.ws = websocket.WebSocket()
+            self.ws.connect(f"ws://{self.host}:{self.port}", timeout=self.timeout)
+            self._auth()
+            self.ws.settimeout(None)
+        except (socket.error, websocket.WebSocketException) as e:
+            raise exceptions.ConnectionFailure(str(e))
+        self.connected = True
+        self.thread_recv = threading.Thread(target=self.recv_task, args=(self.ws,), daemon=True)
+        self.thread_recv.start()
+
+    def disconnect(self):
+        if self.ws is None:
+            return
+        try:
+            self.ws.close(timeout=1)
+        except (socket.error, websocket.WebSocketException):
+            pass
+        if self.thread_recv is not None and self.thread_recv is not threading.current_thread():
+            self.thread_recv.join(1)
+        self.thread_recv = None
+
+    def recv_task(self, ws):
+        try:
+            while True:
+                message = ws.recv()
+                if not message:
+                    continue
+                try:
+                    result = json.loads(message)
+                except ValueError:
+                    continue
+                if result.get('op') in (7, 9):
+                    self.resolve(result['d']['requestId'], result['d'])
+                elif result.get('op') == 5:
+                    self.trigger_event(result['d'])
+        except (socket.error, websocket.WebSocketException):
+            pass
+        finally:
+            # connected turns False, the supervisor sees the loss without waiting for the next call
+            ws.shutdown()
+            with self.cond:
+                self.connected = False
+                failed = list(self.pending.values())
+                self.pending.clear()
+                self.chains.clear()
+                self.cond.notify_all()
+            for entry in failed:
+                self.finish(entry[0], exceptions.ConnectionFailure("Connection lost"))
+            if self.on_close is not None:
+                self.on_close()
+
+    def trigger_event(self, data):
+        try:
+            obj = getattr(events, data["eventType"])()
+            obj.input(data.get("eventData", {}))
+            self.eventmanager.trigger(obj)
+        except Exception as e:
+            print(f"obs event error: {e}")
+
+    def submit(self, request):
+        payload = {"op": 6, "d": {"requestType": request.name, "requestData": request.data()}}
+        return self.enqueue(request, payload, request_target(request))
+
+    def submit_batch(self, request_list, execution_type=BATCH_SERIAL_REALTIME, halt_on_failure=False):
+        # one message for the whole list: it takes one window slot and waits for no target
+        payload = {"op": 8, "d": {"haltOnFailure": halt_on_failure, "executionType": execution_type,
+                                  "requests": [{"requestType": request.name, "requestId": str(index), "requestData": request.data()}
+                                               for index, request in enumerate(request_list)]}}
+        return self.enqueue(request_list, payload, None)
+
+    def enqueue(self, requests_in, payload, target):
+        future = concurrent.futures.Future()
+        with self.cond:
+            if len(self.pending) >= self.window:
+                self.stats["window_waits"] += 1
+                if not self.cond.wait_for(lambda: len(self.pending) < self.window or not self.connected, self.timeout):
+                    self.expire()
+                    if len(self.pending) >= self.window and self.connected:
+                        # still full: the request is not sent beyond the window
+                        self.stats["failed"] += 1
+                        future.set_exception(exceptions.MessageTimeout("Request window full"))
+                        return future
+            if not self.connected:
+                future.set_exception(exceptions.ConnectionFailure("Not connected"))
+                return future
+            message_id = str(self.id)
+            self.id += 1
+            payload["d"]["requestId"] = message_id
+            self.pending[message_id] = [future, requests_in, target, time.monotonic() + self.timeout, payload]
+            self.stats["submitted"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], len(self.pending))
+            chain = self.chains.get(target) if target is not None else None
+            if chain is not None:
+                chain.append(message_id)
+                self.stats["chained"] += 1
+                return future
+            if target is not None:
+                self.chains[target] = deque()
+        self.send(message_id, payload)
+        return future
+
+    def send(self, message_id, payload):
+        try:
+            self.ws.send(json.dumps(payload))
+        except (socket.error, websocket.WebSocketException) as e:
+            self.resolve(message_id, None, exceptions.ConnectionFailure(str(e)))
+
+    def resolve(self, message_id, data, error=None):
+        with self.cond:
+            entry = self.pending.pop(message_id, None)
+            if entry is None:
+                return
+            following = self.advance(entry[2])
+            self.cond.notify_all()
+        if following is not None:
+            self.send(*following)
+        future, requests_in, target, deadline, payload = entry
+        if error is None:
+            if payload["op"] == 8:
+                fill_batch(requests_in, data)
+            else:
+                requests_in.input(data.get('responseData', {}), data['requestStatus']['result'])
+        self.finish(future, error, requests_in)
+
+    def advance(self, target):
+        # the next request on the target goes out once the previous one is answered (or given up)
+        chain = self.chains.get(target)
+        if chain is None:
+            return None
+        while chain:
+            message_id = chain.popleft()
+            if message_id in self.pending:
+                return message_id, self.pending[message_id][4]
+        del self.chains[target]
+        return None
+
+    def expire(self):
+        # called with cond held when the window stays full: nobody answers the oldest requests any more
+        now = time.monotonic()
+        for message_id, entry in list(self.pending.items()):
+            if entry[3] <= now:
+                self.pending.pop(message_id)
+                following = self.advance(entry[2])
+                if following is not None:
+                    self.send(*following)
+                self.finish(entry[0], exceptions.MessageTimeout(f"No answer for message {message_id}"))
+
+    def finish(self, future, error, result=None):
+        with self.cond:
+            self.stats["failed" if error is not None else "completed"] += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def call(self, request):
+        return self.wait(self.submit(request))
+
+    def call_batch(self, request_list, execution_type=BATCH_SERIAL_REALTIME, halt_on_failure=False):
+        # after a halt on failure the requests that did not run keep status None
+        return self.wait(self.submit_batch(request_list, execution_type, halt_on_failure))
+
+    def wait(self, future):
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            with self.cond:
+                self.expire()
+            raise exceptions.MessageTimeout("No answer from OBS")
+
+    def in_flight(self):
+        return len(self.pending)
+
+    def get_stats(self):
+        with self.cond:
+            return dict(self.stats, in_flight=len(self.pending), window=self.window)
+
+
+def fill_batch(request_list, response):
+    results = {result.get('requestId'): result for result in response.get('results', [])}
+    for index, request in enumerate(request_list):
+        result = results.get(str(index))
+        if result is not None:
+            request.input(result.get('responseData', {}), result['requestStatus']['result'])
+
+
+class VolumeCoalescer:
+    def __init__(self, max_rate):
+        self.interval = 1 / max_rate if max_rate else 0
+        self.pending = {}
+        self.last_sent = {}
+        self.last_db = {}
+        self.stats = {"submitted": 0, "sent": 0, "stale": 0, "unchanged": 0}
+
+    def submit(self, pin, value):
+        # latest value wins: an update still waiting for its slot is overwritten
+        self.stats["submitted"] += 1
+        if pin in self.pending:
+            self.stats["stale"] += 1
+        self.pending[pin] = value
+
+    def timeout(self, now):
+        if not self.pending:
+            return None
+        due = min(self.last_sent.get(pin, 0) + self.interval for pin in self.pending)
+        return max(0, due - now)
+
+    def pop_due(self, now):
+        due = []
+        for pin in list(self.pending):
+            if now - self.last_sent.get(pin, 0) >= self.interval:
+                due.append((pin, self.pending.pop(pin)))
+        return due
+
+    def accept(self, pin, db, now):
+        if self.last_db.get(pin) == db:
+            self.stats["unchanged"] += 1
+            return False
+        self.last_db[pin] = db
+        self.last_sent[pin] = now
+        self.stats["sent"] += 1
+        return True
+
+
+default_priority = {
+    # highest first: what the audience sees goes out before the volume streams
+    "classes": ["transport", "scene", "script", "volume"],
+    "commands": {"StartRecord": "transport", "StopRecord": "transport", "StartStream": "transport",
+                 "StopStream": "transport", "ChangeScene": "scene", "ExecuteScript": "script",
+                 "SetInputVolume": "volume"},
+    # seconds: a class whose oldest event waited this long is served before the higher ones (no starvation)
+    "max_wait": {"script": 0.2, "volume": 0.1},
+}
+
+
+class EventQueue:
+    # deck events by priority class, inside a class one FIFO lane per deck served in turn: a deck streaming
+    # pot values delays neither the buttons of the same deck nor the events of another deck.
+    # maxsize is per deck, so a full deck only blocks its own reader
+    def __init__(self, maxsize=0, notify=None, classes=None, classify=None, max_wait=None, window=1024):
+        self.maxsize = maxsize
+        # called after every put, from the putting thread (the asyncio engine wakes its dispatcher with it)
+        self.notify = notify
+        self.classes = classes or ["default"]
+        self.classify = classify
+        self.max_wait = [(max_wait or {}).get(name) for name in self.classes]
+        self.lanes = [{} for _ in self.classes]
+        self.turns = [deque() for _ in self.classes]
+        self.counts = {}
+        self.size = 0
+        self.waits = [deque(maxlen=window) for _ in self.classes]
+        self.stats = [{"served": 0, "promoted": 0} for _ in self.classes]
+        self.cond = threading.Condition()
+
+    def qsize(self):
+        return self.size
+
+    def full(self, lane=None):
+        return self.maxsize > 0 and self.counts.get(lane, 0) >= self.maxsize
+
+    def put_nowait(self, item, lane=None):
+        with self.cond:
+            if self.full(lane):
+                raise queue.Full
+            self.append(item, lane)
+
+    def put(self, item, timeout=None, lane=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: not self.full(lane), timeout):
+                raise queue.Full
+            self.append(item, lane)
+
+    def append(self, item, lane):
+        rank = self.classify(item) if self.classify is not None else 0
+        lanes = self.lanes[rank]
+        fifo = lanes.get(lane)
+        if fifo is None:
+            fifo = lanes[lane] = deque()
+        if not fifo:
+            self.turns[rank].append(lane)
+        fifo.append((time.perf_counter(), item))
+        self.counts[lane] = self.counts.get(lane, 0) + 1
+        self.size += 1
+        self.cond.notify_all()
+        if self.notify is not None:
+            self.notify()
+
+    def get_nowait(self):
+        with self.cond:
+            if not self.size:
+                raise queue.Empty
+            return self.pop()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.size, timeout):
+                raise queue.Empty
+            return self.pop()
+
+    def next_rank(self, now):
+        # an overdue class first, otherwise the highest class with events
+        highest = None
+        for rank, turns in enumerate(self.turns):
+            if not turns:
+                continue
+            if highest is None:
+                highest = rank
+            max_wait = self.max_wait[rank]
+            if rank != highest and max_wait is not None and now - self.lanes[rank][turns[0]][0][0] >= max_wait:
+                self.stats[rank]["promoted"] += 1
+                return rank
+        return highest
+
+    def pop(self):
+        now = time.perf_counter()
+        rank = self.next_rank(now)
+        turns = self.turns[rank]
+        lane = turns.popleft()
+        fifo = self.lanes[rank][lane]
+        queued, item = fifo.popleft()
+        if fifo:
+            turns.append(lane)
+        self.counts[lane] -= 1
+        self.size -= 1
+        self.waits[rank].append(now - queued)
+        self.stats[rank]["served"] += 1
+        self.cond.notify_all()
+        return item
+
+    def get_stats(self):
+        # per class: events served, served ahead of a higher class because overdue, queue wait
+        stats = {}
+        with self.cond:
+            for rank, name in enumerate(self.classes):
+                waits = sorted(self.waits[rank])
+                stats[name] = dict(self.stats[rank], waiting=sum(len(fifo) for fifo in self.lanes[rank].values()))
+                if waits:
+                    stats[name]["wait_p50"] = round(waits[len(waits) // 2] * 1000, 3)
+                    stats[name]["wait_p99"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000, 3)
+                    stats[name]["wait_max"] = round(waits[-1] * 1000, 3)
+        return stats
+
+
+led_commands = {"RecordOnLed": ("record", True), "RecordOffLed": ("record", False),
+                "StreamOnLed": ("stream", True), "StreamOffLed": ("stream", False)}
+
+
+def query_device_ready(ser, ready, timeout, interval):
+    # like discovery.probe: boards that do not reset on open answer the first "identify", the others say "ready"
+    # after the bootloader. The reader sets ready on either answer, the wait ends there
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            ser.write(b"identify\n")
+        except Exception as e:
+            print(e)
+            return False
+        remaining = deadline - time.monotonic()
+        if ready.wait(max(0.0, min(interval, remaining))):
+            return True
+        if remaining <= interval:
+            return False
+
+
+def is_device_answer(line):
+    return line == "ready" or line.startswith(discovery.IDENTITY_PREFIX)
+
+
+class SerialDeck:
+    # an additional deck from settings -> decks: own port, reader thread, parser, acks and LED state.
+    # Its bytes go through sdc.feed_ser (trace included), its events to the controller queue in their own lane with the
+    # pins prefixed by the deck id ("desk2:B0"); the LinkSupervisor reconnects it as the link "deck:<deck id>"
+    def __init__(self, sdc, deck_id, config):
+        self.sdc = sdc
+        self.deck_id = deck_id
+        self.link = f"deck:{deck_id}"
+        self.config = config
+        self.ser = None
+        self.frame_parser = None
+        self.recorder = None
+        self.ack_tracker = AckTracker()
+        self.device_ready = threading.Event()
+        self.reading = False
+        self.sender = CommandSender(self.send_command)
+        self.leds_lock = threading.Lock()
+        self.leds = {}
+        self.stats = {"received": 0}
+
+    def open(self):
+        try:
+            self.ser = serial.Serial(self.config['com_port'], self.config.get('baud_rate') or 115200, timeout=1)
+        except Exception as e:
+            print(f"deck {self.deck_id}: {e}")
+            self.ser = None
+            return False
+        self.device_ready.clear()
+        self.frame_parser = protocol.FrameParser()
+        self.reading = True
+        threading.Thread(target=self.read_task, args=(self.ser,), daemon=True).start()
+        if not query_device_ready(self.ser, self.device_ready, float(self.sdc.controller_setting('ready_timeout', 3.0)),
+                                  float(self.sdc.controller_setting('ready_query_interval', 0.5))):
+            print(f"deck {self.deck_id} did not answer")
+        return True
+
+    def start(self):
+        # after the controller (and its supervisor) started: from here on the events have a queue to go to
+        if self.ser is None or not self.handshake():
+            self.link_lost("start handshake failed")
+
+    def handshake(self):
+        binary = False
+        if self.config.get('protocol', 'binary') == "binary":
+            binary = self.send_ser("start binary")
+        if not binary and not self.send_ser("start"):
+            return False
+        # the board has been reset, its LEDs are off
+        with self.leds_lock:
+            self.leds = {}
+        self.resync_leds()
+        return True
+
+    def stop(self):
+        if self.ser is not None and not self.send_ser("stop"):
+            print(f"deck {self.deck_id}: stop not acknowledged")
+        self.drop()
+
+    def drop(self):
+        self.reading = False
+        ser, self.ser = self.ser, None
+        if ser is not None:
+            try:
+                ser.close()
+            except Exception as e:
+                print(e)
+
+    def link_lost(self, error):
+        self.sdc.supervisor.link_lost(self.link, error)
+
+    def reconnect(self):
+        self.drop()
+        if self.open() and self.handshake():
+            return True
+        self.drop()
+        return False
+
+    def send_ser(self, message):
+        ser = self.ser
+        if ser is None:
+            return False
+        timeout = float(self.sdc.controller_setting('ack_timeout', 1.0))
+        retries = int(self.sdc.controller_setting('ack_retries', 2))
+        return self.ack_tracker.request(ser.write, message, timeout, retries)
+
+    def post_ser(self, message):
+        self.sender.post(message)
+
+    def send_command(self, message):
+        # on the sender thread: an LED command waits for the ack of the previous one, so they cannot overtake
+        if message in led_commands:
+            return self.set_led(message)
+        return self.send_ser(message)
+
+    def set_led(self, message):
+        # only changes are sent: every deck keeps the state of its own LEDs
+        led, on = led_commands[message]
+        with self.leds_lock:
+            if self.leds.get(led) == on:
+                return True
+        if not self.send_ser(message):
+            return False
+        with self.leds_lock:
+            self.leds[led] = on
+        return True
+
+    def resync_leds(self):
+        # queued behind the commands already posted, the last word stays with the newest state
+        state = self.sdc.get_obs_state()
+        self.post_ser("RecordOnLed" if state["record"] else "RecordOffLed")
+        self.post_ser("StreamOnLed" if state["stream"] else "StreamOffLed")
+
+    def read_task(self, ser):
+        # bound to one port object: after a reconnect the old reader exits on its own
+        while self.reading and self.ser is ser:
+            try:
+                data = ser.read(1)
+                if data:
+                    data += ser.read(ser.in_waiting)
+            except Exception as e:
+                if self.reading and self.ser is ser:
+                    self.link_lost(e)
+                return
+            self.sdc.feed_ser(data, self)
+
+    def handle_ser_items(self, items):
+        for item in items:
+            if isinstance(item, tuple):
+                event = SerialEvent(None, *item, deck=self.deck_id)
+            elif not item:
+                continue
+            elif is_device_answer(item):
+                self.device_ready.set()
+                continue
+            elif item.endswith(" ok"):
+                if not self.ack_tracker.resolve(item):
+                    print(f"deck {self.deck_id} unexpected ack: {item}")
+                continue
+            else:
+                event = SerialEvent(item, deck=self.deck_id)
+            if event.args:
+                event.args[0] = f"{self.deck_id}:{event.args[0]}"
+            self.stats["received"] += 1
+            self.sdc.put_event(event)
+
+    def get_stats(self):
+        with self.leds_lock:
+            leds = dict(self.leds)
+        link = self.sdc.supervisor.link_state(self.link)
+        return dict(self.stats, up=link["up"], losses=link["losses"], reconnects=link["reconnects"],
+                    last_error=link["last_error"], port=self.config.get('com_port'), leds=leds,
+                    acks=self.ack_tracker.get_stats(), sender=self.sender.get_stats())
 
 
 class StreamDeckController:
     def __init__(self, app):
         self.app = app
         self.pot_value = 0
-        self.script_executing = ""
-        self.ser_data = ""
+        self.script_runner = None
+        self.ack_tracker = AckTracker()
+        self.ser_sender = CommandSender(self.send_ser)
+        self.ser_reading = False
+        self.ser_queue = None
+        # updated by the main reader, the SerialDeck readers and the dispatcher
+        self.ser_stats = {"received": 0, "dispatched": 0, "backpressure": 0, "overflow": 0, "max_depth": 0}
+        self.ser_stats_lock = threading.Lock()
+        self.volume_coalescer = None
+        self.fader_tables = {}
+        self.calibration = None
+        self.pot_filters = {}
+        self.pin_map = {}
+        self.pin_scripts = {}
+        self.decks = {}
+        self.fair_dispatch = True
+        self.handlers = {}
+        self.init_handlers()
+        self.latency = LatencyTracker()
+        self.obs_state = {"record": False, "stream": False, "scene": None, "inputs": {}, "volumes": {}}
+        self.obs_state_lock = threading.Lock()
+        self.catalog = {"version": 0, "scenes": [], "inputs": {}, "inputs_by_kind": {}, "scripts": []}
+        self.catalog_dirty = True
+        self.catalog_updated = 0
+        self.catalog_lock = threading.Lock()
+        self.frame_parser = None
+        self.recorder = None
+        self.device_ready = threading.Event()
+        self.supervisor = LinkSupervisor(self)
+        self.connect_timings = {}
+        # called when something the GUI shows may have changed, the GUI loop sleeps until then
+        self.on_change = None
         self.ser = None
         self.ws = None
         self.run = False
@@ -28,19 +966,243 @@ class StreamDeckController:
             return False
         if self.ws is None:
             return False
-        if not self.send_ser("start"):
+        if self.controller_setting('trace_file', None):
+            self.start_recording(self.controller_setting('trace_file', None))
+        self.ser_queue = self.new_event_queue()
+        # the reader runs since open_serial_communication: it is the one that sees the acks
+        self.start_reader()
+        if not self.start_handshake():
+            self.stop_recording()
             return False
+        self.init_pipeline()
         self.run = True
-        threading.Thread(target=self.read_ser_task, daemon=True).start()
         threading.Thread(target=self.main_task, daemon=True).start()
+        self.supervisor.start()
+        self.start_decks()
+        if float(self.controller_setting('latency_log_interval', 0)) > 0:
+            threading.Thread(target=self.latency_log_task, daemon=True).start()
+        self.notify_change()
+        return True
+
+    def start_handshake(self):
+        handshake_start = time.perf_counter()
+        binary = False
+        if self.binary_protocol_enabled():
+            binary = self.send_ser("start binary")
+            if not binary:
+                print("binary protocol not supported by the device, falling back to text")
+        if not binary and not self.send_ser("start"):
+            return False
+        self.connect_timings["start_handshake"] = round(time.perf_counter() - handshake_start, 3)
+        return True
+
+    def notify_change(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def on_obs_closed(self):
+        # called by the OBS client when its connection is gone, not when stop() closed it
+        if self.run:
+            self.supervisor.link_lost("obs", "connection closed")
+
+    def reconnect_obs(self):
+        if self.ws is not None:
+            try:
+                self.stop_obsws()
+            except Exception as e:
+                print(e)
+            self.ws = None
+        if not self.connect_obs_web_socket():
+            return False
+        self.invalidate_catalog()
+        return True
+
+    def reconnect_serial(self):
+        if self.ser is not None:
+            self.drop_serial()
+        if not self.open_serial_communication():
+            return False
+        if not self.start_handshake():
+            self.drop_serial()
+            return False
+        return True
+
+    def drop_serial(self):
+        self.ser_reading = False
+        ser, self.ser = self.ser, None
+        if ser is not None:
+            try:
+                ser.close()
+            except Exception as e:
+                print(e)
+
+    def resync_leds(self):
+        # after a reconnect the board has been reset (serial) or OBS may have changed meanwhile (obs)
+        for deck in list(self.decks.values()):
+            deck.resync_leds()
+        if self.ser is None:
+            return
+        state = self.get_obs_state()
+        self.ser_sender.post("RecordOnLed" if state["record"] else "RecordOffLed")
+        self.ser_sender.post("StreamOnLed" if state["stream"] else "StreamOffLed")
+
+    def get_link_stats(self):
+        stats = self.supervisor.get_stats()
+        stats["decks"] = {deck_id: stats[deck.link] for deck_id, deck in self.decks.items() if deck.link in stats}
+        return stats
+
+    def init_decks(self):
+        # the deck in connection -> serial_data keeps its plain pins (B0, P0, ...), settings -> decks adds more:
+        # {"desk2": {"com_port": ..., "baud_rate": ..., "protocol": ..., "mapping": {"B0": ..., ...}}}
+        self.decks = {deck_id: SerialDeck(self, deck_id, config)
+                      for deck_id, config in self.app.settings.settings.get('decks', {}).items()}
+
+    def start_decks(self):
+        # a deck that does not answer goes straight to its reconnect loop, the others do not wait for it
+        for deck in self.decks.values():
+            threading.Thread(target=deck.start, daemon=True).start()
+
+    def stop_decks(self):
+        threads = [threading.Thread(target=deck.stop, daemon=True) for deck in self.decks.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def get_deck_stats(self):
+        return {deck_id: deck.get_stats() for deck_id, deck in list(self.decks.items())}
+
+    def new_event_queue(self, notify=None):
+        # settings -> controller -> priority: {"classes": [...], "commands": {command: class}, "max_wait": {class: s}}
+        # commands not listed go to the last class, the wake-ups of the dispatcher to the first one
+        priority = self.controller_setting('priority', default_priority)
+        classes = list(priority.get('classes') or [])
+        commands = {command: classes.index(name) for command, name in priority.get('commands', {}).items() if name in classes}
+        lowest = max(len(classes) - 1, 0)
+
+        def classify(event):
+            return 0 if event is None else commands.get(event.command, lowest)
+
+        return EventQueue(int(self.controller_setting('queue_size', 256)), notify, classes, classify if classes else None,
+                          priority.get('max_wait', {}))
+
+    def get_priority_stats(self):
+        return self.ser_queue.get_stats() if self.ser_queue is not None else {}
+
+    def event_lane(self, event):
+        # fair_dispatch off: one lane for every deck, first come first served
+        return event.deck if self.fair_dispatch else None
+
+    def binary_protocol_enabled(self):
+        return self.app.settings.settings['connection']['serial_data'].get('protocol', 'binary') == "binary"
+
+    def init_pipeline(self):
+        self.volume_coalescer = VolumeCoalescer(float(self.controller_setting('volume_max_rate', 20)))
+        self.fair_dispatch = bool(self.controller_setting('fair_dispatch', True))
+        self.script_runner = scripting.ScriptRunner(int(self.controller_setting('script_workers', 2)),
+                                                    notify=self.notify_change,
+                                                    max_queued=int(self.controller_setting('script_max_queued', 8)))
+        self.init_fader_tables()
+        self.pot_filters = {}
+        self.update_mapping()
+        scripting.typing_interval = float(self.controller_setting('typing_interval', 0.0))
+        for name, error in scripting.compile_scripts(self.app.settings.settings['script']).items():
+            print(f"script {name} error: {error}")
+
+    def init_fader_tables(self):
+        # one table per pot, rebuilt when the profiles change
+        profiles = self.controller_setting('fader_profiles', {})
+        curve = self.controller_setting('fader_curve', 'log')
+        self.fader_tables = {}
+        for pin in [f"P{i}" for i in range(4)] + list(profiles):
+            try:
+                self.fader_tables[pin] = fader.get_table(dict({"curve": curve}, **profiles.get(pin, {})))
+            except ValueError as e:
+                print(f"fader profile {pin} error: {e}")
+                self.fader_tables[pin] = fader.get_table({"curve": curve})
+
+    def filter_pot(self, pin, raw, now):
+        pot_filter = self.pot_filters.get(pin)
+        if pot_filter is None:
+            config = potfilter.pin_config(self.controller_setting('pot_filter', {}), pin)
+            try:
+                pot_filter = potfilter.PotFilter(config)
+            except ValueError as e:
+                print(f"pot filter {pin} error: {e}")
+                pot_filter = potfilter.PotFilter({"type": "none", "band": 1})
+            self.pot_filters[pin] = pot_filter
+        return pot_filter.update(raw, now)
+
+    def settle_pots(self):
+        # pots whose knob stopped between two samples: their exact last value goes to the coalescer
+        now = time.perf_counter()
+        for pin, pot_filter in list(self.pot_filters.items()):
+            value = pot_filter.flush(now)
+            if value is not None:
+                event = SerialEvent(f"SetInputVolume {pin} {value}", "SetInputVolume", [pin, value])
+                event.dispatched = event.received
+                self.volume_coalescer.submit(pin, event)
+
+    def dispatch_timeout(self):
+        # when the dispatcher has to wake up without a new event: a volume slot or a pot to settle
+        now = time.perf_counter()
+        timeouts = [pot_filter.flush_timeout(now) for pot_filter in list(self.pot_filters.values())]
+        if self.supervisor.is_up("obs"):
+            timeouts.append(self.volume_coalescer.timeout(time.monotonic()))
+        timeouts = [timeout for timeout in timeouts if timeout is not None]
+        return min(timeouts) if timeouts else None
+
+    def get_filter_stats(self):
+        return {pin: dict(pot_filter.stats) for pin, pot_filter in list(self.pot_filters.items())}
+
+    def start_recording(self, path):
+        # everything the deck sends from now on is appended to path, see recorder.py
+        # every deck in settings -> decks gets its own trace next to it: "session.trace" -> "session.desk2.trace"
+        self.stop_recording()
+        try:
+            self.recorder = recorder.TraceRecorder(path)
+            for deck_id, deck in self.decks.items():
+                deck.recorder = recorder.TraceRecorder(recorder.deck_trace_path(path, deck_id))
+        except OSError as e:
+            print(f"trace {path} error: {e}")
+            self.stop_recording()
+            return False
         return True
 
+    def stop_recording(self):
+        for deck in self.decks.values():
+            if deck.recorder is not None:
+                deck_recorder, deck.recorder = deck.recorder, None
+                deck_recorder.close()
+        if self.recorder is not None:
+            trace_recorder, self.recorder = self.recorder, None
+            trace_recorder.close()
+            return trace_recorder.stats
+        return None
+
+    def start_calibration(self, pins=None):
+        # turn every pot from end to end, then call finish_calibration
+        self.calibration = fader.FaderCalibration(pins)
+
+    def finish_calibration(self, curve=None, dead_zone=6):
+        if self.calibration is None:
+            return {}
+        profiles = self.calibration.profiles(curve or self.controller_setting('fader_curve', 'log'), dead_zone)
+        self.calibration = None
+        self.app.settings.settings.setdefault('controller', {}).setdefault('fader_profiles', {}).update(profiles)
+        self.init_fader_tables()
+        return profiles
+
     def stop_ser(self):
-        self.send_ser_with_readline_task("stop")
-        self.ser.close()
-        self.ser = None
+        if self.ser is None:
+            return
+        if not self.send_ser("stop"):
+            print("stop not acknowledged by the device")
+        self.drop_serial()
 
     def stop_obsws(self):
+        if self.ws is None:
+            return
         self.ws.disconnect()
         self.ws = None
 
@@ -48,57 +1210,279 @@ class StreamDeckController:
         if not self.run:
             return
         self.run = False
+        self.supervisor.stop()
+        self.wake_main_task()
+        self.script_runner.shutdown()
+        self.stop_decks()
         self.stop_ser()
+        self.stop_recording()
         self.stop_obsws()
+        self.notify_change()
+
+    @property
+    def script_executing(self):
+        if self.script_runner is None:
+            return set()
+        return self.script_runner.running_pins()
+
+    def controller_setting(self, name, default):
+        return self.app.settings.settings.get('controller', {}).get(name, default)
+
+    def count_ser(self, name, depth=None):
+        with self.ser_stats_lock:
+            if name is not None:
+                self.ser_stats[name] += 1
+            if depth is not None and depth > self.ser_stats["max_depth"]:
+                self.ser_stats["max_depth"] = depth
+
+    def get_ser_stats(self):
+        with self.ser_stats_lock:
+            stats = dict(self.ser_stats)
+        stats["depth"] = self.ser_queue.qsize() if self.ser_queue is not None else 0
+        return stats
+
+    def get_latency_stats(self):
+        return self.latency.get_stats()
+
+    def latency_log_task(self):
+        interval = float(self.controller_setting('latency_log_interval', 0))
+        while self.run:
+            time.sleep(interval)
+            summary = self.latency.summary()
+            if summary:
+                self.app.logger.debug(f"latency: {summary}")
+
+    def get_volume_stats(self):
+        if self.volume_coalescer is None:
+            return {}
+        return dict(self.volume_coalescer.stats)
 
     def connect_obs_web_socket(self):
         host = self.app.settings.settings['connection']['obs_data']['host']
         port = self.app.settings.settings['connection']['obs_data']['port']
         password = self.app.settings.settings['connection']['obs_data']['password']
-        self.ws = obsws(host=host, port=port, password=password, timeout=2)
+        self.ws = ObsClient(host=host, port=port, password=password, legacy=False, timeout=2,
+                            window=int(self.controller_setting('obs_window', 8)))
+        self.ws.on_close = self.on_obs_closed
         try:
             self.ws.connect()
             self.ws.call(requests.GetVersion()).getObsVersion()
+            self.subscribe_obs_events()
+            self.sync_obs_state()
             return True
         except BaseException as e:
             print(e)
             self.ws = None
             return False
 
+    def subscribe_obs_events(self):
+        self.ws.register(self.on_record_state_changed, events.RecordStateChanged)
+        self.ws.register(self.on_stream_state_changed, events.StreamStateChanged)
+        self.ws.register(self.on_current_program_scene_changed, events.CurrentProgramSceneChanged)
+        self.ws.register(self.on_input_volume_changed, events.InputVolumeChanged)
+        self.ws.register(self.on_input_created, events.InputCreated)
+        self.ws.register(self.on_input_removed, events.InputRemoved)
+        self.ws.register(self.on_input_name_changed, events.InputNameChanged)
+        for catalog_event in [events.SceneCreated, events.SceneRemoved, events.SceneNameChanged, events.SceneListChanged,
+                              events.InputCreated, events.InputRemoved, events.InputNameChanged]:
+            self.ws.register(self.invalidate_catalog, catalog_event)
+        # registered last: the handlers above have updated the mirror when the GUI is woken
+        self.ws.register(lambda event: self.notify_change(), None)
+
+    def sync_obs_state(self):
+        # one full read at connect time, afterwards the mirror is kept up to date by the OBS events
+        # two round trips whatever the number of inputs: the states and the input list, then every volume
+        record, stream, scene, input_list = self.obs_batch([requests.GetRecordStatus(), requests.GetStreamStatus(),
+                                                            requests.GetCurrentProgramScene(), requests.GetInputList()])
+        record = record.datain['outputActive']
+        stream = stream.datain['outputActive']
+        scene = scene.datain['currentProgramSceneName']
+        inputs = {}
+        volume_requests = []
+        for input_dict in input_list.datain['inputs']:
+            inputs[input_dict['inputName']] = input_dict['inputKind']
+            if self.is_audio_input(input_dict):
+                volume_requests.append(requests.GetInputVolume(inputName=input_dict['inputName']))
+        volumes = {}
+        for request in self.obs_batch(volume_requests):
+            if request.status:
+                volumes[request.dataout['inputName']] = request.datain['inputVolumeMul']
+        with self.obs_state_lock:
+            self.obs_state = {"record": record, "stream": stream, "scene": scene, "inputs": inputs, "volumes": volumes}
+        self.notify_change()
+
+    def get_obs_state(self):
+        with self.obs_state_lock:
+            state = dict(self.obs_state)
+            state["inputs"] = dict(self.obs_state["inputs"])
+            state["volumes"] = dict(self.obs_state["volumes"])
+        return state
+
+    def invalidate_catalog(self, event=None):
+        self.catalog_dirty = True
+
+    def get_catalog(self):
+        # OBS is only queried when an event invalidated the cache or the ttl expired
+        with self.catalog_lock:
+            ttl = float(self.controller_setting('catalog_ttl', 5.0))
+            if (self.catalog_dirty or time.monotonic() - self.catalog_updated >= ttl) and self.supervisor.is_up("obs"):
+                self.catalog_dirty = False
+                self.catalog_updated = time.monotonic()
+                inputs = {}
+                inputs_by_kind = {}
+                try:
+                    scene_list, input_list = self.obs_batch([requests.GetSceneList(), requests.GetInputList()])
+                    scenes = [scene["sceneName"] for scene in scene_list.datain['scenes']]
+                    for input_dict in input_list.datain['inputs']:
+                        if self.is_audio_input(input_dict):
+                            inputs[input_dict['inputName']] = input_dict['inputKind']
+                            inputs_by_kind.setdefault(input_dict['inputKind'], []).append(input_dict['inputName'])
+                except Exception as e:
+                    # keep serving the cached catalog, it is refreshed after the reconnect
+                    self.supervisor.link_lost("obs", e)
+                    scenes, inputs = self.catalog["scenes"], self.catalog["inputs"]
+                    inputs_by_kind = self.catalog["inputs_by_kind"]
+                if scenes != self.catalog["scenes"] or inputs != self.catalog["inputs"]:
+                    self.catalog = dict(self.catalog, version=self.catalog["version"] + 1, scenes=scenes,
+                                        inputs=inputs, inputs_by_kind=inputs_by_kind)
+            scripts = list(self.app.settings.settings['script'].keys())
+            if scripts != self.catalog["scripts"]:
+                self.catalog = dict(self.catalog, version=self.catalog["version"] + 1, scripts=scripts)
+            return self.catalog
+
+    def is_audio_input(self, input_dict):
+        accepted_inputs = ['wasapi_output_capture', 'wasapi_input_capture']
+        for accepted_input in accepted_inputs:
+            if accepted_input in input_dict.values():
+                return True
+        return False
+
+    def on_record_state_changed(self, event):
+        with self.obs_state_lock:
+            self.obs_state["record"] = event.datain['outputActive']
+
+    def on_stream_state_changed(self, event):
+        with self.obs_state_lock:
+            self.obs_state["stream"] = event.datain['outputActive']
+
+    def on_current_program_scene_changed(self, event):
+        with self.obs_state_lock:
+            self.obs_state["scene"] = event.datain['sceneName']
+
+    def on_input_volume_changed(self, event):
+        with self.obs_state_lock:
+            if event.datain['inputName'] in self.obs_state["volumes"]:
+                self.obs_state["volumes"][event.datain['inputName']] = event.datain['inputVolumeMul']
+
+    def on_input_created(self, event):
+        input_name = event.datain['inputName']
+        with self.obs_state_lock:
+            self.obs_state["inputs"][input_name] = event.datain['inputKind']
+        if self.is_audio_input(event.datain):
+            # callbacks run on the websocket receive thread, which must not block on a request
+            threading.Thread(target=self.fetch_input_volume, args=(input_name,), daemon=True).start()
+
+    def fetch_input_volume(self, input_name):
+        try:
+            volume = self.get_volume(input_name)
+        except Exception as e:
+            print(e)
+            return
+        with self.obs_state_lock:
+            if input_name in self.obs_state["inputs"]:
+                self.obs_state["volumes"][input_name] = volume
+
+    def on_input_removed(self, event):
+        with self.obs_state_lock:
+            self.obs_state["inputs"].pop(event.datain['inputName'], None)
+            self.obs_state["volumes"].pop(event.datain['inputName'], None)
+
+    def on_input_name_changed(self, event):
+        old_name = event.datain['oldInputName']
+        new_name = event.datain['inputName']
+        with self.obs_state_lock:
+            if old_name in self.obs_state["inputs"]:
+                self.obs_state["inputs"][new_name] = self.obs_state["inputs"].pop(old_name)
+            if old_name in self.obs_state["volumes"]:
+                self.obs_state["volumes"][new_name] = self.obs_state["volumes"].pop(old_name)
+
+    def connect(self):
+        # OBS handshake and serial open + device boot run side by side, then the start handshake
+        connect_start = time.perf_counter()
+        results = {}
+
+        def phase(name, func):
+            phase_start = time.perf_counter()
+            results[name] = func()
+            self.connect_timings[name] = round(time.perf_counter() - phase_start, 3)
+
+        self.connect_timings = {}
+        if not self.decks:
+            self.init_decks()
+        phases = []
+        if self.ws is None:
+            phases.append(threading.Thread(target=phase, args=("obs_connect", self.connect_obs_web_socket), daemon=True))
+        if self.ser is None:
+            phases.append(threading.Thread(target=phase, args=("serial", self.open_serial_communication), daemon=True))
+        for deck_id, deck in self.decks.items():
+            if deck.ser is None:
+                phases.append(threading.Thread(target=phase, args=(f"deck {deck_id}", deck.open), daemon=True))
+        for thread in phases:
+            thread.start()
+        for thread in phases:
+            thread.join()
+        started = self.ws is not None and self.ser is not None and self.start()
+        self.connect_timings["total"] = round(time.perf_counter() - connect_start, 3)
+        return started
+
     def open_serial_communication(self):
         com_port = self.app.settings.settings['connection']['serial_data']['com_port']
-        baud_rate = self.app.settings.settings['connection']['serial_data']['baud_rate']
+        baud_rate = self.app.settings.settings['connection']['serial_data']['baud_rate'] or 115200
+        open_start = time.perf_counter()
         try:
             self.ser = serial.Serial(com_port, baud_rate, timeout=1)
-            time.sleep(2)
-            return True
         except Exception as e:
             print(e)
             self.ser = None
             return False
+        self.connect_timings["serial_open"] = round(time.perf_counter() - open_start, 3)
+        # opening the port resets the board: the firmware announces "ready" once it is out of the bootloader
+        self.device_ready.clear()
+        self.frame_parser = protocol.FrameParser()
+        self.start_reader()
+        self.wait_device_ready()
+        return True
 
-    def pot_to_fader(self, pot_value):
-        min_pot = 94
-        max_pot = 1022
-        min_db = -100
-        max_db = 0
-        if pot_value <= min_pot:
-            return min_pot, min_db
-        elif pot_value >= max_pot:
-            return max_pot, max_db
-        db = ((math.log10(pot_value - min_pot + 1)) / (math.log10(max_pot - min_pot + 1))) * (max_db - min_db) + min_db
-        return pot_value, db
+    def wait_device_ready(self):
+        timeout = float(self.controller_setting('ready_timeout', 3.0))
+        ready_start = time.perf_counter()
+        ready = query_device_ready(self.ser, self.device_ready, timeout,
+                                   float(self.controller_setting('ready_query_interval', 0.5)))
+        self.connect_timings["device_ready"] = round(time.perf_counter() - ready_start, 3)
+        if not ready:
+            # an old firmware without "identify" that did not reset either: the start handshake retries cover it
+            print(f"device did not answer within {timeout} s")
+        return ready
+
+    def start_reader(self):
+        if not self.ser_reading:
+            self.ser_reading = True
+            threading.Thread(target=self.read_ser_task, daemon=True).start()
+
+    def pot_to_fader(self, pot_value, pin=None):
+        table = self.fader_tables.get(pin)
+        if table is None:
+            table = self.fader_tables[pin] = fader.get_table({"curve": self.controller_setting('fader_curve', 'log')})
+        return pot_value, fader.to_db(table, pot_value)
 
     def get_volumes_names(self):
         inputs = []
-        accepted_inputs = ['wasapi_output_capture', 'wasapi_input_capture']
         req = requests.GetInputList()
         res = self.ws.call(req)
         input_list = res.datain['inputs']
         for input_dict in input_list:
-            for accepted_input in accepted_inputs:
-                if accepted_input in input_dict.values():
-                    inputs.append(input_dict['inputName'])
+            if self.is_audio_input(input_dict):
+                inputs.append(input_dict['inputName'])
         return inputs
 
     def get_volume(self, volume_name):
@@ -131,73 +1515,280 @@ class StreamDeckController:
         return res
 
     def send_ser(self, message):
-        if self.ser is not None:
-            res_exp = f"{message} ok"
-            self.ser.write(f"{message}\n".encode())
-            res = self.ser.readline().decode().strip()
-            print(res)
-            if res == res_exp:
-                return True
-            else:
-                return False
+        # start, stop, LED and DumbMode / NormalOperation commands, acknowledged by "<message> ok"
+        if self.ser is None:
+            return False
+        timeout = float(self.controller_setting('ack_timeout', 1.0))
+        retries = int(self.controller_setting('ack_retries', 2))
+        return self.ack_tracker.request(self.ser.write, message, timeout, retries)
 
-    def send_ser_with_readline_task(self, message):
-        if self.ser is not None:
-            res_exp = f"{message} ok"
-            self.ser.write(f"{message}\n".encode())
-            while self.ser_data != res_exp:
-                pass
+    def post_ser(self, message):
+        # fire and forget for the GUI thread: the ack wait and the retries happen on the sender thread, in order
+        self.ser_sender.post(message)
+        for deck in list(self.decks.values()):
+            deck.post_ser(message)
+
+    def get_ack_stats(self):
+        return self.ack_tracker.get_stats()
 
     def read_ser_task(self):
-        while self.run:
+        while self.ser_reading:
             try:
-                self.ser_data = self.ser.readline().decode().strip()
-                if self.ser_data:
-                    print(f"> {self.ser_data}")
+                data = self.ser.read(1)
+                if data:
+                    data += self.ser.read(self.ser.in_waiting)
             except Exception as e:
-                print(f"read_ser_task error: {e}")
-                self.ser.close()
-                self.ser = None
-                self.run = False
-            time.sleep(0.01)
-
-    def event_handler(self):
-        if self.ser_data == "StartRecord":
-            self.ws.call(requests.StartRecord())
-        elif self.ser_data == "StopRecord" in self.ser_data:
-            self.ws.call(requests.StopRecord())
-        elif self.ser_data == "GetStreamStatus":
-            self.ws.call(requests.GetRecordStatus())
-        elif self.ser_data == "StartStream":
-            self.ws.call(requests.StartStream())
-        elif self.ser_data == "StopStream":
-            self.ws.call(requests.StopStream())
-        elif "ChangeScene" in self.ser_data:
-            pin = self.ser_data.split()[1]
-            scene_name = self.app.settings.settings['mapping'][pin]
-            print(self.ser_data)
-            self.ws.call(requests.SetCurrentProgramScene(sceneName=scene_name))
-        elif "SetInputVolume" in self.ser_data:
-            pin = self.ser_data.split()[1]
-            volume_ser = self.ser_data.split()[2]
-            volume_name = self.app.settings.settings['mapping'][pin]
-            volume_value, self.pot_value = self.pot_to_fader(int(volume_ser))
-            print(f"{self.ser_data}:{self.pot_value} dB")
-            self.ws.call(requests.SetInputVolume(inputName=volume_name, inputVolumeDb=int(self.pot_value)))
-        elif "ExecuteScript" in self.ser_data:
-            pin = self.ser_data.split()[1]
-            script_name = self.app.settings.settings['mapping'][pin]
-            self.script_executing = pin
-            scripting.execute_script(self.app.settings.settings['script'][script_name])
-            self.script_executing = ""
-
-        self.ser_data = "no data"
+                if not self.ser_reading:
+                    break
+                self.supervisor.link_lost("serial", e)
+                break
+            self.feed_ser(data)
+
+    def feed_ser(self, data, deck=None):
+        # raw bytes from a deck (or from a trace replay) -> trace -> parser -> queue, deck None is the main one
+        if not data:
+            return
+        source = self if deck is None else deck
+        if source.recorder is not None:
+            source.recorder.record(data)
+        source.handle_ser_items(source.frame_parser.feed(data))
+
+    def handle_ser_items(self, items):
+        for item in items:
+            if isinstance(item, tuple):
+                self.enqueue_event(SerialEvent(None, *item))
+                continue
+            if not item:
+                continue
+            print(f"> {item}")
+            if is_device_answer(item):
+                self.device_ready.set()
+                continue
+            if item.endswith(" ok"):
+                self.handle_ack(item)
+                continue
+            self.enqueue_event(SerialEvent(item))
+
+    def handle_ack(self, line):
+        if not self.ack_tracker.resolve(line):
+            print(f"unexpected ack: {line}")
+
+    def enqueue_event(self, event):
+        return self.put_event(event)
+
+    def put_event(self, event):
+        # any reader thread, also the SerialDeck ones with the asyncio engine
+        if self.ser_queue is None:
+            return False
+        self.count_ser("received")
+        lane = self.event_lane(event)
+        try:
+            self.ser_queue.put_nowait(event, lane)
+        except queue.Full:
+            # block the reader instead of dropping: the OS serial buffer absorbs the burst meanwhile
+            self.count_ser("backpressure")
+            try:
+                self.ser_queue.put(event, float(self.controller_setting('queue_put_timeout', 1.0)), lane)
+            except queue.Full:
+                self.count_ser("overflow")
+                print(f"event queue overflow, dropped {event}")
+                return False
+        self.count_ser(None, self.ser_queue.qsize())
+        return True
+
+    def nudge_dispatcher(self):
+        # lets main_task replay the held requests right away
+        self.wake_main_task()
+
+    def wake_main_task(self):
+        if self.ser_queue is None:
+            return
+        try:
+            self.ser_queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def obs_call(self, request, event=None):
+        if not self.supervisor.is_up("obs"):
+            self.supervisor.hold(request, event)
+            return None
+        call_start = time.perf_counter()
+        try:
+            res = self.ws.call(request)
+        except Exception as e:
+            self.supervisor.link_lost("obs", e)
+            self.supervisor.hold(request, event)
+            return None
+        if event is not None:
+            self.latency.track(event, call_start, time.perf_counter())
+        return res
+
+    def obs_submit(self, request, event=None):
+        # pipelined obs_call: the dispatcher goes on with the next event while the request is in flight,
+        # the answer is handled on the receive thread (settings -> controller -> obs_window requests outstanding)
+        if not self.supervisor.is_up("obs"):
+            self.supervisor.hold(request, event)
+            return
+        call_start = time.perf_counter()
+        self.ws.submit(request).add_done_callback(lambda future: self.obs_done(future, request, event, call_start))
+
+    def obs_done(self, future, request, event, call_start):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            if self.run:
+                self.supervisor.link_lost("obs", error)
+                self.supervisor.hold(request, event)
+            return
+        if event is not None:
+            self.latency.track(event, call_start, time.perf_counter())
+
+    def obs_in_flight(self):
+        ws = self.ws
+        return ws.in_flight() if ws is not None else 0
+
+    def get_obs_stats(self):
+        ws = self.ws
+        return ws.get_stats() if ws is not None else {}
+
+    def obs_batch(self, request_list, execution_type=BATCH_PARALLEL):
+        # several independent reads in one RequestBatch round trip, for the callers that handle their own errors
+        if not request_list:
+            return []
+        return self.ws.call_batch(request_list, execution_type)
+
+    def obs_call_batch(self, calls):
+        # (request, event) pairs in one round trip, executed in order: the requests held while OBS was down.
+        # Waits for the answer, so that the replay is done before the new requests go out
+        if len(calls) < 2:
+            for request, event in calls:
+                self.obs_call(request, event)
+            return
+        if not self.supervisor.is_up("obs"):
+            for request, event in calls:
+                self.supervisor.hold(request, event)
+            return
+        call_start = time.perf_counter()
+        try:
+            self.ws.call_batch([request for request, event in calls], BATCH_SERIAL_REALTIME)
+        except Exception as e:
+            self.supervisor.link_lost("obs", e)
+            for request, event in calls:
+                self.supervisor.hold(request, event)
+            return
+        acked = time.perf_counter()
+        for request, event in calls:
+            if event is not None:
+                self.latency.track(event, call_start, acked)
+
+    def init_handlers(self):
+        for command, request in (("StartRecord", requests.StartRecord), ("StopRecord", requests.StopRecord),
+                                 ("GetStreamStatus", requests.GetStreamStatus), ("StartStream", requests.StartStream),
+                                 ("StopStream", requests.StopStream)):
+            self.register_handler(command, lambda event, request=request: request())
+        self.register_handler("ChangeScene", self.handle_change_scene)
+        self.register_handler("SetInputVolume", self.handle_set_input_volume)
+        self.register_handler("ExecuteScript", self.handle_execute_script)
+
+    def register_handler(self, command, handler):
+        # handler(event) returns the OBS request for the event, or None when the event is handled locally
+        self.handlers[command] = handler
+
+    def update_mapping(self):
+        # resolves settings['mapping'] once: call it again whenever the mapping or the scripts change
+        mapping = dict(self.app.settings.settings['mapping'])
+        for deck_id, config in self.app.settings.settings.get('decks', {}).items():
+            mapping.update({f"{deck_id}:{pin}": value for pin, value in config.get('mapping', {}).items()})
+        repress_modes = self.controller_setting('script_repress', {})
+        scripts = {}
+        for pin, script_name in mapping.items():
+            if not pin.rpartition(":")[2].startswith("G") or script_name is None:
+                continue
+            try:
+                compiled = scripting.compile_script(self.app.settings.settings['script'][script_name], script_name)
+            except (KeyError, ValueError) as e:
+                print(f"script {script_name} error: {e}")
+                continue
+            scripts[pin] = (compiled, repress_modes.get(pin, repress_modes.get('default', 'restart')))
+        self.pin_map, self.pin_scripts = mapping, scripts
+
+    def event_request(self, event):
+        handler = self.handlers.get(event.command)
+        if handler is None:
+            print(f"unknown command: {event}")
+            return None
+        return handler(event)
+
+    def handle_change_scene(self, event):
+        scene_name = self.pin_map.get(event.args[0])
+        if scene_name is None:
+            return None
+        print(event)
+        return requests.SetCurrentProgramScene(sceneName=scene_name)
+
+    def handle_set_input_volume(self, event):
+        pin = event.args[0]
+        raw = int(event.args[1])
+        if self.calibration is not None:
+            self.calibration.record(pin, raw)
+        value = self.filter_pot(pin, raw, event.received)
+        if value is None:
+            return None
+        event.args = [pin, value]
+        self.volume_coalescer.submit(pin, event)
+        return None
+
+    def handle_execute_script(self, event):
+        script = self.pin_scripts.get(event.args[0])
+        if script is None:
+            return None
+        self.script_runner.submit(event.args[0], *script)
+        self.latency.track(event)
+        return None
+
+    def event_handler(self, event):
+        request = self.event_request(event)
+        if request is not None:
+            self.obs_submit(request, event)
+
+    def due_volume_requests(self):
+        now = time.monotonic()
+        for pin, event in self.volume_coalescer.pop_due(now):
+            # unmapped pins first: accept() counts the value as sent
+            volume_name = self.pin_map.get(pin)
+            if volume_name is None:
+                continue
+            volume_ser = int(event.args[1])
+            volume_value, self.pot_value = self.pot_to_fader(volume_ser, pin)
+            if not self.volume_coalescer.accept(pin, self.pot_value, now):
+                continue
+            print(f"SetInputVolume {pin} {volume_ser}:{self.pot_value} dB")
+            yield requests.SetInputVolume(inputName=volume_name, inputVolumeDb=self.pot_value), event
+
+    def flush_volumes(self):
+        # while OBS is down the coalescer keeps the latest value of every pot, there is nothing to hold
+        if not self.supervisor.is_up("obs"):
+            return
+        # one request per input: they overlap in the pipeline and each input keeps its order
+        for request, event in self.due_volume_requests():
+            self.obs_submit(request, event)
 
     def main_task(self):
         while self.run:
+            self.obs_call_batch(self.supervisor.take_held())
+            timeout = self.dispatch_timeout()
+            try:
+                event = self.ser_queue.get(timeout=1 if timeout is None else timeout)
+            except queue.Empty:
+                event = None
             try:
-                self.event_handler()
+                if event is not None:
+                    event.dispatched = time.perf_counter()
+                    self.count_ser("dispatched")
+                    self.event_handler(event)
+                self.settle_pots()
+                self.flush_volumes()
             except Exception as e:
+                # link losses are handled by the supervisor, a failing handler only loses its own event
                 print(e)
-                self.stop()
-            time.sleep(0.01)
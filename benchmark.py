@@ -0,0 +1,550 @@
+import os
+import sys
+import math
+import time
+import threading
+import contextlib
+import scripting
+import fader
+import potfilter
+import recorder
+import discovery
+import emulator
+import StreamDeckController
+import AsyncStreamDeckController
+from obswebsocket import requests
+
+
+class NullBackend:
+    # stands in for pyautogui so that only the cost of the code around the key events is measured
+    PAUSE = 0
+
+    def __init__(self):
+        self.calls = 0
+
+    def press(self, key):
+        self.calls += 1
+
+    def keyDown(self, key):
+        self.calls += 1
+
+    def keyUp(self, key):
+        self.calls += 1
+
+    def write(self, text, interval=0.0):
+        self.calls += 1
+
+
+def legacy_execute_script(script):
+    # interpret-every-time engine the compiled scripts replaced, kept as the baseline
+    for command in script:
+        if "press " in command:
+            scripting.pyautogui.press(command[len("press "):])
+        elif "hold " in command:
+            scripting.pyautogui.keyDown(command[len("hold "):])
+        elif "release " in command:
+            scripting.pyautogui.keyUp(command[len("release "):])
+        elif "combo " in command:
+            keys = command.split("$")
+            for key in keys:
+                scripting.pyautogui.keyDown(key)
+            for key in keys:
+                scripting.pyautogui.keyUp(key)
+        elif "write " in command:
+            command_tmp = ""
+            for char in command[len("write "):]:
+                command_tmp += "$" + char
+            keys = command_tmp.split("$")
+            for key in keys:
+                scripting.pyautogui.keyDown(key)
+            for key in keys:
+                scripting.pyautogui.keyUp(key)
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def report(name, rows):
+    print(f"--- {name} ---")
+    for label, value in rows:
+        print(f"{label:<50}{value}")
+
+
+def bench_script_engine(commands=100, length=400, repeat=20):
+    text = ("lorem ipsum dolor sit amet " * length)[:length]
+    script = [f"write {text}" if i % 4 else "press enter" for i in range(commands)]
+    backend = NullBackend()
+    saved_backend, saved_chunk = scripting.pyautogui, scripting.typing_chunk
+    scripting.pyautogui = backend
+    try:
+        legacy = timed(lambda: legacy_execute_script(script), repeat)
+        legacy_calls = backend.calls // repeat
+        # interpreted vs compiled with the write batching off on both sides, then the batching on its own
+        scripting.typing_chunk = 0
+        backend.calls = 0
+        compile_once = timed(lambda: scripting.compile_script(script, "bench"), 1)
+        compiled = timed(lambda: scripting.run_compiled(scripting.compile_script(script, "bench")), repeat)
+        compiled_calls = backend.calls // repeat
+        scripting.typing_chunk = saved_chunk
+        backend.calls = 0
+        batched = timed(lambda: scripting.run_compiled(scripting.compile_script(script, "bench")), repeat)
+        batched_calls = backend.calls // repeat
+    finally:
+        scripting.pyautogui = saved_backend
+        scripting.typing_chunk = saved_chunk
+    report("script engine", [
+        (f"script ({commands} commands, write of {length} chars)", ""),
+        ("interpret every run [ms]", round(legacy * 1000, 3)),
+        ("compile once [ms]", round(compile_once * 1000, 3)),
+        ("run compiled, no write batching [ms]", round(compiled * 1000, 3)),
+        ("speedup (compiling)", round(legacy / compiled, 2)),
+        (f"run compiled, writes in chunks of {saved_chunk} [ms]", round(batched * 1000, 3)),
+        ("speedup (compiling + batching)", round(legacy / batched, 2)),
+        ("backend calls per run (interpreted)", legacy_calls),
+        ("backend calls per run (compiled)", compiled_calls),
+        ("backend calls per run (compiled, batched)", batched_calls),
+        ("typing [chars/s]", round(scripting.get_typing_stats()["chars_per_second"])),
+    ])
+
+
+def legacy_draw_ray_by_value(widget, value):
+    # delete / create per update, the redraw the persistent ray replaced
+    widget.delete("ray")
+    angle_degrees = widget.calculate_angle_by_value(value)
+    return widget.create_line(widget.center_x, widget.center_y, *widget.calculate_endpoint(angle_degrees),
+                              width=8, fill="black", tags="ray")
+
+
+def bench_potentiometer(widgets=16, rounds=300, pot_func="logarithmic"):
+    import tkinter as tk
+    try:
+        import PotentiometerWidget
+        root = tk.Tk()
+    except (ImportError, tk.TclError) as e:
+        report("potentiometer widget", [("skipped", e)])
+        return
+    root.withdraw()
+    knobs = []
+    for i in range(widgets):
+        knob = PotentiometerWidget.PotentiometerWidget(root, radius=40, pot_func=pot_func)
+        knob.grid(row=i // 4, column=i % 4)
+        knobs.append(knob)
+    root.update()
+    for knob in knobs:
+        knob.setup(type("Event", (), {"width": 80, "height": 80}))
+    # every knob sweeps up and down, like a pot being turned
+    values = [abs((step * 7) % 2000 - 1000) for step in range(rounds)]
+
+    def run(draw):
+        start = time.perf_counter()
+        for value in values:
+            for i, knob in enumerate(knobs):
+                draw(knob, (value + i * 37) % 1001)
+            root.update_idletasks()
+        return time.perf_counter() - start
+
+    last_item = [0]
+
+    def legacy(knob, value):
+        last_item[0] = legacy_draw_ray_by_value(knob, value)
+    legacy_time = run(legacy)
+    for knob in knobs:
+        knob.setup(type("Event", (), {"width": 80, "height": 80}))
+        knob.stats = {"draws": 0, "skipped": 0}
+    incremental_time = run(lambda knob, value: knob.draw_ray_by_value(value))
+    updates = widgets * rounds
+    draws = sum(knob.stats["draws"] for knob in knobs)
+    skipped = sum(knob.stats["skipped"] for knob in knobs)
+    root.destroy()
+    report("potentiometer widget", [
+        ("scenario", f"{widgets} widgets x {rounds} updates, {pot_func}"),
+        ("delete / create [updates/s]", round(updates / legacy_time)),
+        ("coords() + angle table [updates/s]", round(updates / incremental_time)),
+        ("speedup", round(legacy_time / incremental_time, 2)),
+        ("canvas item id after delete / create", last_item[0]),
+        ("redraws / skipped (same angle)", f"{draws} / {skipped}"),
+    ])
+
+
+def legacy_pot_to_fader(pot_value):
+    # two log10 per event, the conversion the fader tables replaced
+    min_pot = 94
+    max_pot = 1022
+    if pot_value <= min_pot:
+        return min_pot, -100
+    elif pot_value >= max_pot:
+        return max_pot, 0
+    return pot_value, math.log10(pot_value - min_pot + 1) / math.log10(max_pot - min_pot + 1) * 100 - 100
+
+
+def bench_fader(repeat=200):
+    values = list(range(fader.TABLE_SIZE))
+    legacy = timed(lambda: [legacy_pot_to_fader(value) for value in values], repeat)
+    build = timed(lambda: fader.build_table(fader.default_profile), 1)
+    table = fader.get_table(fader.default_profile)
+    lookup = timed(lambda: [fader.to_db(table, value) for value in values], repeat)
+    error = max(abs(legacy_pot_to_fader(value)[1] - fader.to_db(table, value)) for value in values)
+    report("fader curve", [
+        ("log10 per event [ns/event]", round(legacy / len(values) * 1e9)),
+        ("table lookup [ns/event]", round(lookup / len(values) * 1e9)),
+        ("table build [ms]", round(build * 1000, 3)),
+        ("max difference from log10 [dB]", round(error, 3)),
+        ("distinct dB values (int() before / table)", f"{len(set(int(legacy_pot_to_fader(v)[1]) for v in values))} / {len(set(table))}"),
+    ])
+
+
+def bench_pot_filter(duration=5.0, rate=50):
+    # pot 0 and 1 are idle with ADC noise, pot 2 is turned back and forth, pot 3 is turned then left alone
+    traffic = emulator.merge(emulator.pot_noise(0, rate, duration),
+                             emulator.pot_noise(1, rate, duration, value=900, amplitude=10, seed=1),
+                             emulator.pot_sweep(2, rate, duration),
+                             emulator.pot_sweep(3, rate, duration / 2, period=duration),
+                             emulator.pot_noise(3, rate, duration / 2, value=1023 // 2, start=duration / 2, seed=3))
+    rows = [("scenario", f"4 pots @ {rate}/s for {duration} s: 2 idle, 1 turning, 1 turned then idle")]
+    for name in ("none", "ema", "one_euro"):
+        config = {"type": name} if name != "none" else {"type": "none", "band": 1}
+        stats = potfilter.run_trace(traffic, {"default": config})
+        forwarded = "/".join(str(stats[f"P{pin}"]["forwarded"]) for pin in range(4))
+        suppressed = sum(pin_stats["suppressed"] for pin_stats in stats.values())
+        samples = sum(pin_stats["samples"] for pin_stats in stats.values())
+        rows.append((f"{name}: forwarded P0/P1/P2/P3", forwarded))
+        rows.append((f"{name}: suppressed / samples", f"{suppressed} / {samples}"))
+    report("pot filter", rows)
+
+
+def start_pipeline(rtt, protocol_name="binary", engine="thread", trace_file=None, boot=0.1):
+    server = emulator.FakeObsServer(rtt=rtt).start()
+    device = emulator.DeviceEmulator().start()
+    app = emulator.HeadlessApp(port=server.port, com_port=device.port, protocol_name=protocol_name)
+    app.settings.settings['controller']['trace_file'] = trace_file
+    if engine == "asyncio":
+        sdc = AsyncStreamDeckController.AsyncStreamDeckController(app)
+    else:
+        sdc = StreamDeckController.StreamDeckController(app)
+    device.boot(boot)
+    if not sdc.connect():
+        raise RuntimeError("pipeline start error")
+    return server, device, sdc
+
+
+def stop_pipeline(server, device, sdc):
+    sdc.stop()
+    device.stop()
+    server.stop()
+
+
+def bench_bring_up(boot=1.6, rtt=0.002):
+    # boot: Arduino Uno bootloader after the reset caused by opening the port
+    rows = [("scenario", f"device boot {boot} s, rtt {rtt * 1000} ms")]
+    for engine in ("thread", "asyncio"):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            server, device, sdc = start_pipeline(rtt, engine=engine, boot=boot)
+            timings = dict(sdc.connect_timings)
+            stop_pipeline(server, device, sdc)
+        for phase, seconds in timings.items():
+            rows.append((f"{engine}: {phase} [s]", seconds))
+    # sleep(1) + OBS connect + open + sleep(2) + start, one after the other
+    rows.append(("sequential bring-up with fixed sleeps [s]", round(1 + timings["obs_connect"] + timings["serial_open"] + 2 + timings["start_handshake"], 3)))
+    report("bring-up", rows)
+
+
+def bench_discovery(boot=1.6, repeat=50):
+    # the old connection page called comports() every 10 ms tick, the discovery service checks /dev once per scan_interval
+    import serial.tools.list_ports
+    comports = timed(serial.tools.list_ports.comports, repeat)
+    deck = emulator.DeviceEmulator().start()
+    # a pty nobody answers on: any other serial adapter
+    other = emulator.DeviceEmulator()
+    service = discovery.DeviceDiscovery({"extra_ports": [], "probe_timeout": 2 * boot})
+    service.check()
+    check = timed(service.check, repeat)
+    # hotplug: both ports appear, the deck boots after the probe opens it
+    service.config["extra_ports"] = [deck.port, other.port]
+    deck.boot(boot)
+    start = time.perf_counter()
+    service.check()
+    identified = time.perf_counter() - start
+    decks = [device["port"] for device in service.get_devices()]
+    others = [device["port"] for device in service.get_devices(decks_only=False) if not device["is_deck"]]
+    identity = service.get_devices()[0]["identity"] if decks else None
+    rescan = timed(service.check, repeat)
+    deck.stop()
+    other.stop()
+    report("device discovery", [
+        ("comports() [ms/call]", round(comports * 1000, 3)),
+        ("comports() every 10 ms tick [ms cpu/s]", round(comports * 100 * 1000, 1)),
+        ("check, no hotplug, once per second [ms cpu/s]", round(check * 1000, 3)),
+        ("hotplug scan + parallel probes [s]", round(identified, 3)),
+        ("deck identified / silent adapter rejected", f"{identity} / {other.port in others}"),
+        ("check after the probes [ms/call]", round(rescan * 1000, 3)),
+        ("stats", service.get_stats()),
+    ])
+
+
+def bench_batch(sizes=(4, 16, 64), rtt=0.02, repeat=5):
+    # reading N input volumes: N ws.call round trips against one RequestBatch, and the connect-time state sync
+    rows = [("scenario", f"GetInputVolume for N inputs, rtt {rtt * 1000} ms, best of {repeat}")]
+    for engine in ("thread", "asyncio"):
+        for size in sizes:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                server = emulator.FakeObsServer(rtt=rtt, inputs=[f"Input {i}" for i in range(size)]).start()
+                app = emulator.HeadlessApp(port=server.port)
+                if engine == "asyncio":
+                    sdc = AsyncStreamDeckController.AsyncStreamDeckController(app)
+                else:
+                    sdc = StreamDeckController.StreamDeckController(app)
+                if not sdc.connect_obs_web_socket():
+                    raise RuntimeError("obs connect error")
+                names = [f"Input {i}" for i in range(size)]
+                single = min(timed(lambda: [sdc.ws.call(requests.GetInputVolume(inputName=name)) for name in names], 1)
+                             for _ in range(repeat))
+                batch = min(timed(lambda: sdc.obs_batch([requests.GetInputVolume(inputName=name) for name in names]), 1)
+                            for _ in range(repeat))
+                sync = min(timed(sdc.sync_obs_state, 1) for _ in range(repeat))
+                volumes = len(sdc.get_obs_state()["volumes"])
+                sdc.stop_obsws()
+                server.stop()
+            rows.append((f"{engine} N={size}: single calls / batch [ms]", f"{round(single * 1000, 1)} / {round(batch * 1000, 1)}"))
+            # before the batches: 4 calls + one per input
+            rows.append((f"{engine} N={size}: state sync [ms] / volumes", f"{round(sync * 1000, 1)} (was ~{round((4 + size) * rtt * 1000)}) / {volumes}"))
+    report("OBS request batches", rows)
+
+
+def bench_obs_window(duration=3.0, pots=4, pot_rate=100, button_rate=20, rtt=0.03, windows=(1, 8)):
+    # remote OBS: with one request at a time the dispatcher waits a round trip per action, with a window
+    # the requests on different inputs / outputs overlap and only the ones on the same target wait for each other
+    traffic = emulator.merge(*[emulator.pot_sweep(pin, pot_rate, duration, period=1.0 + pin * 0.1) for pin in range(pots)],
+                             emulator.button_storm(button_rate, duration))
+    rows = [("scenario", f"{pots} pots @ {pot_rate}/s, buttons @ {button_rate}/s, rtt {rtt * 1000} ms, OBS jitter {rtt * 500} ms")]
+    for engine in ("thread", "asyncio"):
+        for window in windows:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                server = emulator.FakeObsServer(rtt=rtt, jitter=rtt / 2).start()
+                device = emulator.DeviceEmulator().start()
+                app = emulator.HeadlessApp(port=server.port, com_port=device.port)
+                app.settings.settings['controller']['obs_window'] = window
+                if engine == "asyncio":
+                    sdc = AsyncStreamDeckController.AsyncStreamDeckController(app)
+                else:
+                    sdc = StreamDeckController.StreamDeckController(app)
+                device.boot(0.05)
+                if not sdc.connect():
+                    raise RuntimeError("pipeline start error")
+                start = time.perf_counter()
+                device.replay(traffic)
+                drained = wait_drained(sdc)
+                elapsed = time.perf_counter() - start
+                latency = sdc.get_latency_stats()
+                obs_stats = sdc.get_obs_stats()
+                ser_stats = sdc.get_ser_stats()
+                volume_stats = sdc.get_volume_stats()
+                sdc.stop()
+                device.stop()
+                server.stop()
+            name = f"{engine} window {window}"
+            for command in ("ChangeScene", "SetInputVolume"):
+                total = latency.get(command, {}).get("total", {})
+                rows.append((f"{name}: {command} total p50/p99 [ms]", f"{total.get('p50')} / {total.get('p99')}"))
+            rows.append((f"{name}: volumes sent / stale", f"{volume_stats['sent']} / {volume_stats['stale']}"))
+            rows.append((f"{name}: events / drained / after [s]", f"{ser_stats['dispatched']} / {drained} / {round(elapsed - duration, 3)}"))
+            rows.append((f"{name}: max in flight / chained", f"{obs_stats['max_in_flight']} / {obs_stats['chained']}"))
+    report("OBS request pipeline", rows)
+
+
+def bench_multi_deck(burst=20000, button_rate=50, rtt=0.002):
+    # deck "main" dumps a burst of pot values as fast as the pty takes them, deck "desk2" presses buttons meanwhile:
+    # with one FIFO lane the buttons queue behind the burst, with one lane per deck they wait for one turn
+    pot_burst = [(0, f"SetInputVolume P{i % 4} {(i * 7) % 1024}") for i in range(burst)]
+    rows = [("scenario", f"main: {burst} pot events at once, desk2: buttons @ {button_rate}/s, rtt {rtt * 1000} ms")]
+    for engine in ("thread", "asyncio"):
+        for fair in (False, True):
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                server = emulator.FakeObsServer(rtt=rtt).start()
+                main_deck = emulator.DeviceEmulator().start()
+                desk2 = emulator.DeviceEmulator().start()
+                app = emulator.HeadlessApp(port=server.port, com_port=main_deck.port)
+                app.settings.settings['controller']['fair_dispatch'] = fair
+                app.settings.settings['decks'] = {"desk2": {"com_port": desk2.port, "baud_rate": 115200,
+                                                            "mapping": {"B0": "Scene 0", "B1": "Scene 1"}}}
+                if engine == "asyncio":
+                    sdc = AsyncStreamDeckController.AsyncStreamDeckController(app)
+                else:
+                    sdc = StreamDeckController.StreamDeckController(app)
+                main_deck.boot(0.05)
+                desk2.boot(0.05)
+                if not sdc.connect():
+                    raise RuntimeError("pipeline start error")
+                time.sleep(0.2)
+                buttons = emulator.button_storm(button_rate, burst / 20000, commands=["ChangeScene B0", "ChangeScene B1"])
+                presser = threading.Thread(target=desk2.replay, args=(buttons,))
+                start = time.perf_counter()
+                presser.start()
+                main_deck.replay(pot_burst, speed=0)
+                presser.join()
+                wait_drained(sdc)
+                elapsed = time.perf_counter() - start
+                latency = sdc.get_latency_stats().get("ChangeScene", {}).get("queue", {})
+                ser_stats = sdc.get_ser_stats()
+                sdc.stop()
+                main_deck.stop()
+                desk2.stop()
+                server.stop()
+            name = f"{engine} {'lanes' if fair else 'fifo'}"
+            rows.append((f"{name}: button queue p50/p95/p99 [ms]", f"{latency.get('p50')} / {latency.get('p95')} / {latency.get('p99')}"))
+            rows.append((f"{name}: events / backpressure / time [s]", f"{ser_stats['dispatched']} / {ser_stats['backpressure']} / {round(elapsed, 3)}"))
+    report("multi deck fairness", rows)
+
+
+def bench_priority(burst=20000, button_every=400, rtt=0.002):
+    # one deck sends a burst of pot values with a scene button every button_every events: first come first served
+    # the button waits for the pots queued before it, by priority class it goes out next
+    traffic = []
+    for i in range(burst):
+        traffic.append((0, f"SetInputVolume P{i % 4} {(i * 7) % 1024}"))
+        if i % button_every == button_every // 2:
+            traffic.append((0, f"ChangeScene B{(i // button_every) % 2}"))
+    rows = [("scenario", f"{burst} pot events at once, a scene button every {button_every}, rtt {rtt * 1000} ms")]
+    for engine in ("thread", "asyncio"):
+        for classes in ([], StreamDeckController.default_priority["classes"]):
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                server = emulator.FakeObsServer(rtt=rtt).start()
+                device = emulator.DeviceEmulator().start()
+                app = emulator.HeadlessApp(port=server.port, com_port=device.port)
+                app.settings.settings['controller']['priority'] = dict(StreamDeckController.default_priority, classes=classes)
+                if engine == "asyncio":
+                    sdc = AsyncStreamDeckController.AsyncStreamDeckController(app)
+                else:
+                    sdc = StreamDeckController.StreamDeckController(app)
+                device.boot(0.05)
+                if not sdc.connect():
+                    raise RuntimeError("pipeline start error")
+                time.sleep(0.2)
+                start = time.perf_counter()
+                device.replay(traffic, speed=0)
+                wait_drained(sdc)
+                elapsed = time.perf_counter() - start
+                latency = sdc.get_latency_stats()
+                priority_stats = sdc.get_priority_stats()
+                ser_stats = sdc.get_ser_stats()
+                sdc.stop()
+                device.stop()
+                server.stop()
+            name = f"{engine} {'priority' if classes else 'fifo'}"
+            for label, command in (("scene", "ChangeScene"), ("volume", "SetInputVolume")):
+                queued = latency.get(command, {}).get("queue", {})
+                rows.append((f"{name}: {label} queue p50/p95/p99 [ms]", f"{queued.get('p50')} / {queued.get('p95')} / {queued.get('p99')}"))
+            rows.append((f"{name}: events / backpr. / time [s]", f"{ser_stats['dispatched']} / {ser_stats['backpressure']} / {round(elapsed, 3)}"))
+            if classes:
+                rows.append((f"{name}: volume served / promoted", f"{priority_stats['volume']['served']} / {priority_stats['volume']['promoted']}"))
+    report("priority dispatch", rows)
+
+
+def wait_drained(sdc, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        stats = sdc.get_ser_stats()
+        if stats["depth"] == 0 and not sdc.volume_coalescer.pending and sdc.dispatch_timeout() is None and not sdc.obs_in_flight():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def measure_pipeline(feed, scenario, rtt=0.002, protocol_name="binary", engine="thread", trace_file=None):
+    # feed(device) sends the traffic, the rest of the run is the same for synthetic traffic and trace replays
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        server, device, sdc = start_pipeline(rtt, protocol_name, engine, trace_file)
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        feed(device)
+        drained = wait_drained(sdc)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        ser_stats = sdc.get_ser_stats()
+        volume_stats = sdc.get_volume_stats()
+        filter_stats = sdc.get_filter_stats().values()
+        latency = sdc.get_latency_stats()
+        stop_start = time.perf_counter()
+        sdc.stop()
+        stop_time = time.perf_counter() - stop_start
+        stop_pipeline(server, device, sdc)
+        ack_stats = sdc.get_ack_stats()
+    rows = [
+        ("scenario", f"{scenario}, rtt {rtt * 1000} ms, {protocol_name}, {engine}"),
+        ("events received by the controller", ser_stats["received"]),
+        ("events dispatched", ser_stats["dispatched"]),
+        ("dispatch throughput [events/s]", round(ser_stats["dispatched"] / elapsed)),
+        ("queue backpressure / overflow", f"{ser_stats['backpressure']} / {ser_stats['overflow']}"),
+        ("pot filter forwarded / suppressed", f"{sum(stats['forwarded'] for stats in filter_stats)} / {sum(stats['suppressed'] for stats in filter_stats)}"),
+        ("volume sent / stale / unchanged", f"{volume_stats['sent']} / {volume_stats['stale']} / {volume_stats['unchanged']}"),
+        ("OBS requests", sum(server.stats.values())),
+        ("drained", drained),
+        ("elapsed [s]", round(elapsed, 3)),
+        ("process cpu time [s]", round(cpu, 3)),
+        ("stop [s]", round(stop_time, 3)),
+    ]
+    for command, stats in sorted(ack_stats.items()):
+        rows.append((f"ack {command} sent / retries / rtt p50 [ms]", f"{stats['sent']} / {stats['retries']} / {stats['rtt_p50']}"))
+    for command, metrics in sorted(latency.items()):
+        for metric, values in metrics.items():
+            rows.append((f"{command} {metric} p50/p95/p99 [ms]", f"{values['p50']} / {values['p95']} / {values['p99']}"))
+    report("controller pipeline", rows)
+
+
+def bench_pipeline(duration=5.0, pots=4, pot_rate=100, button_rate=0, rtt=0.002, protocol_name="binary", engine="thread", trace_file=None):
+    traffic = emulator.merge(*[emulator.pot_sweep(pin, pot_rate, duration, period=1.0 + pin * 0.1) for pin in range(pots)],
+                             emulator.button_storm(button_rate, duration))
+    measure_pipeline(device_feed(traffic), f"{pots} pots @ {pot_rate}/s, buttons @ {button_rate}/s", rtt, protocol_name, engine, trace_file)
+
+
+def device_feed(traffic):
+    return lambda device: device.replay(traffic)
+
+
+def bench_replay(path, speed=1.0, engine="thread", rtt=0.002):
+    # a recorded session (settings -> controller -> trace_file) played back through the deck emulator
+    speed = float(speed)
+    info = recorder.summary(path)
+    scenario = f"replay of {path} ({info['records']} records, {info['duration']} s) {'as fast as possible' if not speed else f'at {speed}x'}"
+    measure_pipeline(lambda device: recorder.replay(path, device.write, speed), scenario, rtt, engine=engine)
+
+
+def bench_record(path, duration=5.0):
+    # records the pots_and_buttons traffic, to have a trace to replay
+    bench_pipeline(duration=duration, pots=4, pot_rate=100, button_rate=50, trace_file=path)
+    print(f"trace {path}: {recorder.summary(path)}")
+
+
+benchmarks = {
+    "script_engine": bench_script_engine,
+    "potentiometer": bench_potentiometer,
+    "fader": bench_fader,
+    "pot_filter": bench_pot_filter,
+    "bring_up": bench_bring_up,
+    "discovery": bench_discovery,
+    "batch": bench_batch,
+    "obs_window": bench_obs_window,
+    "multi_deck": bench_multi_deck,
+    "priority": bench_priority,
+    "pots": lambda: bench_pipeline(pots=4, pot_rate=100),
+    "pots_and_buttons": lambda: bench_pipeline(pots=4, pot_rate=100, button_rate=50),
+    "pots_and_buttons_asyncio": lambda: bench_pipeline(pots=4, pot_rate=100, button_rate=50, engine="asyncio"),
+}
+
+
+def main(names):
+    # benchmark.py [name ...] | record <trace> | replay <trace> [speed (0 = max)] [engine]
+    if names and names[0] == "record":
+        bench_record(*names[1:])
+    elif names and names[0] == "replay":
+        bench_replay(*names[1:])
+    else:
+        for name in names or benchmarks.keys():
+            benchmarks[name]()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,17 @@
+import sys
+import types
+
+# scripting imports pyautogui at import time, which needs a display (KeyError 'DISPLAY' on a headless box) and
+# would press real keys: the tests run the scripts against this recorder instead
+pyautogui = types.ModuleType("pyautogui")
+pyautogui.PAUSE = 0
+pyautogui.calls = []
+
+
+def record(name):
+    return lambda *args, **kwargs: pyautogui.calls.append((name, args))
+
+
+for name in ("press", "keyDown", "keyUp", "write", "typewrite", "hotkey"):
+    setattr(pyautogui, name, record(name))
+sys.modules["pyautogui"] = pyautogui
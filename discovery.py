@@ -0,0 +1,188 @@
+# serial device discovery: a background thread notices ports appearing / disappearing and asks new ones who they are
+# the GUI only reads the cached list, comports() (sysfs / udev enumeration) runs only when /dev changed
+import os
+import time
+import threading
+import serial
+import serial.tools.list_ports
+
+default_config = {
+    "scan_interval": 1.0,       # seconds between two hotplug checks
+    "probe": True,              # send the firmware identity query to new candidate ports
+    "probe_timeout": 3.0,       # opening the port resets the board: bootloader + setup() + answer
+    "usb_ids": ["1a86:7523"],   # VID:PID of the adapters that can be a deck (CH340), the others are never opened
+    "extra_ports": [],          # ports comports() does not list (e.g. the emulator pty)
+}
+IDENTITY_PREFIX = "identify ok "
+# the firmware always talks at this rate, whatever the connection settings say
+FIRMWARE_BAUD_RATE = 115200
+
+
+def device_key(vid, pid, serial_number, port):
+    # the same adapter keeps its key across replugs and port renames when it reports a serial number
+    if vid is not None and serial_number:
+        return f"{vid:04x}:{pid:04x}:{serial_number}"
+    return port
+
+
+def probe(port, baud_rate=FIRMWARE_BAUD_RATE, timeout=3.0):
+    # returns the firmware identity ("streamdeck_emb 1.0") or None for anything that does not answer
+    deadline = time.monotonic() + timeout
+    try:
+        with serial.Serial(port, baud_rate, timeout=0.1) as ser:
+            buffer = b""
+            next_query = time.monotonic()
+            while time.monotonic() < deadline:
+                if time.monotonic() >= next_query:
+                    # boards that do not reset on open answer the first query, the others after "ready"
+                    ser.write(b"identify\n")
+                    next_query = time.monotonic() + 1.0
+                buffer += ser.read(ser.in_waiting or 1)
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    line = line.decode(errors="replace").strip()
+                    if line.startswith(IDENTITY_PREFIX):
+                        return line[len(IDENTITY_PREFIX):]
+                    if line == "ready":
+                        next_query = 0.0
+    except Exception as e:
+        print(f"probe {port}: {e}")
+    return None
+
+
+class DeviceDiscovery:
+    def __init__(self, config=None, baud_rate=FIRMWARE_BAUD_RATE, busy_ports=None, notify=None):
+        self.config = dict(default_config, **(config or {}))
+        self.baud_rate = baud_rate
+        # callable returning the ports the controller has open or may open: they are never probed
+        self.busy_ports = busy_ports
+        # called when the device list changed (version bumped)
+        self.notify = notify
+        self.lock = threading.Lock()
+        self.devices = {}
+        # key -> identity ("" when the port did not answer), kept after an unplug: a replugged deck is not reset again
+        self.identities = {}
+        self.version = 0
+        self.signature = None
+        self.running = False
+        self.wake = threading.Event()
+        self.stats = {"checks": 0, "scans": 0, "probes": 0, "probe_time": 0.0}
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            threading.Thread(target=self.scan_task, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+    def rescan(self):
+        self.signature = None
+        self.wake.set()
+
+    def scan_task(self):
+        while self.running:
+            try:
+                self.check()
+            except Exception as e:
+                print(f"discovery error: {e}")
+            self.wake.wait(float(self.config["scan_interval"]))
+            self.wake.clear()
+
+    def dev_signature(self):
+        # one listdir instead of a udev enumeration: adding or removing an adapter changes the names in /dev
+        # None where there is no /dev (windows): every check is a full scan, still only once per scan_interval
+        if not os.path.isdir("/dev"):
+            return None
+        try:
+            names = frozenset(os.listdir("/dev"))
+        except OSError:
+            return None
+        return names, tuple(os.path.exists(port) for port in self.config["extra_ports"])
+
+    def check(self):
+        self.stats["checks"] += 1
+        signature = self.dev_signature()
+        if signature is not None and signature == self.signature:
+            return False
+        self.scan()
+        # only once the scan went through: after an error the next check scans again
+        self.signature = signature
+        return True
+
+    def list_ports(self):
+        ports = []
+        for port_info in serial.tools.list_ports.comports():
+            ports.append({"port": port_info.device, "description": port_info.description, "hwid": port_info.hwid,
+                          "vid": port_info.vid, "pid": port_info.pid, "serial_number": port_info.serial_number})
+        for port in self.config["extra_ports"]:
+            if os.path.exists(port):
+                ports.append({"port": port, "description": "extra port", "hwid": "n/a",
+                              "vid": None, "pid": None, "serial_number": None})
+        for device in ports:
+            device["key"] = device_key(device["vid"], device["pid"], device["serial_number"], device["port"])
+        return ports
+
+    def is_candidate(self, device):
+        if device["port"] in self.config["extra_ports"]:
+            return True
+        if device["vid"] is not None and f"{device['vid']:04x}:{device['pid']:04x}" in self.config["usb_ids"]:
+            return True
+        return "CH340" in (device["description"] or "")
+
+    def scan(self):
+        self.stats["scans"] += 1
+        busy = set(self.busy_ports() if self.busy_ports is not None else [])
+        devices = {}
+        to_probe = []
+        for device in self.list_ports():
+            known = self.devices.get(device["key"])
+            if known is not None and known["port"] == device["port"] and known["identity"] is not None:
+                devices[device["key"]] = known
+                continue
+            device["candidate"] = self.is_candidate(device)
+            device["identity"] = self.identities.get(device["key"])
+            if device["identity"] is None and device["candidate"] and self.config["probe"] and device["port"] not in busy:
+                to_probe.append(device)
+            devices[device["key"]] = device
+        # one thread per new port: every board needs its own boot time before it can answer
+        threads = [threading.Thread(target=self.probe_device, args=(device,), daemon=True) for device in to_probe]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with self.lock:
+            changed = self.summarize(devices) != self.summarize(self.devices)
+            if changed:
+                self.version += 1
+            self.devices = devices
+        if changed and self.notify is not None:
+            self.notify()
+
+    def probe_device(self, device):
+        probe_start = time.perf_counter()
+        identity = probe(device["port"], self.baud_rate, float(self.config["probe_timeout"]))
+        with self.lock:
+            self.stats["probes"] += 1
+            self.stats["probe_time"] = round(self.stats["probe_time"] + time.perf_counter() - probe_start, 3)
+        device["identity"] = identity or ""
+        if device["key"] != device["port"]:
+            # only adapters with a serial number: whatever shows up next under a bare port name is asked again
+            self.identities[device["key"]] = device["identity"]
+
+    def summarize(self, devices):
+        return sorted((device["port"], device["identity"]) for device in devices.values())
+
+    def get_devices(self, decks_only=True):
+        # a deck answered the identity query; without probing (disabled or port busy) candidates are listed too
+        with self.lock:
+            devices = [dict(device) for device in self.devices.values()]
+        for device in devices:
+            device["is_deck"] = bool(device["identity"]) or (device["identity"] is None and device["candidate"])
+        return sorted((device for device in devices if device["is_deck"] or not decks_only), key=lambda device: device["port"])
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, devices=len(self.devices), version=self.version)
@@ -0,0 +1,513 @@
+# stand-ins for OBS Studio and for the arduino deck, used by benchmark.py to exercise StreamDeckController
+# without real hardware:
+# - FakeObsServer: in-process obs-websocket v5 server (no authentication) with a configurable round trip time
+# - DeviceEmulator: pty based serial device that answers like streamdeck_emb.ino and replays button / pot traffic
+import os
+import json
+import time
+import heapq
+import base64
+import socket
+import random
+import select
+import hashlib
+import threading
+import protocol
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+DEVICE_ID = "streamdeck_emb 1.0"
+
+
+class HeadlessSettings:
+    def __init__(self, settings):
+        self.settings = settings
+
+    def save_settings(self):
+        pass
+
+
+class HeadlessLogger:
+    def __init__(self, console=False):
+        self.console = console
+
+    def log(self, message):
+        if self.console:
+            print(message)
+
+    debug = info = warning = error = critical = log
+
+
+class HeadlessApp:
+    # what StreamDeckController needs from App.Application, without the GUI
+    def __init__(self, host="127.0.0.1", port=4455, com_port=None, protocol_name="binary", console=False):
+        self.logger = HeadlessLogger(console)
+        self.settings = HeadlessSettings({
+            'connection': {
+                'obs_data': {'host': host, 'port': port, 'password': ''},
+                'serial_data': {'com_port': com_port, 'baud_rate': 115200, 'protocol': protocol_name}
+            },
+            'controller': {},
+            'script': {'script': ['delay 0.01']},
+            'mapping': {
+                "B0": "Scene 0", "B1": "Scene 1", "B2": "Scene 2", "B3": "Scene 3",
+                "P0": "Mic", "P1": "Desktop", "P2": "Music", "P3": "Aux",
+                "G0": "script", "G1": "script", "G2": "script", "G3": "script"
+            }
+        })
+
+
+class WebSocketConnection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.buffer = b""
+
+    def handshake(self):
+        while b"\r\n\r\n" not in self.buffer:
+            data = self.sock.recv(4096)
+            if not data:
+                return False
+            self.buffer += data
+        header, self.buffer = self.buffer.split(b"\r\n\r\n", 1)
+        key = None
+        for line in header.decode().split("\r\n"):
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "sec-websocket-key":
+                key = value.strip()
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.sock.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                           f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        return True
+
+    def read_exact(self, size):
+        while len(self.buffer) < size:
+            data = self.sock.recv(65536)
+            if not data:
+                raise ConnectionError("connection closed")
+            self.buffer += data
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def recv(self):
+        # returns the text payload, None when the client closed the connection
+        while True:
+            first, second = self.read_exact(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = int.from_bytes(self.read_exact(2), "big")
+            elif length == 127:
+                length = int.from_bytes(self.read_exact(8), "big")
+            mask = self.read_exact(4) if second & 0x80 else None
+            payload = self.read_exact(length)
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == 0x8:
+                self.send_frame(0x8, payload[:2])
+                return None
+            if opcode == 0x9:
+                self.send_frame(0xA, payload)
+                continue
+            if opcode == 0x1:
+                return payload.decode()
+
+    def send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = bytes([0x80 | opcode, length])
+        elif length < 65536:
+            header = bytes([0x80 | opcode, 126]) + length.to_bytes(2, "big")
+        else:
+            header = bytes([0x80 | opcode, 127]) + length.to_bytes(8, "big")
+        with self.send_lock:
+            self.sock.sendall(header + payload)
+
+    def send(self, message):
+        self.send_frame(0x1, json.dumps(message).encode())
+
+
+class FakeObsServer:
+    def __init__(self, host="127.0.0.1", port=0, rtt=0.0, scenes=4, inputs=None, jitter=0.0):
+        self.host = host
+        self.rtt = rtt
+        # OBS runs requests on several threads: with jitter every request runs up to jitter seconds late,
+        # so requests sent back to back can be executed out of order
+        self.jitter = jitter
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.port = self.server.getsockname()[1]
+        self.running = False
+        self.refuse_until = 0.0
+        self.lock = threading.RLock()
+        self.connections = []
+        self.outbox = []
+        self.outbox_cond = threading.Condition()
+        self.sequence = 0
+        self.stats = {}
+        self.batches = 0
+        self.scenes = [f"Scene {i}" for i in range(scenes)]
+        self.current_scene = self.scenes[0]
+        self.record = False
+        self.stream = False
+        self.inputs = {}
+        for name in inputs or ["Mic", "Desktop", "Music", "Aux"]:
+            kind = "wasapi_input_capture" if name == "Mic" else "wasapi_output_capture"
+            self.inputs[name] = {"inputKind": kind, "inputVolumeMul": 1.0, "inputVolumeDb": 0.0}
+        self.handlers = {
+            "GetVersion": self.get_version,
+            "GetInputList": self.get_input_list,
+            "GetInputVolume": self.get_input_volume,
+            "SetInputVolume": self.set_input_volume,
+            "GetSceneList": self.get_scene_list,
+            "GetCurrentProgramScene": self.get_current_program_scene,
+            "SetCurrentProgramScene": self.set_current_program_scene,
+            "GetRecordStatus": self.get_record_status,
+            "StartRecord": self.start_record,
+            "StopRecord": self.stop_record,
+            "GetStreamStatus": self.get_stream_status,
+            "StartStream": self.start_stream,
+            "StopStream": self.stop_stream,
+        }
+
+    def start(self):
+        self.running = True
+        self.server.listen()
+        threading.Thread(target=self.accept_task, daemon=True).start()
+        threading.Thread(target=self.send_task, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        with self.outbox_cond:
+            self.outbox_cond.notify()
+        self.server.close()
+        for connection in list(self.connections):
+            try:
+                connection.sock.close()
+            except OSError:
+                pass
+
+    def drop_connections(self, down_for=0.0):
+        # OBS crash / network loss: every client is cut and new connections are refused for down_for seconds
+        self.refuse_until = time.monotonic() + down_for
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+                connection.sock.close()
+            except OSError:
+                pass
+
+    def accept_task(self):
+        while self.running:
+            try:
+                sock, address = self.server.accept()
+            except OSError:
+                break
+            if time.monotonic() < self.refuse_until:
+                sock.close()
+                continue
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self.connection_task, args=(WebSocketConnection(sock),), daemon=True).start()
+
+    def connection_task(self, connection):
+        try:
+            if not connection.handshake():
+                return
+            connection.send({"op": 0, "d": {"obsWebSocketVersion": "5.1.0", "rpcVersion": 1}})
+            identify = json.loads(connection.recv())
+            if identify.get("op") != 1:
+                return
+            connection.send({"op": 2, "d": {"negotiatedRpcVersion": 1}})
+            with self.lock:
+                self.connections.append(connection)
+            while self.running:
+                message = connection.recv()
+                if message is None:
+                    break
+                message = json.loads(message)
+                if message.get("op") == 6 and self.jitter:
+                    self.schedule(connection, lambda data=message["d"]: {"op": 7, "d": self.handle_request(data)},
+                                  random.uniform(0, self.jitter))
+                elif message.get("op") == 6:
+                    self.schedule(connection, {"op": 7, "d": self.handle_request(message["d"])})
+                elif message.get("op") == 8:
+                    self.schedule(connection, {"op": 9, "d": self.handle_batch(message["d"])})
+        except (OSError, ConnectionError, ValueError):
+            pass
+        finally:
+            with self.lock:
+                if connection in self.connections:
+                    self.connections.remove(connection)
+            try:
+                connection.sock.close()
+            except OSError:
+                pass
+
+    def schedule(self, connection, message, delay=0.0):
+        # responses leave after rtt, independently of each other, so that pipelined requests overlap
+        # (message can be a callable, run when the response is due)
+        with self.outbox_cond:
+            self.sequence += 1
+            heapq.heappush(self.outbox, (time.perf_counter() + self.rtt + delay, self.sequence, connection, message))
+            self.outbox_cond.notify()
+
+    def send_task(self):
+        while self.running:
+            with self.outbox_cond:
+                while self.running and (not self.outbox or self.outbox[0][0] > time.perf_counter()):
+                    self.outbox_cond.wait(None if not self.outbox else self.outbox[0][0] - time.perf_counter())
+                if not self.running:
+                    break
+                due, sequence, connection, message = heapq.heappop(self.outbox)
+            if callable(message):
+                message = message()
+            try:
+                connection.send(message)
+            except OSError:
+                pass
+
+    def emit(self, event_type, event_data):
+        message = {"op": 5, "d": {"eventType": event_type, "eventIntent": 1, "eventData": event_data}}
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            self.schedule(connection, message)
+
+    def handle_batch(self, data):
+        # RequestBatch: the whole batch answers after one rtt, whatever the execution type
+        self.batches += 1
+        results = []
+        for request in data.get("requests", []):
+            results.append(self.handle_request(request))
+            if data.get("haltOnFailure") and not results[-1]["requestStatus"]["result"]:
+                break
+        return {"requestId": data.get("requestId"), "results": results}
+
+    def handle_request(self, data):
+        request_type = data.get("requestType")
+        self.stats[request_type] = self.stats.get(request_type, 0) + 1
+        response = {"requestType": request_type, "requestId": data.get("requestId")}
+        handler = self.handlers.get(request_type)
+        if handler is None:
+            response["requestStatus"] = {"result": False, "code": 204, "comment": "unknown request"}
+            return response
+        try:
+            with self.lock:
+                response_data = handler(data.get("requestData") or {})
+        except KeyError as e:
+            response["requestStatus"] = {"result": False, "code": 600, "comment": f"resource not found: {e}"}
+            return response
+        response["requestStatus"] = {"result": True, "code": 100}
+        if response_data is not None:
+            response["responseData"] = response_data
+        return response
+
+    def get_version(self, data):
+        return {"obsVersion": "29.1.0", "obsWebSocketVersion": "5.1.0", "rpcVersion": 1}
+
+    def get_input_list(self, data):
+        return {"inputs": [{"inputName": name, "inputKind": value["inputKind"], "unversionedInputKind": value["inputKind"]}
+                           for name, value in self.inputs.items()]}
+
+    def get_input_volume(self, data):
+        value = self.inputs[data["inputName"]]
+        return {"inputVolumeMul": value["inputVolumeMul"], "inputVolumeDb": value["inputVolumeDb"]}
+
+    def set_input_volume(self, data):
+        value = self.inputs[data["inputName"]]
+        if "inputVolumeDb" in data:
+            value["inputVolumeDb"] = float(data["inputVolumeDb"])
+            value["inputVolumeMul"] = 10 ** (value["inputVolumeDb"] / 20) if value["inputVolumeDb"] > -100 else 0.0
+        else:
+            value["inputVolumeMul"] = float(data["inputVolumeMul"])
+        self.emit("InputVolumeChanged", {"inputName": data["inputName"], "inputVolumeMul": value["inputVolumeMul"],
+                                         "inputVolumeDb": value["inputVolumeDb"]})
+
+    def get_scene_list(self, data):
+        return {"currentProgramSceneName": self.current_scene, "scenes": [{"sceneName": name} for name in self.scenes]}
+
+    def get_current_program_scene(self, data):
+        return {"currentProgramSceneName": self.current_scene}
+
+    def set_current_program_scene(self, data):
+        if data["sceneName"] not in self.scenes:
+            raise KeyError(data["sceneName"])
+        self.current_scene = data["sceneName"]
+        self.emit("CurrentProgramSceneChanged", {"sceneName": self.current_scene})
+
+    def get_record_status(self, data):
+        return {"outputActive": self.record}
+
+    def start_record(self, data):
+        self.record = True
+        self.emit("RecordStateChanged", {"outputActive": True, "outputState": "OBS_WEBSOCKET_OUTPUT_STARTED"})
+
+    def stop_record(self, data):
+        self.record = False
+        self.emit("RecordStateChanged", {"outputActive": False, "outputState": "OBS_WEBSOCKET_OUTPUT_STOPPED"})
+
+    def get_stream_status(self, data):
+        return {"outputActive": self.stream}
+
+    def start_stream(self, data):
+        self.stream = True
+        self.emit("StreamStateChanged", {"outputActive": True, "outputState": "OBS_WEBSOCKET_OUTPUT_STARTED"})
+
+    def stop_stream(self, data):
+        self.stream = False
+        self.emit("StreamStateChanged", {"outputActive": False, "outputState": "OBS_WEBSOCKET_OUTPUT_STOPPED"})
+
+
+class DeviceEmulator:
+    # pty pair: the controller opens self.port like the real COM port, the emulator owns the master side
+    def __init__(self):
+        self.open_pty()
+        self.reader = None
+        self.running = False
+        self.started = False
+        self.binary = False
+        self.booting = False
+        self.write_lock = threading.Lock()
+        self.received = []
+        self.stats = {"sent": 0}
+
+    def start(self):
+        self.running = True
+        self.reader = threading.Thread(target=self.read_task, daemon=True)
+        self.reader.start()
+        return self
+
+    def open_pty(self):
+        import tty
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+    def stop(self):
+        self.running = False
+        # a blocked read keeps the master open after close(): let the reader see running = False first
+        if self.reader is not None and threading.current_thread() is not self.reader:
+            self.reader.join(1.0)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def unplug(self):
+        # USB cable pulled: the host read fails, the port disappears
+        self.stop()
+
+    def replug(self, boot_delay=0.1):
+        # the port comes back under a new name (a new pty), the board boots and says "ready"
+        # the emulator cannot see when the host opens the port (pyserial flushes what was sent before),
+        # so it repeats "ready" until the host talks to it
+        self.open_pty()
+        self.started = False
+        self.start()
+        threading.Thread(target=self.announce_task, args=(boot_delay,), daemon=True).start()
+        return self.port
+
+    def announce_task(self, interval):
+        self.received.clear()
+        while self.running and not self.received:
+            time.sleep(interval)
+            try:
+                self.write(b"ready\r\n")
+            except OSError:
+                return
+
+    def boot(self, delay=0.1):
+        # what the board does after the host opens the port: reset, bootloader, then "ready" from setup()
+        self.started = False
+        self.binary = False
+        self.booting = True
+        timer = threading.Timer(delay, self.booted)
+        timer.daemon = True
+        timer.start()
+
+    def booted(self):
+        self.booting = False
+        self.write(b"ready\r\n")
+
+    def write(self, data):
+        with self.write_lock:
+            os.write(self.master, data)
+
+    def read_task(self):
+        buffer = b""
+        while self.running:
+            try:
+                if not select.select([self.master], [], [], 0.1)[0]:
+                    continue
+                data = os.read(self.master, 1024)
+            except OSError:
+                break
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                self.handle_command(line.decode().strip())
+
+    def handle_command(self, line):
+        # same answers as streamdeck_emb.ino, nothing while the bootloader runs
+        if self.booting:
+            return
+        self.received.append(line)
+        if line == "start":
+            self.started, self.binary = True, False
+            self.write(b"start ok\r\n")
+        elif line == "start binary":
+            self.started, self.binary = True, True
+            self.write(b"start binary ok\r\n")
+        elif line == "stop":
+            self.started = False
+            self.write(b"stop ok\r\n")
+        elif line == "identify":
+            self.write(f"identify ok {DEVICE_ID}\r\n".encode())
+        elif line in ("RecordOnLed", "RecordOffLed", "StreamOnLed", "StreamOffLed", "DumbMode", "NormalOperation"):
+            self.write(f"{line} ok\r\n".encode())
+
+    def send_event(self, line):
+        if not self.started:
+            return False
+        self.write(protocol.encode_line(line) if self.binary else f"{line}\r\n".encode())
+        self.stats["sent"] += 1
+        return True
+
+    def replay(self, events, speed=1.0):
+        # events: list of (seconds from start, line)
+        start = time.perf_counter()
+        for offset, line in events:
+            delay = offset / speed - (time.perf_counter() - start) if speed else 0
+            if delay > 0:
+                time.sleep(delay)
+            self.send_event(line)
+
+
+def pot_sweep(pin, rate, duration, period=1.0, start=0.0):
+    # triangle sweep over the full pot range, the way the firmware reports a hand turning the knob back and forth
+    events = []
+    for i in range(int(rate * duration)):
+        offset = start + i / rate
+        phase = (offset / period) % 1.0
+        value = int((phase * 2 if phase < 0.5 else 2 - phase * 2) * 1023)
+        events.append((offset, f"SetInputVolume P{pin} {value}"))
+    return events
+
+
+def pot_noise(pin, rate, duration, value=512, amplitude=6, start=0.0, seed=0):
+    # idle knob: ADC noise around value, just above the firmware TOLERANCE so that it reaches the host
+    generator = random.Random(seed)
+    return [(start + i / rate, f"SetInputVolume P{pin} {value + generator.randint(-amplitude, amplitude)}")
+            for i in range(int(rate * duration))]
+
+
+def button_storm(rate, duration, start=0.0, commands=None, seed=0):
+    commands = commands or ["ChangeScene B0", "ChangeScene B1", "ChangeScene B2", "ChangeScene B3",
+                            "StartRecord", "StopRecord"]
+    generator = random.Random(seed)
+    return [(start + i / rate, generator.choice(commands)) for i in range(int(rate * duration))]
+
+
+def merge(*traffic):
+    return sorted((event for events in traffic for event in events), key=lambda event: event[0])
@@ -0,0 +1,101 @@
+# pot value (0-1023) -> OBS fader dB, precomputed per calibration profile so that a conversion is one index
+import math
+
+TABLE_SIZE = 1024
+MIN_DB = -100
+MAX_DB = 0
+DB_STEP = 0.1
+default_profile = {"min": 94, "max": 1022, "dead_zone": 0, "curve": "log"}
+
+
+def log_curve(position, span):
+    # the original pot_to_fader curve: log10 over the pot counts
+    return math.log10(position * span + 1) / math.log10(span + 1) * (MAX_DB - MIN_DB) + MIN_DB
+
+
+def linear_db_curve(position, span):
+    return position * (MAX_DB - MIN_DB) + MIN_DB
+
+
+def cubic_curve(position, span):
+    # OBS mixer fader: mul = position^3
+    if position <= 0:
+        return MIN_DB
+    return max(MIN_DB, 60 * math.log10(position))
+
+
+curves = {
+    "log": log_curve,
+    "linear_db": linear_db_curve,
+    "cubic": cubic_curve,
+}
+tables = {}
+
+
+def normalize_profile(profile):
+    profile = dict(default_profile, **(profile or {}))
+    if profile["curve"] not in curves:
+        raise ValueError(f"unknown fader curve {profile['curve']}")
+    if not 0 <= profile["min"] < profile["max"] < TABLE_SIZE:
+        raise ValueError(f"invalid fader range {profile['min']}-{profile['max']}")
+    return profile
+
+
+def build_table(profile):
+    profile = normalize_profile(profile)
+    low = profile["min"] + profile["dead_zone"]
+    high = max(low + 1, profile["max"] - profile["dead_zone"])
+    span = high - low
+    curve = curves[profile["curve"]]
+    table = []
+    for pot_value in range(TABLE_SIZE):
+        if pot_value <= low:
+            db = MIN_DB
+        elif pot_value >= high:
+            db = MAX_DB
+        else:
+            db = curve((pot_value - low) / span, span)
+        table.append(round(round(db / DB_STEP) * DB_STEP, 1))
+    return table
+
+
+def get_table(profile):
+    key = tuple(sorted(normalize_profile(profile).items()))
+    if key not in tables:
+        tables[key] = build_table(profile)
+    return tables[key]
+
+
+def to_db(table, pot_value):
+    if 0 <= pot_value < TABLE_SIZE:
+        return table[int(pot_value)]
+    return table[0] if pot_value < 0 else table[-1]
+
+
+class FaderCalibration:
+    # records the pot values seen during a full sweep of every pot and turns them into profiles
+    def __init__(self, pins=None):
+        self.pins = pins
+        self.ranges = {}
+
+    def record(self, pin, pot_value):
+        if self.pins is not None and pin not in self.pins:
+            return
+        low, high, count = self.ranges.get(pin, (pot_value, pot_value, 0))
+        self.ranges[pin] = (min(low, pot_value), max(high, pot_value), count + 1)
+
+    def record_events(self, events):
+        # events as produced by emulator.pot_sweep or a trace: (offset, "SetInputVolume P0 512")
+        for offset, line in events:
+            tokens = line.split()
+            if tokens[0] == "SetInputVolume":
+                self.record(tokens[1], int(tokens[2]))
+
+    def profiles(self, curve="log", dead_zone=6, min_span=100):
+        profiles = {}
+        for pin, (low, high, count) in self.ranges.items():
+            if high - low < min_span:
+                print(f"calibration {pin}: sweep too short ({low}-{high}), skipped")
+                continue
+            profiles[pin] = {"min": low, "max": high, "dead_zone": dead_zone, "curve": curve}
+        return profiles
@@ -0,0 +1,121 @@
+# host side jitter filter for the pot streams: smoothing (EMA or one-euro) + hysteresis band + settle detection
+# the firmware TOLERANCE only drops changes smaller than 5 counts, ADC noise around that threshold still reaches the host
+import math
+
+POT_MAX = 1023
+default_config = {
+    "type": "one_euro",     # "ema", "one_euro" or "none"
+    "alpha": 0.5,           # ema smoothing factor, 1 = no smoothing
+    "min_cutoff": 1.0,      # one-euro cutoff frequency at rest [Hz]
+    "beta": 0.05,           # one-euro cutoff increase with speed
+    "d_cutoff": 1.0,        # one-euro cutoff of the speed estimate [Hz]
+    "band": 3,              # hysteresis: forward only when the filtered value moved at least this many counts
+    "settle_time": 0.3,     # seconds without a move of settle_band counts after which the knob is considered at rest
+    "settle_band": 24,      # band used while the knob is at rest, wider than the idle noise (+-10 counts)
+}
+
+
+def smoothing_factor(cutoff, dt):
+    tau = 1 / (2 * math.pi * cutoff)
+    return 1 / (1 + tau / dt)
+
+
+class PotFilter:
+    def __init__(self, config=None):
+        self.config = dict(default_config, **(config or {}))
+        if self.config["type"] not in ("ema", "one_euro", "none"):
+            raise ValueError(f"unknown pot filter {self.config['type']}")
+        self.value = None
+        self.raw = None
+        self.speed = 0.0
+        self.last_time = None
+        self.forwarded = None
+        self.forwarded_time = None
+        # last forwarded change of at least settle_band: the noise forwarded within band does not restart the settle time
+        self.moved = None
+        self.moved_time = None
+        self.stats = {"samples": 0, "forwarded": 0, "suppressed": 0, "suppressed_settled": 0, "settled": 0}
+
+    def smooth(self, raw, now):
+        if self.value is None or self.config["type"] == "none":
+            self.value = float(raw)
+            return self.value
+        if self.config["type"] == "ema":
+            self.value += self.config["alpha"] * (raw - self.value)
+            return self.value
+        dt = max(now - self.last_time, 1e-4)
+        speed = (raw - self.value) / dt
+        self.speed += smoothing_factor(self.config["d_cutoff"], dt) * (speed - self.speed)
+        cutoff = self.config["min_cutoff"] + self.config["beta"] * abs(self.speed)
+        self.value += smoothing_factor(cutoff, dt) * (raw - self.value)
+        return self.value
+
+    def settled(self, now):
+        return self.moved_time is not None and now - self.moved_time >= self.config["settle_time"]
+
+    def update(self, raw, now):
+        # returns the value to forward, or None when the sample is only noise
+        self.stats["samples"] += 1
+        self.raw = raw
+        value = self.smooth(raw, now)
+        self.last_time = now
+        output = int(round(value))
+        if raw <= 0 or raw >= POT_MAX:
+            # smoothing never reaches the ends on its own: snap so that mute and 0 dB stay reachable
+            output = raw
+        if self.forwarded is not None:
+            settled = self.settled(now)
+            band = self.config["settle_band"] if settled else self.config["band"]
+            at_end = output in (0, POT_MAX) and output != self.forwarded
+            if abs(output - self.forwarded) < band and not at_end:
+                self.stats["suppressed"] += 1
+                if settled:
+                    self.stats["suppressed_settled"] += 1
+                return None
+        if self.moved is None or abs(output - self.moved) >= self.config["settle_band"] or output in (0, POT_MAX):
+            self.moved = output
+            self.moved_time = now
+        self.forwarded = output
+        self.forwarded_time = now
+        self.stats["forwarded"] += 1
+        return output
+
+    def flush_timeout(self, now):
+        # seconds until flush() has something to forward, None when the last raw value already went out
+        if self.raw is None or self.raw == self.forwarded:
+            return None
+        return max(0.0, self.last_time + self.config["settle_time"] - now)
+
+    def flush(self, now):
+        # the firmware sends nothing once the knob stops, so the smoothing never catches up on its own:
+        # settle_time after the last sample the last raw value is forwarded and the final position is exact
+        timeout = self.flush_timeout(now)
+        if timeout is None or timeout > 0:
+            return None
+        self.forwarded = self.raw
+        self.forwarded_time = now
+        self.value = float(self.raw)
+        self.stats["forwarded"] += 1
+        self.stats["settled"] += 1
+        return self.raw
+
+
+def pin_config(configs, pin):
+    # {"default": {...}, "P2": {...}} -> filter config for one pin
+    config = dict(configs.get("default", {}))
+    config.update(configs.get(pin, {}))
+    return config
+
+
+def run_trace(events, configs=None):
+    # replays a recorded trace (emulator traffic: (offset, "SetInputVolume P0 512")) through the filters, for tuning
+    filters = {}
+    for offset, line in events:
+        tokens = line.split()
+        if tokens[0] != "SetInputVolume":
+            continue
+        pin = tokens[1]
+        if pin not in filters:
+            filters[pin] = PotFilter(pin_config(configs or {}, pin))
+        filters[pin].update(int(tokens[2]), offset)
+    return {pin: dict(pot_filter.stats) for pin, pot_filter in filters.items()}
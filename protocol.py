@@ -0,0 +1,90 @@
+# compact framed protocol between streamdeck_emb.ino and StreamDeckController
+# frame: | 0xA5 | type | pin | value high | value low | checksum |   checksum = type ^ pin ^ value high ^ value low
+# text lines ("start ok", "RecordOnLed ok", ...) can still be interleaved with the frames: they are plain ascii,
+# so they never contain the start byte
+FRAME_START = 0xA5
+FRAME_SIZE = 6
+frame_types = {
+    0x01: "StartRecord",
+    0x02: "StopRecord",
+    0x03: "StartStream",
+    0x04: "StopStream",
+    0x05: "ChangeScene",
+    0x06: "SetInputVolume",
+    0x07: "ExecuteScript",
+}
+frame_codes = {command: code for code, command in frame_types.items()}
+pin_prefixes = {"ChangeScene": "B", "SetInputVolume": "P", "ExecuteScript": "G"}
+
+
+def checksum(frame_type, pin, value):
+    return frame_type ^ pin ^ (value >> 8) ^ (value & 0xFF)
+
+
+def encode_frame(command, pin=0, value=0):
+    frame_type = frame_codes[command]
+    return bytes([FRAME_START, frame_type, pin, value >> 8, value & 0xFF, checksum(frame_type, pin, value)])
+
+
+def encode_line(line):
+    # text line -> frame, as the firmware would send it in binary mode
+    tokens = line.split()
+    pin = int(tokens[1][1:]) if len(tokens) > 1 else 0
+    value = int(tokens[2]) if len(tokens) > 2 else 0
+    return encode_frame(tokens[0], pin, value)
+
+
+def decode_frame(frame):
+    frame_type, pin, high, low, check = frame[1], frame[2], frame[3], frame[4], frame[5]
+    value = (high << 8) | low
+    if frame_type not in frame_types or checksum(frame_type, pin, value) != check:
+        return None
+    command = frame_types[frame_type]
+    args = []
+    if command in pin_prefixes:
+        args.append(f"{pin_prefixes[command]}{pin}")
+        if command == "SetInputVolume":
+            args.append(value)
+    return command, args
+
+
+class FrameParser:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.stats = {"frames": 0, "lines": 0, "bad_frames": 0}
+
+    def feed(self, data):
+        # returns text lines as str and frames as (command, args)
+        self.buffer += data
+        items = []
+        buffer = self.buffer
+        i = 0
+        while i < len(buffer):
+            if buffer[i] == FRAME_START:
+                if len(buffer) - i < FRAME_SIZE:
+                    break
+                decoded = decode_frame(buffer[i:i + FRAME_SIZE])
+                if decoded is None:
+                    # corrupted frame: skip the start byte and resync on the next one
+                    self.stats["bad_frames"] += 1
+                    i += 1
+                    continue
+                self.stats["frames"] += 1
+                items.append(decoded)
+                i += FRAME_SIZE
+                continue
+            end = buffer.find(b"\n", i)
+            start = buffer.find(bytes([FRAME_START]), i)
+            if start != -1 and (end == -1 or start < end):
+                # bytes before a frame that are not a full line are noise from a resync
+                i = start
+                continue
+            if end == -1:
+                break
+            line = buffer[i:end].decode(errors="replace").strip()
+            if line:
+                self.stats["lines"] += 1
+                items.append(line)
+            i = end + 1
+        del buffer[:i]
+        return items
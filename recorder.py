@@ -0,0 +1,99 @@
+# serial trace: what the deck sent, byte for byte, with the time it was read
+# file: b"SDTRACE1\n" then records | time since previous record [us] uint32 | length uint16 | data |
+import os
+import sys
+import time
+import struct
+import threading
+
+MAGIC = b"SDTRACE1\n"
+RECORD_HEADER = struct.Struct("<IH")
+MAX_DELTA = 0xFFFFFFFF
+
+
+class TraceRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        if new_file:
+            self.file.write(MAGIC)
+        # appending to an old trace: the first record of this session starts right after the last one
+        self.last = None
+        self.stats = {"records": 0, "bytes": 0}
+
+    def record(self, data, now=None):
+        if not data:
+            return
+        now = time.perf_counter() if now is None else now
+        with self.lock:
+            if self.file is None:
+                return
+            delta = 0 if self.last is None else min(int((now - self.last) * 1e6), MAX_DELTA)
+            self.last = now
+            for i in range(0, len(data), 0xFFFF):
+                chunk = data[i:i + 0xFFFF]
+                self.file.write(RECORD_HEADER.pack(delta, len(chunk)) + chunk)
+                delta = 0
+            self.stats["records"] += 1
+            self.stats["bytes"] += len(data)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def deck_trace_path(path, deck_id):
+    # the trace of an extra deck goes next to the main one: "session.trace" -> "session.desk2.trace"
+    root, ext = os.path.splitext(path)
+    return f"{root}.{deck_id}{ext}"
+
+
+def read_trace(path):
+    # yields (seconds from the first record, data)
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a serial trace")
+        offset = 0.0
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            delta, length = RECORD_HEADER.unpack(header)
+            data = file.read(length)
+            if len(data) < length:
+                return
+            offset += delta / 1e6
+            yield offset, data
+
+
+def replay(path, write, speed=1.0):
+    # feeds a trace to write (DeviceEmulator.write, or StreamDeckController.feed_ser for an in-process replay)
+    # speed: 1 real time, 2 / 10 faster, 0 as fast as possible
+    start = time.perf_counter()
+    records = 0
+    for offset, data in read_trace(path):
+        delay = offset / speed - (time.perf_counter() - start) if speed else 0
+        if delay > 0:
+            time.sleep(delay)
+        write(data)
+        records += 1
+    return records
+
+
+def summary(path):
+    records = 0
+    size = 0
+    duration = 0.0
+    for offset, data in read_trace(path):
+        records += 1
+        size += len(data)
+        duration = offset
+    return {"records": records, "bytes": size, "duration": round(duration, 3)}
+
+
+if __name__ == "__main__":
+    print(summary(sys.argv[1]))
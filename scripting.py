@@ -1,11 +1,19 @@
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pyautogui
 import json
 
 pyautogui.PAUSE = 0.01
+typing_interval = 0.0
+typing_chunk = 64
+typing_stats = {"chars": 0, "seconds": 0.0}
 command_list = ["press", "hold", "release", "combo", "write", "delay"]
 
 def save_scripts(scripts):
+    errors = compile_scripts(scripts)
+    if errors:
+        raise ValueError(f'scripts not valid: {errors}')
     with open('scripts.json', 'w') as file:
         json.dump(scripts, file)
 
@@ -17,6 +25,8 @@ def load_scripts():
             dictionary = json.load(file)
     except FileNotFoundError:
         print(FileNotFoundError)
+    for name, error in compile_scripts(dictionary).items():
+        print(f"script {name} error: {error}")
     return dictionary
 
 
@@ -32,33 +42,206 @@ def create_script(scripts):
     return scripts
 
 
-def send_combo_command(command):
-    command = command.split("$")
-    for key in command:
+OP_PRESS = 0
+OP_HOLD = 1
+OP_RELEASE = 2
+OP_COMBO = 3
+OP_WRITE = 4
+OP_DELAY = 5
+opcodes = {"press": OP_PRESS, "hold": OP_HOLD, "release": OP_RELEASE, "combo": OP_COMBO, "write": OP_WRITE, "delay": OP_DELAY}
+compiled_scripts = {}
+
+
+def compile_command(command):
+    name, _, arg = command.partition(" ")
+    if name not in opcodes:
+        raise ValueError(f'command "{command}" not valid. Please, select an accepted command: {command_list}')
+    if not arg:
+        raise ValueError(f'command "{command}" has no argument')
+    op = opcodes[name]
+    if op == OP_COMBO:
+        return op, tuple(arg.split("$"))
+    if op == OP_DELAY:
+        try:
+            return op, float(arg)
+        except ValueError:
+            raise ValueError(f'command "{command}" has an invalid delay')
+    return op, arg
+
+
+def compile_script(script, name=None):
+    if not isinstance(script, list):
+        raise ValueError(f'script {name} must be a list of commands')
+    # keyed on the commands themselves: a hit compares them with the cached ones, two scripts with the same hash
+    # never share their compiled code
+    try:
+        key = (name, tuple(script))
+        compiled = compiled_scripts.get(key)
+    except TypeError:
+        raise ValueError(f'script {name} must be a list of commands')
+    if compiled is None:
+        compiled = [compile_command(command) for command in script]
+        for old_key in [old_key for old_key in compiled_scripts if old_key[0] == name]:
+            del compiled_scripts[old_key]
+        compiled_scripts[key] = compiled
+    return compiled
+
+
+def compile_scripts(scripts):
+    errors = {}
+    for name, script in scripts.items():
+        try:
+            compile_script(script, name)
+        except ValueError as e:
+            errors[name] = str(e)
+    return errors
+
+
+def send_combo_command(keys):
+    for key in keys:
         pyautogui.keyDown(key)
-    for key in command:
+    for key in keys:
         pyautogui.keyUp(key)
 
 
-def transform_to_combo(command):
-    command_tmp = ""
-    for char in command[len("write "):]:
-        command_tmp += "$" + char
-    return command_tmp
-
-
-def execute_script(script):
-    for command in script:
-        if "press " in command:
-            pyautogui.press(command[len("press "):])
-        elif "hold " in command:
-            pyautogui.keyDown(command[len("hold "):])
-        elif "release " in command:
-            pyautogui.keyUp(command[len("release "):])
-        elif "combo " in command:
-            send_combo_command(command)
-        elif "write " in command:
-            command = transform_to_combo(command)
-            send_combo_command(command)
-        elif "delay " in command:
-            time.sleep(float(command[len("delay "):]))
+def type_text(text, cancel=None):
+    # one backend call per chunk instead of a keyDown/keyUp pair per character, chunks keep it cancellable
+    # typing_chunk 0: no batching, a keyDown/keyUp pair per character
+    start = time.perf_counter()
+    typed = 0
+    if typing_chunk <= 0:
+        for char in text:
+            if cancel is not None and cancel.is_set():
+                break
+            pyautogui.keyDown(char)
+            pyautogui.keyUp(char)
+            typed += 1
+        typing_stats["chars"] += typed
+        typing_stats["seconds"] += time.perf_counter() - start
+        return typed
+    for i in range(0, len(text), typing_chunk):
+        if cancel is not None and cancel.is_set():
+            break
+        chunk = text[i:i + typing_chunk]
+        pyautogui.write(chunk, interval=typing_interval)
+        typed += len(chunk)
+    typing_stats["chars"] += typed
+    typing_stats["seconds"] += time.perf_counter() - start
+    return typed
+
+
+def get_typing_stats():
+    stats = dict(typing_stats)
+    stats["chars_per_second"] = stats["chars"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def execute_script(script, cancel=None):
+    return run_compiled(compile_script(script), cancel)
+
+
+def run_compiled(compiled, cancel=None):
+    held_keys = []
+    try:
+        for op, arg in compiled:
+            if cancel is not None and cancel.is_set():
+                return False
+            if op == OP_PRESS:
+                pyautogui.press(arg)
+            elif op == OP_WRITE:
+                type_text(arg, cancel)
+            elif op == OP_COMBO:
+                send_combo_command(arg)
+            elif op == OP_DELAY:
+                if cancel is None:
+                    time.sleep(arg)
+                elif cancel.wait(arg):
+                    return False
+            elif op == OP_HOLD:
+                pyautogui.keyDown(arg)
+                held_keys.append(arg)
+            elif op == OP_RELEASE:
+                pyautogui.keyUp(arg)
+                if arg in held_keys:
+                    held_keys.remove(arg)
+        return True
+    finally:
+        # a cancelled script must not leave keys pressed
+        if cancel is not None and cancel.is_set():
+            for key in held_keys:
+                pyautogui.keyUp(key)
+
+
+class ScriptRunner:
+    repress_modes = ["restart", "ignore", "queue"]
+
+    def __init__(self, max_workers=2, notify=None, max_queued=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="script")
+        # "queue" mode: presses beyond this many waiting runs of the same pin are dropped
+        self.max_queued = max_queued
+        # called when a pin starts or stops running, the GUI shows the running scripts
+        self.notify = notify
+        self.lock = threading.Lock()
+        self.running = {}
+        self.queued = {}
+        self.closed = False
+
+    def submit(self, pin, script, mode="restart"):
+        if mode not in self.repress_modes:
+            raise ValueError(f'repress mode {mode} not valid. Please, select an accepted mode: {self.repress_modes}')
+        with self.lock:
+            if self.closed:
+                return False
+            if pin in self.running:
+                if mode == "ignore":
+                    return False
+                if mode == "restart":
+                    self.running[pin].set()
+                    self.queued[pin] = [script]
+                else:
+                    queued = self.queued.setdefault(pin, [])
+                    if len(queued) >= self.max_queued:
+                        return False
+                    queued.append(script)
+                return True
+            cancel = threading.Event()
+            self.running[pin] = cancel
+            # under the lock: shutdown() cannot close the executor between the closed check and the submit
+            self.executor.submit(self.run_script, pin, script, cancel)
+        if self.notify is not None:
+            self.notify()
+        return True
+
+    def run_script(self, pin, script, cancel):
+        try:
+            run_compiled(script, cancel)
+        except Exception as e:
+            print(f"script {pin} error: {e}")
+        with self.lock:
+            next_script = None
+            if self.queued.get(pin) and not self.closed:
+                next_script = self.queued[pin].pop(0)
+                cancel = threading.Event()
+                self.running[pin] = cancel
+                self.executor.submit(self.run_script, pin, next_script, cancel)
+            else:
+                self.queued.pop(pin, None)
+                self.running.pop(pin, None)
+        if next_script is None and self.notify is not None:
+            self.notify()
+
+    def running_pins(self):
+        with self.lock:
+            return set(self.running.keys())
+
+    def cancel_all(self):
+        with self.lock:
+            self.queued = {}
+            for cancel in self.running.values():
+                cancel.set()
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
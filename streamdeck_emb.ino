@@ -2,6 +2,18 @@
 const int DELAY = 10;                   // Milliseconds delay
 const int TOLERANCE = 5;                // Tolerance for analog inputs
 const int MAX_ANALOG_READ = 1023;       // Maximum value for analog read
+const long BAUD_RATE = 115200;          // Serial baud rate
+const String DEVICE_ID = "streamdeck_emb 1.0"; // Answer to "identify": tells a deck apart from any other CH340 adapter
+
+// Binary frame: START, type, pin, value high, value low, checksum (type ^ pin ^ high ^ low)
+const byte FRAME_START = 0xA5;
+const byte FRAME_START_RECORD = 0x01;
+const byte FRAME_STOP_RECORD = 0x02;
+const byte FRAME_START_STREAM = 0x03;
+const byte FRAME_STOP_STREAM = 0x04;
+const byte FRAME_CHANGE_SCENE = 0x05;
+const byte FRAME_SET_INPUT_VOLUME = 0x06;
+const byte FRAME_EXECUTE_SCRIPT = 0x07;
 
 // Pin Definitions
 const int RECORD_PIN = 9;               // Pin for recording
@@ -17,9 +29,12 @@ int volume[] = {0, 0, 0, 0}; // Array to store volume levels
 int recording = 0;                      // Recording state
 int streaming = 0;                      // Streaming state
 bool startReceived = false;             // Flag to track if "start" message received
+bool binaryMode = false;                // Send events as binary frames instead of text lines
 
 // Function prototypes
 int adjustVolume(int volume, char identifier, int pin);
+void sendEvent(byte type, byte pin, int value, String message);
+void handleCommand(String line);
 void dumbMode();
 void handleControls();
 
@@ -41,25 +56,17 @@ void setup() {
   }
 
   // Serial communication setup
-  Serial.begin(9600);
+  Serial.begin(BAUD_RATE);
+  // Tell the controller the board is out of reset, it waits for this instead of a fixed delay
+  Serial.println("ready");
 }
 
 void loop() {
-  // Check for start/stop commands
+  // Every command is read here and answered with "<command> ok"
   if (Serial.available()) 
   {
     String line = Serial.readStringUntil('\n');
-
-    // Handle start and stop messages
-    if (line == "start") {
-      startReceived = true;
-      Serial.println("start ok");
-    } 
-    else if (line == "stop") 
-    {
-      startReceived = false;
-      Serial.println("stop ok");
-    }
+    handleCommand(line);
   }
 
   // If start received, handle controls
@@ -68,6 +75,64 @@ void loop() {
   }
 }
 
+// Function to handle the commands sent by the controller
+void handleCommand(String line) {
+  // Handle start and stop messages
+  if (line == "start") {
+    startReceived = true;
+    binaryMode = false;
+  }
+  else if (line == "start binary") {
+    startReceived = true;
+    binaryMode = true;
+  }
+  else if (line == "stop") 
+  {
+    startReceived = false;
+  }
+  // LED state control
+  else if (line == "RecordOnLed") 
+  {
+    digitalWrite(LED_PINS[1], HIGH);
+  }
+  else if (line == "RecordOffLed") {
+    digitalWrite(LED_PINS[1], LOW);
+  }
+  else if (line == "StreamOnLed") {
+    digitalWrite(LED_PINS[0], HIGH);
+  }
+  else if (line == "StreamOffLed") {
+    digitalWrite(LED_PINS[0], LOW);
+  }
+  // Identity query used by the host device discovery
+  else if (line == "identify") {
+    Serial.println("identify ok " + DEVICE_ID);
+    return;
+  }
+  // DumbMode control
+  else if (line == "DumbMode") 
+  {
+    Serial.println("DumbMode ok");
+    dumbMode();
+    line = "NormalOperation";
+  }
+  else {
+    return;
+  }
+  Serial.println(line + " ok");
+}
+
+// Function to send an event as a binary frame or as a text line
+void sendEvent(byte type, byte pin, int value, String message) {
+  if (binaryMode) {
+    byte frame[6] = {FRAME_START, type, pin, (byte)(value >> 8), (byte)(value & 0xFF), 0};
+    frame[5] = frame[1] ^ frame[2] ^ frame[3] ^ frame[4];
+    Serial.write(frame, 6);
+  } else {
+    Serial.println(message);
+  }
+}
+
 // Function to adjust volume
 int adjustVolume(int volume, char identifier, int pin) {
   int newVolume = 1023 - analogRead(pin);
@@ -76,8 +141,7 @@ int adjustVolume(int volume, char identifier, int pin) {
   if (abs(newVolume - volume) > TOLERANCE) 
   {
     volume = newVolume;
-    String message = "SetInputVolume P" + String(identifier) + " " + String(volume);
-    Serial.println(message);
+    sendEvent(FRAME_SET_INPUT_VOLUME, identifier - '0', volume, "SetInputVolume P" + String(identifier) + " " + String(volume));
   }
   
   return volume;
@@ -101,48 +165,21 @@ void dumbMode()
 
 // Function to handle controls
 void handleControls() {
-  if (Serial.available()) 
-  {
-    String line = Serial.readStringUntil('\n');
-
-    // DumbMode control
-    if (line == "DumbMode") 
-    {
-      dumbMode();
-    }
-
-    // LED state control
-    if (line == "RecordOnLed") 
-    {
-      digitalWrite(LED_PINS[1], HIGH);
-      Serial.println("Record Led HIGH");
-    }
-    if (line == "RecordOffLed") {
-      digitalWrite(LED_PINS[1], LOW);
-    }
-    if (line == "StreamOnLed") {
-      digitalWrite(LED_PINS[0], HIGH);
-    }
-    if (line == "StreamOffLed") {
-      digitalWrite(LED_PINS[0], LOW);
-    }
-  }
-
   // Record controls
   if (digitalRead(RECORD_PIN) == HIGH && !recording) {
-    Serial.println("StartRecord");
+    sendEvent(FRAME_START_RECORD, 0, 0, "StartRecord");
     recording = 1;
   } else if (digitalRead(RECORD_PIN) == LOW && recording) {
-    Serial.println("StopRecord");
+    sendEvent(FRAME_STOP_RECORD, 0, 0, "StopRecord");
     recording = 0;
   }
 
   // Streaming controls
   else if (digitalRead(STREAM_PIN) == HIGH && !streaming) {
-    Serial.println("StartStream");
+    sendEvent(FRAME_START_STREAM, 0, 0, "StartStream");
     streaming = 1;
   } else if (digitalRead(STREAM_PIN) == LOW && streaming) {
-    Serial.println("StopStream");
+    sendEvent(FRAME_STOP_STREAM, 0, 0, "StopStream");
     streaming = 0;
   }
 
@@ -150,8 +187,7 @@ void handleControls() {
   else {
     for (int i = 0; i < 4; i++) {
       if (digitalRead(SCENE_PINS[i]) == HIGH) {
-        String message = "ChangeScene B" + String(i);
-        Serial.println(message);
+        sendEvent(FRAME_CHANGE_SCENE, i, 0, "ChangeScene B" + String(i));
         while (digitalRead(SCENE_PINS[i]) == HIGH);
         break;
       }
@@ -161,8 +197,7 @@ void handleControls() {
   // General purpose controls
   for (int i = 0; i < 4; i++) {
     if (digitalRead(GEN_PUR_PINS[i]) == HIGH) {
-      String message = "ExecuteScript G" + String(i);
-      Serial.println(message);
+      sendEvent(FRAME_EXECUTE_SCRIPT, i, 0, "ExecuteScript G" + String(i));
       while (digitalRead(GEN_PUR_PINS[i]) == HIGH);
       break;
     }
@@ -0,0 +1,145 @@
+import queue
+import threading
+import time
+import pytest
+import StreamDeckController
+from obswebsocket import requests
+
+
+def event(line, deck=None):
+    return StreamDeckController.SerialEvent(line, deck=deck)
+
+
+def priority_queue(max_wait=None, maxsize=0):
+    classes = ["scene", "volume"]
+    return StreamDeckController.EventQueue(maxsize, classes=classes, max_wait=max_wait,
+                                           classify=lambda item: 0 if item.command == "ChangeScene" else 1)
+
+
+def drain(event_queue):
+    items = []
+    while event_queue.qsize():
+        items.append(event_queue.get_nowait().line)
+    return items
+
+
+def test_higher_class_first():
+    event_queue = priority_queue()
+    for line in ["SetInputVolume P0 1", "SetInputVolume P0 2", "ChangeScene B1", "SetInputVolume P0 3", "ChangeScene B2"]:
+        event_queue.put_nowait(event(line))
+    assert drain(event_queue) == ["ChangeScene B1", "ChangeScene B2", "SetInputVolume P0 1", "SetInputVolume P0 2",
+                                  "SetInputVolume P0 3"]
+
+
+def test_overdue_class_is_promoted():
+    event_queue = priority_queue(max_wait={"volume": 0.05})
+    event_queue.put_nowait(event("SetInputVolume P0 1"))
+    time.sleep(0.06)
+    event_queue.put_nowait(event("ChangeScene B1"))
+    assert drain(event_queue) == ["SetInputVolume P0 1", "ChangeScene B1"]
+    assert event_queue.get_stats()["volume"]["promoted"] == 1
+
+
+def test_lanes_take_turns():
+    event_queue = StreamDeckController.EventQueue()
+    for i in range(3):
+        event_queue.put_nowait(event(f"ChangeScene B{i}"), None)
+    event_queue.put_nowait(event("ChangeScene desk2:B0", "desk2"), "desk2")
+    event_queue.put_nowait(event("ChangeScene desk2:B1", "desk2"), "desk2")
+    assert drain(event_queue) == ["ChangeScene B0", "ChangeScene desk2:B0", "ChangeScene B1", "ChangeScene desk2:B1",
+                                  "ChangeScene B2"]
+
+
+def test_maxsize_is_per_lane():
+    event_queue = StreamDeckController.EventQueue(maxsize=2)
+    event_queue.put_nowait(event("ChangeScene B0"))
+    event_queue.put_nowait(event("ChangeScene B1"))
+    with pytest.raises(queue.Full):
+        event_queue.put_nowait(event("ChangeScene B2"))
+    event_queue.put_nowait(event("ChangeScene desk2:B0", "desk2"), "desk2")
+    assert event_queue.qsize() == 3
+    with pytest.raises(queue.Full):
+        event_queue.put(event("ChangeScene B2"), timeout=0.01)
+
+
+def test_ack_after_a_retry():
+    ack_tracker = StreamDeckController.AckTracker()
+    written = []
+
+    def write(data):
+        # the first copy is lost, the second one is acknowledged
+        written.append(data)
+        if len(written) == 2:
+            threading.Timer(0.01, ack_tracker.resolve, args=("RecordOnLed ok",)).start()
+
+    assert ack_tracker.request(write, "RecordOnLed", 0.05, 2)
+    assert written == [b"RecordOnLed\n", b"RecordOnLed\n"]
+    stats = ack_tracker.get_stats()["RecordOnLed"]
+    assert (stats["sent"], stats["acked"], stats["retries"], stats["timeouts"]) == (2, 1, 1, 1)
+
+
+def test_no_ack_after_the_retries():
+    ack_tracker = StreamDeckController.AckTracker()
+    assert not ack_tracker.request(lambda data: None, "stop", 0.01, 2)
+    stats = ack_tracker.get_stats()["stop"]
+    assert (stats["sent"], stats["acked"], stats["retries"], stats["timeouts"]) == (3, 0, 2, 3)
+    # a late ack has nobody waiting for it
+    assert not ack_tracker.resolve("stop ok")
+
+
+def test_sender_keeps_the_order():
+    sent = []
+
+    def send(message):
+        # the slowest command first: posted in order, it must still go out first
+        time.sleep(0.05 if message == "RecordOnLed" else 0)
+        sent.append(message)
+        return True
+
+    sender = StreamDeckController.CommandSender(send, idle_timeout=0.05)
+    messages = ["RecordOnLed", "RecordOffLed", "StreamOnLed", "StreamOffLed"]
+    for message in messages:
+        sender.post(message)
+    deadline = time.monotonic() + 2
+    while sender.get_stats()["sent"] < len(messages) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sent == messages
+
+
+def test_related_requests_share_a_target():
+    targets = [StreamDeckController.request_target(request) for request in
+               [requests.StartRecord(), requests.StopRecord(), requests.GetRecordStatus(), requests.PauseRecord()]]
+    assert targets == [("output", "record")] * 4
+    targets = [StreamDeckController.request_target(request) for request in
+               [requests.StartStream(), requests.ToggleStream(), requests.GetStreamStatus()]]
+    assert targets == [("output", "stream")] * 3
+    assert StreamDeckController.request_target(requests.GetInputVolume(inputName="Mic")) == ("input", "Mic")
+
+
+def test_full_window_fails_instead_of_overflowing():
+    client = StreamDeckController.ObsClient(window=1, timeout=0.05)
+    client.connected = True
+    # an answer that never comes and has not expired yet keeps the only slot
+    client.pending["0"] = [None, None, None, time.monotonic() + 60, None]
+    future = client.enqueue(requests.GetVersion(), {"op": 6, "d": {}}, None)
+    with pytest.raises(StreamDeckController.exceptions.MessageTimeout):
+        future.result(0)
+    assert list(client.pending) == ["0"]
+
+
+def test_latency_tracker_from_two_threads():
+    tracker = StreamDeckController.LatencyTracker(window=100000)
+
+    def record(command):
+        for _ in range(5000):
+            tracker.record(command, "obs", 0.001)
+            tracker.record("shared", "obs", 0.001)
+
+    threads = [threading.Thread(target=record, args=(command,)) for command in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = tracker.get_stats()
+    assert stats["shared"]["obs"]["count"] == 10000
+    assert stats["a"]["obs"]["count"] == stats["b"]["obs"]["count"] == 5000
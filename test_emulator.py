@@ -0,0 +1,134 @@
+import os
+import time
+import pytest
+from obswebsocket import requests
+import StreamDeckController
+import AsyncStreamDeckController
+import emulator
+
+engines = {"thread": StreamDeckController.StreamDeckController,
+           "asyncio": AsyncStreamDeckController.AsyncStreamDeckController}
+needs_pty = pytest.mark.skipif(not hasattr(os, "openpty"), reason="the deck emulator needs a pty")
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def obs_server():
+    server = emulator.FakeObsServer(rtt=0.01, jitter=0.01, inputs=[f"In {i}" for i in range(4)]).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def pipeline():
+    started = []
+
+    def start(engine, decks=None):
+        server = emulator.FakeObsServer(rtt=0.001).start()
+        device = emulator.DeviceEmulator().start()
+        app = emulator.HeadlessApp(port=server.port, com_port=device.port)
+        app.settings.settings['controller']['reconnect'] = {'initial_delay': 0.1}
+        app.settings.settings['decks'] = decks or {}
+        sdc = engines[engine](app)
+        started.append((server, device, sdc))
+        device.boot(0.05)
+        assert sdc.connect()
+        return server, device, sdc
+
+    yield start
+    for server, device, sdc in started:
+        sdc.stop()
+        device.stop()
+        server.stop()
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_pipelined_requests_keep_the_order_per_target(engine, obs_server):
+    # with jitter the answers come back out of order, the requests on one input must not
+    app = emulator.HeadlessApp(port=obs_server.port)
+    app.settings.settings['controller']['obs_window'] = 16
+    sdc = engines[engine](app)
+    assert sdc.connect_obs_web_socket()
+    sdc.run = True
+    count = 80
+    try:
+        if engine == "thread":
+            for i in range(count):
+                sdc.ws.submit(requests.SetInputVolume(inputName=f"In {i % 4}", inputVolumeMul=i / count))
+        else:
+            async def submit_all():
+                for i in range(count):
+                    await sdc.obs.submit(requests.SetInputVolume(inputName=f"In {i % 4}", inputVolumeMul=i / count))
+            sdc.run_coroutine(submit_all(), 30)
+        assert wait_until(lambda: not sdc.obs_in_flight())
+        for k in range(4):
+            assert obs_server.inputs[f"In {k}"]["inputVolumeMul"] == pytest.approx((count - 4 + k) / count)
+        stats = sdc.get_obs_stats()
+        assert stats["failed"] == 0
+        assert stats["max_in_flight"] > 1
+    finally:
+        sdc.run = False
+        sdc.stop_obsws()
+
+
+@needs_pty
+@pytest.mark.parametrize("engine", engines)
+def test_obs_loss_holds_and_replays(engine, pipeline):
+    server, device, sdc = pipeline(engine)
+    server.drop_connections(down_for=0.5)
+    assert wait_until(lambda: not sdc.get_link_stats()["obs"]["up"])
+    device.send_event("ChangeScene B2")
+    device.send_event("StartRecord")
+    assert wait_until(lambda: sdc.get_link_stats()["obs"]["up"])
+    assert wait_until(lambda: server.current_scene == "Scene 2" and server.record)
+    stats = sdc.get_link_stats()
+    assert stats["obs"]["reconnects"] == 1
+    assert stats["replayed"] == 2
+
+
+@needs_pty
+@pytest.mark.parametrize("engine", engines)
+def test_serial_unplug_and_replug(engine, pipeline):
+    server, device, sdc = pipeline(engine)
+    device.unplug()
+    assert wait_until(lambda: not sdc.get_link_stats()["serial"]["up"])
+    assert sdc.run
+    device.received.clear()
+    sdc.app.settings.settings['connection']['serial_data']['com_port'] = device.replug(0.05)
+    assert wait_until(lambda: sdc.get_link_stats()["serial"]["up"])
+    assert "start binary" in device.received
+    device.send_event("ChangeScene B3")
+    assert wait_until(lambda: server.current_scene == "Scene 3")
+
+
+
+@needs_pty
+@pytest.mark.parametrize("engine", engines)
+def test_extra_deck_reconnects_on_its_own(engine, pipeline):
+    desk2 = emulator.DeviceEmulator().start()
+    try:
+        decks = {"desk2": {"com_port": desk2.port, "protocol": "text", "mapping": {"B0": "Scene 3"}}}
+        server, device, sdc = pipeline(engine, decks)
+        # the extra decks start in the background
+        assert wait_until(lambda: desk2.started)
+        desk2.send_event("ChangeScene B0")
+        assert wait_until(lambda: server.current_scene == "Scene 3")
+        desk2.unplug()
+        assert wait_until(lambda: not sdc.get_link_stats()["decks"]["desk2"]["up"])
+        assert sdc.run and sdc.get_link_stats()["serial"]["up"]
+        decks["desk2"]["com_port"] = desk2.replug(0.05)
+        assert wait_until(lambda: sdc.get_link_stats()["decks"]["desk2"]["up"])
+        assert sdc.get_link_stats()["deck:desk2"]["reconnects"] == 1
+        assert wait_until(lambda: desk2.started)
+        desk2.send_event("ChangeScene B0")
+        assert wait_until(lambda: server.current_scene == "Scene 3")
+    finally:
+        desk2.stop()
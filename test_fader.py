@@ -0,0 +1,43 @@
+import math
+import fader
+
+
+def legacy_pot_to_fader(pot_value):
+    # the pot_to_fader curve the tables replaced
+    min_pot = 94
+    max_pot = 1022
+    if pot_value <= min_pot:
+        return -100
+    if pot_value >= max_pot:
+        return 0
+    return math.log10(pot_value - min_pot + 1) / math.log10(max_pot - min_pot + 1) * 100 - 100
+
+
+def test_default_table_matches_the_log10_curve():
+    table = fader.build_table(fader.default_profile)
+    assert len(table) == fader.TABLE_SIZE
+    for pot_value in range(fader.TABLE_SIZE):
+        assert abs(fader.to_db(table, pot_value) - legacy_pot_to_fader(pot_value)) <= fader.DB_STEP / 2 + 1e-9
+
+
+def test_table_is_monotonic_and_reaches_the_ends():
+    for curve in ("log", "linear_db", "cubic"):
+        table = fader.build_table(dict(fader.default_profile, curve=curve))
+        assert table[0] == fader.MIN_DB
+        assert table[-1] == fader.MAX_DB
+        assert all(a <= b for a, b in zip(table, table[1:]))
+
+
+def test_out_of_range_values_are_clamped():
+    table = fader.get_table(fader.default_profile)
+    assert fader.to_db(table, -5) == fader.MIN_DB
+    assert fader.to_db(table, 5000) == fader.MAX_DB
+
+
+def test_invalid_profiles_are_rejected():
+    for profile in ({"curve": "exp"}, {"min": 900, "max": 100}):
+        try:
+            fader.build_table(profile)
+        except ValueError:
+            continue
+        raise AssertionError(f"{profile} accepted")
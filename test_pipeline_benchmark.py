@@ -0,0 +1,58 @@
+import os
+import time
+import contextlib
+import pytest
+
+# python -m pytest test_pipeline_benchmark.py: throughput and latency of the controller pipeline under synthetic load,
+# the same scenarios as python benchmark.py pots / pots_and_buttons
+pytest.importorskip("pytest_benchmark")
+import benchmark as bench
+import emulator
+
+scenarios = {
+    "pots": dict(pots=4, pot_rate=100, button_rate=0),
+    "pots_and_buttons": dict(pots=4, pot_rate=100, button_rate=50),
+}
+
+
+def wait_received(sdc, count, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while sdc.get_ser_stats()["received"] < count:
+        if time.perf_counter() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="the deck emulator needs a pty")
+@pytest.mark.parametrize("engine", ["thread", "asyncio"])
+@pytest.mark.parametrize("scenario", scenarios)
+def test_pipeline(benchmark, scenario, engine, duration=1.0):
+    config = scenarios[scenario]
+    traffic = emulator.merge(*[emulator.pot_sweep(pin, config["pot_rate"], duration, period=1.0 + pin * 0.1)
+                               for pin in range(config["pots"])],
+                             emulator.button_storm(config["button_rate"], duration))
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        server, device, sdc = bench.start_pipeline(0.002, engine=engine)
+        try:
+            def run():
+                # as fast as the pty takes it: the time is the one the controller needs to read, dispatch and
+                # settle everything
+                received = sdc.get_ser_stats()["received"] + len(traffic)
+                device.replay(traffic, speed=0)
+                return wait_received(sdc, received) and bench.wait_drained(sdc)
+
+            drained = benchmark.pedantic(run, rounds=3, iterations=1)
+            ser_stats = sdc.get_ser_stats()
+            latency = sdc.get_latency_stats()
+        finally:
+            bench.stop_pipeline(server, device, sdc)
+    assert drained
+    assert ser_stats["received"] == len(traffic) * 3
+    assert ser_stats["dispatched"] == ser_stats["received"]
+    assert ser_stats["overflow"] == 0
+    benchmark.extra_info["events"] = len(traffic)
+    benchmark.extra_info["events_per_s"] = round(len(traffic) / benchmark.stats.stats.mean)
+    for command, metrics in latency.items():
+        for metric, values in metrics.items():
+            benchmark.extra_info[f"{command} {metric} p50/p99 [ms]"] = f"{values['p50']} / {values['p99']}"
@@ -0,0 +1,68 @@
+import random
+import pytest
+import potfilter
+
+
+def feed(pot_filter, values, rate=50, start=0.0):
+    forwarded = []
+    for i, value in enumerate(values):
+        output = pot_filter.update(value, start + i / rate)
+        if output is not None:
+            forwarded.append(output)
+    return forwarded
+
+
+def idle_noise(samples=250, seed=0):
+    generator = random.Random(seed)
+    return [512 + generator.randint(-6, 6) for _ in range(samples)]
+
+
+def test_idle_noise_is_suppressed():
+    unfiltered = len(feed(potfilter.PotFilter({"type": "none", "band": 1}), idle_noise()))
+    smoothed = len(feed(potfilter.PotFilter({"type": "ema"}), idle_noise()))
+    pot_filter = potfilter.PotFilter({"type": "one_euro"})
+    assert len(feed(pot_filter, idle_noise())) <= 2
+    assert smoothed < unfiltered / 2
+    assert pot_filter.stats["suppressed"] >= 248
+
+
+def test_noisy_idle_pot_is_silent_once_settled():
+    # +-10 counts of ADC noise around a knob at rest: only the first settle_time may forward anything
+    generator = random.Random(1)
+    pot_filter = potfilter.PotFilter()
+    settle_time = pot_filter.config["settle_time"]
+    forwarded_at = []
+    for i in range(250):
+        now = i / 50
+        if pot_filter.update(512 + generator.randint(-10, 10), now) is not None:
+            forwarded_at.append(now)
+    assert [now for now in forwarded_at if now >= settle_time] == []
+    assert pot_filter.settled(249 / 50)
+    # a real move still goes out right away
+    assert pot_filter.update(600, 5.0) is not None
+
+
+def test_ends_stay_reachable():
+    pot_filter = potfilter.PotFilter()
+    forwarded = feed(pot_filter, [512, 300, 100, 0])
+    assert forwarded[-1] == 0
+    forwarded = feed(pot_filter, [500, 900, 1023], start=1.0)
+    assert forwarded[-1] == potfilter.POT_MAX
+
+
+def test_flush_forwards_the_last_raw_value_once_settled():
+    pot_filter = potfilter.PotFilter({"settle_time": 0.3})
+    feed(pot_filter, list(range(200, 701, 25)))
+    now = pot_filter.last_time
+    assert pot_filter.forwarded != 700
+    assert pot_filter.flush_timeout(now) == pytest.approx(0.3)
+    assert pot_filter.flush(now + 0.1) is None
+    assert pot_filter.flush(now + 0.3) == 700
+    assert pot_filter.stats["settled"] == 1
+    assert pot_filter.flush_timeout(now + 0.4) is None
+    assert pot_filter.flush(now + 1.0) is None
+
+
+def test_unknown_filter_type():
+    with pytest.raises(ValueError):
+        potfilter.PotFilter({"type": "kalman"})
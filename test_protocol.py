@@ -0,0 +1,30 @@
+import protocol
+
+
+def test_frames_round_trip():
+    for line in ["StartRecord", "StopStream", "ChangeScene B3", "ExecuteScript G1", "SetInputVolume P2 1023"]:
+        assert protocol.FrameParser().feed(protocol.encode_line(line)) == [(line.split()[0], [
+            int(token) if token.isdigit() else token for token in line.split()[1:]])]
+
+
+def test_frame_split_across_reads():
+    parser = protocol.FrameParser()
+    frame = protocol.encode_line("SetInputVolume P1 700")
+    assert parser.feed(frame[:2]) == []
+    assert parser.feed(frame[2:]) == [("SetInputVolume", ["P1", 700])]
+
+
+def test_resync_after_corrupted_frame():
+    parser = protocol.FrameParser()
+    corrupted = bytearray(protocol.encode_line("ChangeScene B1"))
+    corrupted[-1] ^= 0xFF
+    data = b"\x01\x02" + bytes(corrupted) + protocol.encode_line("ChangeScene B2") + b"start ok\r\n"
+    assert parser.feed(data) == [("ChangeScene", ["B2"]), "start ok"]
+    assert parser.stats["bad_frames"] == 1
+    assert parser.stats["frames"] == 1
+
+
+def test_text_lines_between_frames():
+    parser = protocol.FrameParser()
+    data = b"ready\r\n" + protocol.encode_line("StartRecord") + b"RecordOnLed ok\r\nChangeScene B0\r\n"
+    assert parser.feed(data) == ["ready", ("StartRecord", []), "RecordOnLed ok", "ChangeScene B0"]